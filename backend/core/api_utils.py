@@ -1,14 +1,18 @@
 import time
 import random
 import requests
+from backend.core import metrics
 
-def post_with_retries(url, json_payload, headers, max_retries=5):
+def post_with_retries(url, json_payload, headers, max_retries=5, operation="other"):
     """
     Sends a POST request with Exponential Backoff for 429 errors.
+    operation labels the attempt in the gemini_* metrics (e.g. "grading", "chat").
     """
     for attempt in range(max_retries):
+        started = time.perf_counter(); status = "error"
         try:
             response = requests.post(url, json=json_payload, headers=headers)
+            status = str(response.status_code)
             response.raise_for_status() # Raises HTTPError for 4xx/5xx
             return response
             
@@ -16,6 +20,7 @@ def post_with_retries(url, json_payload, headers, max_retries=5):
             # Only retry on 429 (Rate Limit) or 503 (Service Unavailable)
             if e.response.status_code in [429, 503]:
                 if attempt < max_retries - 1:
+                    metrics.GEMINI_RETRIES.labels(operation=operation, reason=str(e.response.status_code)).inc()
                     # Calculate wait time: 2^attempt + random jitter (to prevent Thundering Herd)
                     sleep_time = (2 ** attempt) + random.uniform(0, 1)
                     print(f"⚠️ API Rate Limit (429). Retrying in {sleep_time:.2f}s...")
@@ -28,8 +33,13 @@ def post_with_retries(url, json_payload, headers, max_retries=5):
         except requests.exceptions.ConnectionError as e:
             # Retry on simple connection drops
             if attempt < max_retries - 1:
+                metrics.GEMINI_RETRIES.labels(operation=operation, reason="connection").inc()
                 time.sleep(1)
                 continue
             raise e
 
+        finally:
+            metrics.GEMINI_REQUEST_SECONDS.labels(operation=operation).observe(time.perf_counter() - started)
+            metrics.GEMINI_RESPONSES.labels(operation=operation, status=status).inc()
+
     return None # Should not be reached due to raise inside loop
\ No newline at end of file
@@ -1,7 +1,9 @@
 import os
 import psycopg2
 from psycopg2 import pool
+import time
 from backend.core.logger import logger
+from backend.core import metrics
 
 # Use Environment Variables for secrets
 DB_CONFIG = {
@@ -23,6 +25,7 @@ except Exception as e:
 
 def get_db_connection():
     """Gets a connection from the pool."""
+    started = time.perf_counter()
     try:
         if pg_pool:
             return pg_pool.getconn()
@@ -30,8 +33,11 @@ def get_db_connection():
             # Fallback (useful if pool failed to init)
             return psycopg2.connect(**DB_CONFIG)
     except Exception as e:
+        metrics.DB_CHECKOUT_ERRORS.inc()
         logger.error(f"Error getting connection from pool: {e}")
         return None
+    finally:
+        metrics.DB_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
 
 def release_db_connection(conn):
     """Returns the connection to the pool instead of closing it."""
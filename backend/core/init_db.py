@@ -16,6 +16,16 @@ def init_database():
         print("Connected. Re-initializing tables...")
 
         # Drop tables (Order matters due to Foreign Keys)
+        cur.execute("DROP TABLE IF EXISTS plagiarism_lsh_bands CASCADE;")
+        cur.execute("DROP TABLE IF EXISTS plagiarism_fingerprints CASCADE;")
+        cur.execute("DROP TABLE IF EXISTS plagiarism_token_df CASCADE;")
+        cur.execute("DROP TABLE IF EXISTS plagiarism_student_tokens CASCADE;")
+        cur.execute("DROP TABLE IF EXISTS plagiarism_clusters CASCADE;")
+        cur.execute("DROP TABLE IF EXISTS plagiarism_reports CASCADE;")
+        cur.execute("DROP TABLE IF EXISTS grading_events CASCADE;")
+        cur.execute("DROP TABLE IF EXISTS grading_jobs CASCADE;")
+        cur.execute("DROP TABLE IF EXISTS regrade_runs CASCADE;")
+        cur.execute("DROP TABLE IF EXISTS execution_memo CASCADE;")
         cur.execute("DROP TABLE IF EXISTS submissions CASCADE;")
         cur.execute("DROP TABLE IF EXISTS assignments CASCADE;")
         cur.execute("DROP TABLE IF EXISTS seminar_members CASCADE;")
@@ -71,9 +81,22 @@ def init_database():
                 grading_type VARCHAR(20) DEFAULT 'ai',
                 static_analysis_enabled BOOLEAN DEFAULT FALSE,
                 test_cases JSONB DEFAULT '[]',
+                -- Bumped on every update; assignment caches compare it to detect stale copies
+                version INTEGER NOT NULL DEFAULT 1,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
         """)
+        # Every update or delete, by any process, announces the id to the assignment caches
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION notify_assignment_change() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('assignment_changes', OLD.id::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cur.execute("""CREATE TRIGGER assignments_notify_change AFTER UPDATE OR DELETE ON assignments
+                       FOR EACH ROW EXECUTE PROCEDURE notify_assignment_change();""")
 
         # 5. Submissions Table
         cur.execute("""
@@ -94,9 +117,158 @@ def init_database():
                 halstead_metrics JSONB,
                 code_smells JSONB,
                 cfg_visualization TEXT,
+                content_hash CHAR(64),
+                grading_config_hash CHAR(64),
+                reused_from INTEGER REFERENCES submissions(id) ON DELETE SET NULL,
+                minhash INTEGER[],
+                -- Flowcharts only: Weisfeiler-Lehman label histogram (see wl_histogram)
+                graph_signature INTEGER[],
+                -- Sum of graph_signature: bounds the structural similarity to graphs of other sizes
+                graph_size INTEGER,
+                fingerprint_count INTEGER,
+                plagiarism_matches JSONB,
+                tokens TEXT[],
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
         """)
+        cur.execute("CREATE INDEX idx_submissions_upload ON submissions (assignment_id, student_id, content_hash);")
+        cur.execute("CREATE INDEX idx_submissions_graph_size ON submissions (assignment_id, graph_size) WHERE graph_size IS NOT NULL;")
+        cur.execute("CREATE INDEX idx_submissions_unindexed ON submissions (assignment_id) WHERE (minhash IS NULL OR fingerprint_count IS NULL OR tokens IS NULL) AND generated_code IS NOT NULL;")
+
+        # 5b. Plagiarism LSH index (one row per band bucket of each submission's MinHash)
+        cur.execute("""
+            CREATE TABLE plagiarism_lsh_bands (
+                assignment_id INTEGER REFERENCES assignments(id) ON DELETE CASCADE,
+                band SMALLINT NOT NULL,
+                bucket BIGINT NOT NULL,
+                submission_id INTEGER REFERENCES submissions(id) ON DELETE CASCADE,
+                PRIMARY KEY (assignment_id, band, bucket, submission_id)
+            );
+        """)
+        cur.execute("CREATE INDEX idx_plagiarism_lsh_bands_submission ON plagiarism_lsh_bands (submission_id);")
+
+        # 5c. Winnowing fingerprints (order-aware plagiarism matches, looked up by hash)
+        cur.execute("""
+            CREATE TABLE plagiarism_fingerprints (
+                assignment_id INTEGER REFERENCES assignments(id) ON DELETE CASCADE,
+                hash BIGINT NOT NULL,
+                submission_id INTEGER REFERENCES submissions(id) ON DELETE CASCADE,
+                start_line INTEGER NOT NULL,
+                end_line INTEGER NOT NULL
+            );
+        """)
+        cur.execute("CREATE INDEX idx_plagiarism_fingerprints_hash ON plagiarism_fingerprints (assignment_id, hash);")
+        cur.execute("CREATE INDEX idx_plagiarism_fingerprints_submission ON plagiarism_fingerprints (submission_id);")
+
+        # 5d. Token document frequencies per assignment (IDF weights of the plagiarism text score)
+        cur.execute("""
+            CREATE TABLE plagiarism_token_df (
+                assignment_id INTEGER REFERENCES assignments(id) ON DELETE CASCADE,
+                token TEXT NOT NULL,
+                df INTEGER NOT NULL,
+                PRIMARY KEY (assignment_id, token)
+            );
+        """)
+        # The token set each student currently contributes to plagiarism_token_df (their latest indexed submission)
+        cur.execute("""
+            CREATE TABLE plagiarism_student_tokens (
+                assignment_id INTEGER REFERENCES assignments(id) ON DELETE CASCADE,
+                student_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                tokens TEXT[] NOT NULL DEFAULT '{}',
+                PRIMARY KEY (assignment_id, student_id)
+            );
+        """)
+
+        # 5e. Assignment-wide plagiarism reports (built by the grading workers) and their clusters
+        cur.execute("""
+            CREATE TABLE plagiarism_reports (
+                id SERIAL PRIMARY KEY,
+                assignment_id INTEGER REFERENCES assignments(id) ON DELETE CASCADE,
+                requested_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+                threshold INTEGER NOT NULL,
+                status VARCHAR(10) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+                attempts INTEGER DEFAULT 0,
+                submission_count INTEGER,
+                pair_count INTEGER,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            );
+        """)
+        cur.execute("CREATE INDEX idx_plagiarism_reports_pending ON plagiarism_reports (created_at) WHERE status IN ('queued', 'running');")
+        cur.execute("""
+            CREATE TABLE plagiarism_clusters (
+                id SERIAL PRIMARY KEY,
+                report_id INTEGER REFERENCES plagiarism_reports(id) ON DELETE CASCADE,
+                submission_ids INTEGER[] NOT NULL,
+                student_ids INTEGER[] NOT NULL,
+                max_similarity INTEGER NOT NULL,
+                -- [[submission id, submission id, similarity], ...] of the linked pairs
+                pairs JSONB NOT NULL
+            );
+        """)
+        cur.execute("CREATE INDEX idx_plagiarism_clusters_report ON plagiarism_clusters (report_id);")
+
+        # 6. Re-grade runs (one per teacher request; its jobs are in grading_jobs)
+        cur.execute("""
+            CREATE TABLE regrade_runs (
+                id SERIAL PRIMARY KEY,
+                assignment_id INTEGER REFERENCES assignments(id) ON DELETE CASCADE,
+                requested_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+                filters JSONB DEFAULT '{}',
+                total INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+
+        # 7. Grading Jobs (queue drained by backend.services.grading.worker)
+        cur.execute("""
+            CREATE TABLE grading_jobs (
+                id SERIAL PRIMARY KEY,
+                submission_id INTEGER REFERENCES submissions(id) ON DELETE SET NULL,
+                assignment_id INTEGER REFERENCES assignments(id) ON DELETE CASCADE,
+                student_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                payload JSONB DEFAULT '{}',
+                regrade_run_id INTEGER REFERENCES regrade_runs(id) ON DELETE CASCADE,
+                status VARCHAR(10) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+                attempts INTEGER DEFAULT 0,
+                worker TEXT,
+                result JSONB,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                run_after TIMESTAMP
+            );
+        """)
+        cur.execute("CREATE INDEX idx_grading_jobs_pending ON grading_jobs (created_at) WHERE status IN ('queued', 'running');")
+        cur.execute("CREATE INDEX idx_grading_jobs_regrade ON grading_jobs (regrade_run_id, status) WHERE regrade_run_id IS NOT NULL;")
+
+        # 8. Grading Events (progress of a job, streamed to the student)
+        cur.execute("""
+            CREATE TABLE grading_events (
+                id BIGSERIAL PRIMARY KEY,
+                job_id INTEGER REFERENCES grading_jobs(id) ON DELETE CASCADE,
+                event VARCHAR(30) NOT NULL,
+                data JSONB,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("CREATE INDEX idx_grading_events_job ON grading_events (job_id, id);")
+
+        # 9. Execution Memo (results keyed by hash of language, code and stdin)
+        cur.execute("""
+            CREATE TABLE execution_memo (
+                key CHAR(64) PRIMARY KEY,
+                language VARCHAR(20) NOT NULL,
+                result JSONB NOT NULL,
+                hits INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("CREATE INDEX idx_execution_memo_last_used ON execution_memo (last_used_at);")
 
         conn.commit()
         cur.close()
@@ -0,0 +1,65 @@
+"""
+Prometheus metrics, served at /metrics in the text exposition format.
+
+With several gunicorn workers (and the grading worker processes) each process
+only sees its own counters. When PROMETHEUS_MULTIPROC_DIR is set, every process
+writes its samples to files in that directory and /metrics aggregates them, so
+the numbers are the same whichever worker answers the scrape. run.sh sets the
+variable and empties the directory on start. Only counters and histograms are
+used, so files left by exited workers keep counting, as they should.
+"""
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Histogram, CollectorRegistry, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Grading stages range from milliseconds (parsing) to minutes (AI grading, test runs)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Pool checkout should be near-instant; the high buckets show pool exhaustion
+CHECKOUT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint",
+    ["endpoint", "method", "status"], buckets=STAGE_BUCKETS)
+GRADING_STAGE_SECONDS = Histogram(
+    "grading_stage_duration_seconds", "Duration of each grading pipeline stage",
+    ["stage", "status"], buckets=STAGE_BUCKETS)
+GRADING_JOBS = Counter(
+    "grading_jobs_total", "Grading jobs finished by the workers", ["status"])
+DB_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for a database connection", buckets=CHECKOUT_BUCKETS)
+DB_CHECKOUT_ERRORS = Counter(
+    "db_pool_checkout_errors_total", "Failed database connection checkouts")
+GEMINI_REQUEST_SECONDS = Histogram(
+    "gemini_request_duration_seconds", "Latency of single outbound Gemini API calls (one per attempt)",
+    ["operation"], buckets=STAGE_BUCKETS)
+GEMINI_RESPONSES = Counter(
+    "gemini_responses_total", "Outbound Gemini API attempts by HTTP status ('error' when no response arrived)",
+    ["operation", "status"])
+GEMINI_RETRIES = Counter(
+    "gemini_retries_total", "Gemini API attempts that were retried", ["operation", "reason"])
+ARTIFACT_CACHE_LOOKUPS = Counter(
+    "artifact_cache_lookups_total", "Compiled artifact cache lookups", ["result"])
+ARTIFACT_CACHE_EVICTIONS = Counter(
+    "artifact_cache_evictions_total", "Compiled artifacts evicted from the disk cache")
+
+@contextmanager
+def time_stage(stage):
+    """Records the duration of the block under `stage`, with status 'ok' or 'failed'."""
+    started = time.perf_counter(); status = "ok"
+    try: yield
+    except Exception:
+        status = "failed"; raise
+    finally: GRADING_STAGE_SECONDS.labels(stage=stage, status=status).observe(time.perf_counter() - started)
+
+def render():
+    """Returns (body, content type) for the /metrics response."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
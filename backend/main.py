@@ -1,9 +1,8 @@
 import os
-import json
+import time
 import magic 
 from psycopg2.extras import RealDictCursor
-import xml.etree.ElementTree as ET
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, g, Response
 from werkzeug.utils import secure_filename
 from flask_cors import CORS
 from flask_limiter import Limiter
@@ -11,25 +10,20 @@ from flask_limiter.util import get_remote_address
 from pydantic import ValidationError
 
 # --- IMPORTS ---
-from backend.services.parsers.flowchart import parse_drawio_xml as parse_flowchart
-from backend.services.parsers.nassi import parse_nassi_shneiderman_xml as parse_ns
-from backend.services.parsers.image import parse_image_diagram
-from backend.services.grading.ai_grader import grade_with_ai
 # Updated Import with CodeExecutionSchema
 from backend.schemas.validation import (
-    AssignmentCreateSchema, SubmissionCreateSchema, 
+    AssignmentCreateSchema, AssignmentUpdateSchema, RegradeRequestSchema, PlagiarismReportSchema, SubmissionCreateSchema, 
     UserRegisterSchema, UserLoginSchema, SeminarCreateSchema,
     CodeExecutionSchema
 )
 from backend.core.auth import hash_password, verify_password, decode_token, generate_tokens
-from backend.services.analysis.complexity import calculate_cyclomatic_complexity
-from backend.services.analysis.plagiarism import detect_plagiarism, extract_graph_signature
-from backend.services.analysis.cfg import analyze_flowchart_cfg
 from backend.core.database import get_db_connection, release_db_connection
-from backend.services.grading.static_analysis import analyze_code_style
-from backend.services.grading.keyword import grade_with_keywords
+from backend.core import metrics
 # Updated Import with execution functions
-from backend.services.execution.engine import run_test_cases, execute_python, execute_cpp, execute_java
+from backend.services.execution.engine import execute_python, execute_cpp, execute_java, memo_flags
+from backend.services.execution import memo
+from backend.services.grading import jobs, dedup, assignment_cache, regrade, events, plagiarism_report
+from backend.services.grading.pipeline import validate_code_safety
 from backend.services.chatbot import chat_with_tutor
 
 # --- CONFIGURATION ---
@@ -75,29 +69,28 @@ def validate_file_content(file_stream, expected_type):
         if mime not in valid_xml_mimes: return False, f"Invalid file content. Expected XML, got {mime}"
     return True, mime
 
-def detect_diagram_type(file_path):
-    try:
-        tree = ET.parse(file_path); root = tree.getroot()
-        return 'flowchart' if len(root.findall(".//mxCell[@edge='1']")) > 0 else 'nassi_shneiderman'
-    except: return 'flowchart'
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
 
-def validate_code_safety(code, language):
-    forbidden_patterns = {
-        'python': ['import os', 'import sys', 'import subprocess', 'from os', 'from sys', 'exec(', 'eval(', 'open(', '__import__', 'os.system'],
-        'cpp': ['system(', 'popen(', 'fork(', 'execv', 'execl', '<cstdlib>'],
-        'java': ['Runtime.getRuntime', 'ProcessBuilder', 'System.exit']
-    }
-    patterns = forbidden_patterns.get(language, [])
-    for pattern in patterns:
-        if pattern in code:
-            return False, pattern
-    return True, None
+@app.after_request
+def record_request_metrics(response):
+    # request.endpoint (the view name) keeps the label set small, unlike raw paths
+    if 'request_started' in g:
+        metrics.HTTP_REQUEST_SECONDS.labels(endpoint=request.endpoint or "unmatched", method=request.method, status=response.status_code).observe(time.perf_counter() - g.request_started)
+    return response
 
 # --- ROUTES ---
 
 @app.route("/api/status")
 def hello(): return "Backend server (Header Auth + Sandbox + Chatbot) is running!"
 
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 @app.route('/auth/register', methods=['POST'])
 @limiter.limit("5 per minute")
 def register():
@@ -201,7 +194,7 @@ def execute_code():
     # 2. Select Executor
     executor = {
         'python': execute_python,
-        'cpp': execute_cpp,
+        'cpp': lambda code, input_str: execute_cpp(code, input_str, opt_level=data.opt_level),
         'java': execute_java
     }.get(data.language)
 
@@ -210,7 +203,7 @@ def execute_code():
 
     # 3. Run Code
     try:
-        result = executor(data.code, data.input_str)
+        result = memo.memoized_run(data.language, data.code, data.input_str, executor, memo_flags(data.language, data.opt_level))
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"success": False, "error": f"Server Error: {str(e)}"}), 500
@@ -327,6 +320,29 @@ def create_assignment():
     except Exception as e: conn.rollback(); return jsonify({"error": str(e)}), 500
     finally: cur.close(); release_db_connection(conn)
 
+@app.route('/assignment/<int:assignment_id>', methods=['PUT'])
+def update_assignment(assignment_id):
+    user = get_current_user()
+    if not user: return jsonify({"error": "Unauthorized"}), 401
+    try: data = AssignmentUpdateSchema(**(request.json or {}))
+    except ValidationError as e: return jsonify({"error": "Validation", "details": e.errors()}), 400
+    changes = data.dict(exclude_none=True)
+    if not changes: return jsonify({"error": "Nothing to update"}), 400
+    conn = get_db_connection(); cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("SELECT creator_id FROM assignments WHERE id = %s", (assignment_id,))
+        assignment = cur.fetchone()
+        if not assignment: return jsonify({"error": "Not found"}), 404
+        if user['role'] != 'admin' and assignment['creator_id'] != user['user_id']: return jsonify({"error": "Permission denied"}), 403
+        # Column names come from the schema fields, never from the request
+        set_clause = ", ".join(f"{column} = %s" for column in changes)
+        cur.execute(f"UPDATE assignments SET {set_clause}, version = version + 1 WHERE id = %s RETURNING *", (*changes.values(), assignment_id))
+        updated = cur.fetchone()
+        conn.commit(); assignment_cache.invalidate(assignment_id)
+        return jsonify(updated), 200
+    except Exception as e: conn.rollback(); return jsonify({"error": str(e)}), 500
+    finally: cur.close(); release_db_connection(conn)
+
 @app.route('/assignment/<int:assignment_id>', methods=['DELETE'])
 def delete_assignment(assignment_id):
     user = get_current_user()
@@ -340,7 +356,7 @@ def delete_assignment(assignment_id):
         cur.execute("SELECT file_path FROM submissions WHERE assignment_id = %s", (assignment_id,))
         submissions = cur.fetchall()
         cur.execute("DELETE FROM assignments WHERE id = %s", (assignment_id,))
-        conn.commit()
+        conn.commit(); assignment_cache.invalidate(assignment_id)
         if os.path.exists(assignment['template_path']): os.remove(assignment['template_path'])
         for sub in submissions:
             if os.path.exists(sub['file_path']): os.remove(sub['file_path'])
@@ -382,6 +398,11 @@ def get_my_submissions(assignment_id):
         return jsonify(cur.fetchall())
     finally: cur.close(); release_db_connection(conn)
 
+def _save_submission_file(diagram_file, assignment_id, submission_id, filename):
+    path = os.path.join(SUBMISSION_FOLDER, f"sub_{assignment_id}_{submission_id}_{filename}")
+    diagram_file.save(path)
+    return path
+
 @app.route('/submit/<int:assignment_id>', methods=['POST'])
 @limiter.limit("5 per minute")
 def submit_for_grading(assignment_id):
@@ -393,8 +414,7 @@ def submit_for_grading(assignment_id):
     except ValidationError as e: return jsonify({"error": "Validation", "details": e.errors()}), 400
     conn = get_db_connection(); cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        cur.execute("SELECT * FROM assignments WHERE id = %s", (assignment_id,))
-        assignment = cur.fetchone()
+        assignment = assignment_cache.get_assignment(cur, assignment_id)
         if not assignment: return jsonify({"error": "Not found"}), 404
         cur.execute("SELECT 1 FROM seminar_members WHERE user_id = %s AND seminar_id = %s", (user['user_id'], assignment['seminar_id']))
         if not cur.fetchone(): return jsonify({"error": "Not a member of this seminar"}), 403
@@ -406,90 +426,155 @@ def submit_for_grading(assignment_id):
         expected_type = 'image' if is_image_ext else 'xml'
         is_valid, mime_msg = validate_file_content(diagram_file.stream, expected_type)
         if not is_valid: return jsonify({"error": mime_msg}), 400
-        
-        cur.execute("INSERT INTO submissions (assignment_id, student_id, file_path, original_filename, submission_mode) VALUES (%s, %s, %s, %s, %s) RETURNING id;", (assignment_id, user['user_id'], "placeholder", filename, validated_data.submission_mode))
+
+        options = {"is_image": is_image_ext, "diagram_type": validated_data.diagram_type, "description": validated_data.description}
+        upload_hash = dedup.content_hash(diagram_file.stream.read()); diagram_file.stream.seek(0)
+        config_hash = dedup.grading_config_hash(assignment, options)
+
+        # Same bytes under the same grading configuration: reuse the earlier result, or the job still grading it
+        previous = dedup.find_previous(cur, assignment_id, user['user_id'], upload_hash, config_hash)
+        if previous and previous['status'] != 'done':
+            return jsonify({"job_id": previous['job_id'], "submission_id": previous['submission_id'], "status": previous['status'], "reused": True, "status_url": f"/grading-jobs/{previous['job_id']}", "events_url": f"/grading-jobs/{previous['job_id']}/events"}), 202
+        if previous:
+            submission_id = dedup.copy_submission(cur, previous['submission_id'])
+            # Its own copy of the (identical) upload: deleting either submission must not break the other
+            submission_path = _save_submission_file(diagram_file, assignment_id, submission_id, filename)
+            cur.execute("UPDATE submissions SET file_path=%s, original_filename=%s WHERE id=%s", (submission_path, filename, submission_id))
+            result = {**previous['result'], "submission_id": submission_id, "reused": True, "reused_from": previous['submission_id']}
+            job_id = jobs.record_done(cur, submission_id, assignment_id, user['user_id'], options, result)
+            conn.commit()
+            return jsonify({"job_id": job_id, "submission_id": submission_id, "status": "done", "reused": True, "result": result, "status_url": f"/grading-jobs/{job_id}"}), 200
+
+        cur.execute("INSERT INTO submissions (assignment_id, student_id, file_path, original_filename, submission_mode, content_hash, grading_config_hash) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id;", (assignment_id, user['user_id'], "placeholder", filename, validated_data.submission_mode, upload_hash, config_hash))
         submission_id = cur.fetchone()['id']
-        submission_filename = f"sub_{assignment_id}_{submission_id}_{filename}"
-        submission_path = os.path.join(SUBMISSION_FOLDER, submission_filename)
-        diagram_file.save(submission_path)
-
-        target_language = assignment['language']
-        generated_code = ""; used_method = ""; complexity_score = 1
-        dead_code_report = []; uninit_vars_report = []; graph_signature = None
-
-        # --- MODIFIED LOGIC: TRUST FILE EXTENSION OVER USER INPUT ---
-        if is_image_ext:
-            used_method = "ai_vision"
-            generated_code = parse_image_diagram(submission_path, validated_data.description, language=target_language)
-            complexity_score = calculate_cyclomatic_complexity(generated_code, language=target_language)
-        else:
-            used_method = validated_data.diagram_type 
-            if used_method == 'auto': used_method = detect_diagram_type(submission_path)
-            if used_method == 'flowchart':
-                generated_code, nodes, edges, start_id = parse_flowchart(submission_path, language=target_language, return_graph=True)
-                cfg_stats = analyze_flowchart_cfg(nodes, edges, start_id)
-                complexity_score = cfg_stats['cyclomatic_complexity']; dead_code_report = cfg_stats['dead_code_nodes']; uninit_vars_report = cfg_stats['uninitialized_vars']
-                graph_signature = extract_graph_signature(nodes, edges)
-            else:
-                generated_code = parse_ns(submission_path, language=target_language)
-                complexity_score = calculate_cyclomatic_complexity(generated_code, language=target_language)
-
-        # --- SECURITY CHECK ---
-        is_safe, unsafe_keyword = validate_code_safety(generated_code, target_language)
-        if not is_safe:
-            conn.rollback()
-            return jsonify({"error": f"Security Violation: Your diagram produces code with forbidden keyword '{unsafe_keyword}'."}), 400
-
-        static_report = None
-        if assignment.get('static_analysis_enabled'): static_report = analyze_code_style(generated_code, language=target_language)
-        
-        plagiarism_score = 0
-        if assignment['plagiarism_check_enabled']:
-            cur.execute("SELECT generated_code FROM submissions WHERE assignment_id=%s AND student_id!=%s", (assignment_id, user['user_id']))
-            previous_subs = cur.fetchall()
-            plag_subs = [{'id': 0, 'generated_code': r['generated_code'], 'graph_signature': None} for r in previous_subs]
-            plagiarism_score, _ = detect_plagiarism(generated_code, graph_signature, plag_subs)
-
-        test_results = None
-        if generated_code and target_language == 'python':
-             test_cases_data = assignment.get('test_cases')
-             if test_cases_data:
-                 if isinstance(test_cases_data, str):
-                     try: test_cases_data = json.loads(test_cases_data)
-                     except: pass
-                 if isinstance(test_cases_data, list) and len(test_cases_data) > 0:
-                     test_results = run_test_cases(generated_code, test_cases_data, language=target_language)
-
-        grade_result = {}
-        if assignment.get('grading_type') == 'keyword':
-            keywords = assignment.get('grading_prompt', '')
-            grade_result = grade_with_keywords(generated_code, keywords)
-        else:
-            with open(assignment['template_path'], 'r') as f: template_code = f.read()
-            grade_result = grade_with_ai(generated_code, template_code, assignment['description'], assignment.get('grading_prompt', ''))
-
-        if uninit_vars_report or dead_code_report:
-            grade_result['feedback'] += "\n\n[Automated Analysis Warnings]:"
-            if dead_code_report: grade_result['feedback'] += f"\n- Dead code detected in {len(dead_code_report)} blocks."
-            if uninit_vars_report: grade_result['feedback'] += "\n- " + "\n- ".join(uninit_vars_report[:3])
-        
-        if test_results:
-            grade_result['feedback'] += f"\n\n[Execution Test Results]: Passed {test_results['passed']}/{test_results['total']} tests."
+        submission_path = _save_submission_file(diagram_file, assignment_id, submission_id, filename)
 
-        cur.execute("""UPDATE submissions SET file_path=%s, generated_code=%s, grading_result=%s, diagram_type=%s, complexity=%s, plagiarism_score=%s, static_analysis_report=%s, test_results=%s WHERE id=%s""", 
-                   (submission_path, generated_code, json.dumps(grade_result), used_method, complexity_score, plagiarism_score, json.dumps(static_report), json.dumps(test_results) if test_results else None, submission_id))
+        cur.execute("UPDATE submissions SET file_path=%s WHERE id=%s", (submission_path, submission_id))
+
+        # Parsing, tests and AI grading run in the grading workers; answer right away
+        job_id = jobs.enqueue(cur, submission_id, assignment_id, user['user_id'], options)
         conn.commit()
-        
+        return jsonify({"job_id": job_id, "submission_id": submission_id, "status": "queued", "reused": False, "status_url": f"/grading-jobs/{job_id}", "events_url": f"/grading-jobs/{job_id}/events"}), 202
+    except Exception as e: conn.rollback(); return jsonify({"error": str(e)}), 500
+    finally: cur.close(); release_db_connection(conn)
+
+@app.route('/grading-jobs/<int:job_id>', methods=['GET'])
+def get_grading_job(job_id):
+    user = get_current_user()
+    if not user: return jsonify({"error": "Unauthorized"}), 401
+    conn = get_db_connection(); cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        job = jobs.get_job(cur, job_id)
+        if not job: return jsonify({"error": "Not found"}), 404
+        if user['role'] != 'admin' and user['user_id'] not in (job['student_id'], job['assignment_creator_id']): return jsonify({"error": "Permission denied"}), 403
         return jsonify({
-            "generated_code": generated_code, "grading_result": grade_result, 
-            "language": target_language, "complexity": complexity_score, 
-            "plagiarism_score": plagiarism_score, "dead_code": dead_code_report, 
-            "static_analysis": static_report,
-            "test_results": test_results
+            "job_id": job['id'], "submission_id": job['submission_id'], "status": job['status'],
+            "error": job['error'], "result": job['result'] if job['status'] == 'done' else None,
+            "created_at": job['created_at'], "started_at": job['started_at'], "finished_at": job['finished_at']
         }), 200
+    finally: cur.close(); release_db_connection(conn)
+
+@app.route('/grading-jobs/<int:job_id>/events', methods=['GET'])
+@limiter.exempt
+def stream_grading_job(job_id):
+    user = get_current_user()
+    if not user: return jsonify({"error": "Unauthorized"}), 401
+    conn = get_db_connection(); cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        job = jobs.get_job(cur, job_id)
+        if not job: return jsonify({"error": "Not found"}), 404
+        if user['role'] != 'admin' and user['user_id'] not in (job['student_id'], job['assignment_creator_id']): return jsonify({"error": "Permission denied"}), 403
+    finally: cur.close(); release_db_connection(conn)
+    # The stream holds no database connection; it is closed after a while and the client resumes from Last-Event-ID
+    try: after_id = int(request.headers.get('Last-Event-ID') or request.args.get('after') or 0)
+    except ValueError: after_id = 0
+    body = events.open_stream(job_id, after_id)
+    if body is None:
+        # Every stream slot of this process is taken: the client polls the job instead
+        return jsonify({"error": "Too many open event streams", "status_url": f"/grading-jobs/{job_id}"}), 503, {"Retry-After": "5"}
+    return Response(body, mimetype='text/event-stream', headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/assignment/<int:assignment_id>/regrade', methods=['POST'])
+@limiter.limit("5 per minute")
+def start_regrade(assignment_id):
+    user = get_current_user()
+    if not user: return jsonify({"error": "Unauthorized"}), 401
+    try: filters = RegradeRequestSchema(**(request.get_json(silent=True) or {}))
+    except ValidationError as e: return jsonify({"error": "Validation", "details": e.errors()}), 400
+    conn = get_db_connection(); cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("SELECT creator_id FROM assignments WHERE id = %s", (assignment_id,))
+        assignment = cur.fetchone()
+        if not assignment: return jsonify({"error": "Not found"}), 404
+        if user['role'] != 'admin' and assignment['creator_id'] != user['user_id']: return jsonify({"error": "Permission denied"}), 403
+        run = regrade.start_run(cur, assignment_id, user['user_id'], filters.dict(exclude_none=True))
+        conn.commit()
+        return jsonify({"run_id": run['id'], "total": run['total'], "status_url": f"/regrade-runs/{run['id']}"}), 202
+    except Exception as e: conn.rollback(); return jsonify({"error": str(e)}), 500
+    finally: cur.close(); release_db_connection(conn)
+
+@app.route('/regrade-runs/<int:run_id>', methods=['GET'])
+def get_regrade_run(run_id):
+    user = get_current_user()
+    if not user: return jsonify({"error": "Unauthorized"}), 401
+    conn = get_db_connection(); cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        run = regrade.get_run(cur, run_id)
+        if not run: return jsonify({"error": "Not found"}), 404
+        if user['role'] != 'admin' and run['assignment_creator_id'] != user['user_id']: return jsonify({"error": "Permission denied"}), 403
+        return jsonify({"run_id": run['id'], "assignment_id": run['assignment_id'], "filters": run['filters'], "created_at": run['created_at'], **regrade.progress(cur, run)}), 200
+    finally: cur.close(); release_db_connection(conn)
+
+@app.route('/regrade-runs/<int:run_id>/resume', methods=['POST'])
+def resume_regrade_run(run_id):
+    user = get_current_user()
+    if not user: return jsonify({"error": "Unauthorized"}), 401
+    conn = get_db_connection(); cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        run = regrade.get_run(cur, run_id)
+        if not run: return jsonify({"error": "Not found"}), 404
+        if user['role'] != 'admin' and run['assignment_creator_id'] != user['user_id']: return jsonify({"error": "Permission denied"}), 403
+        requeued = regrade.resume(cur, run_id)
+        conn.commit()
+        return jsonify({"run_id": run_id, "requeued": requeued, **regrade.progress(cur, run)}), 200
     except Exception as e: conn.rollback(); return jsonify({"error": str(e)}), 500
     finally: cur.close(); release_db_connection(conn)
 
+@app.route('/assignment/<int:assignment_id>/plagiarism-report', methods=['POST'])
+@limiter.limit("5 per minute")
+def request_plagiarism_report(assignment_id):
+    user = get_current_user()
+    if not user: return jsonify({"error": "Unauthorized"}), 401
+    try: options = PlagiarismReportSchema(**(request.get_json(silent=True) or {}))
+    except ValidationError as e: return jsonify({"error": "Validation", "details": e.errors()}), 400
+    conn = get_db_connection(); cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        cur.execute("SELECT creator_id FROM assignments WHERE id = %s", (assignment_id,))
+        assignment = cur.fetchone()
+        if not assignment: return jsonify({"error": "Not found"}), 404
+        if user['role'] != 'admin' and assignment['creator_id'] != user['user_id']: return jsonify({"error": "Permission denied"}), 403
+        report = plagiarism_report.create(cur, assignment_id, user['user_id'], options.threshold)
+        conn.commit()
+        return jsonify({"report_id": report['id'], "status": report['status'], "status_url": f"/plagiarism-reports/{report['id']}"}), 202
+    except Exception as e: conn.rollback(); return jsonify({"error": str(e)}), 500
+    finally: cur.close(); release_db_connection(conn)
+
+@app.route('/plagiarism-reports/<int:report_id>', methods=['GET'])
+def get_plagiarism_report(report_id):
+    user = get_current_user()
+    if not user: return jsonify({"error": "Unauthorized"}), 401
+    conn = get_db_connection(); cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        report = plagiarism_report.get_report(cur, report_id)
+        if not report: return jsonify({"error": "Not found"}), 404
+        if user['role'] != 'admin' and report['assignment_creator_id'] != user['user_id']: return jsonify({"error": "Permission denied"}), 403
+        clusters = plagiarism_report.get_clusters(cur, report_id) if report['status'] == 'done' else []
+        return jsonify({"report_id": report['id'], "assignment_id": report['assignment_id'], "threshold": report['threshold'],
+                        "status": report['status'], "error": report['error'], "submission_count": report['submission_count'],
+                        "pair_count": report['pair_count'], "created_at": report['created_at'], "finished_at": report['finished_at'],
+                        "clusters": clusters}), 200
+    finally: cur.close(); release_db_connection(conn)
+
 @app.route('/seminar/<int:sid>/analytics', methods=['GET'])
 def analytics(sid):
     user = get_current_user(); 
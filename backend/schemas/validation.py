@@ -1,11 +1,13 @@
 from pydantic import BaseModel, Field, validator, EmailStr
-from typing import Optional
+from typing import Optional, List
 
 ALLOWED_LANGUAGES = ['python', 'cpp', 'java']
 ALLOWED_SUBMISSION_MODES = ['xml', 'image', 'auto']
 ALLOWED_DIAGRAM_TYPES = ['flowchart', 'nassi_shneiderman', 'auto']
 ALLOWED_ROLES = ['student', 'teacher', 'admin']
 ALLOWED_GRADING_TYPES = ['ai', 'keyword']
+# C++ optimization profiles (cpp_toolchain.OPT_LEVELS)
+ALLOWED_OPT_LEVELS = ['fast-compile', 'balanced', 'fast-run']
 
 # --- AUTH ---
 class UserRegisterSchema(BaseModel):
@@ -61,6 +63,15 @@ class AssignmentUpdateSchema(BaseModel):
     plagiarism_check_enabled: Optional[bool] = Field(None)
     static_analysis_enabled: Optional[bool] = Field(None)
 
+class RegradeRequestSchema(BaseModel):
+    submission_ids: Optional[List[int]] = Field(None, description="Only these submissions")
+    student_ids: Optional[List[int]] = Field(None, description="Only these students' submissions")
+    latest_only: bool = Field(False, description="Only each student's latest submission")
+    max_score: Optional[int] = Field(None, ge=0, le=100, description="Only submissions scored at or below this")
+
+class PlagiarismReportSchema(BaseModel):
+    threshold: int = Field(70, ge=1, le=100, description="Link students whose code is at least this similar (0..100)")
+
 # --- SUBMISSION ---
 class SubmissionCreateSchema(BaseModel):
     submission_mode: str = Field("auto")
@@ -80,9 +91,16 @@ class CodeExecutionSchema(BaseModel):
     code: str = Field(..., min_length=1, description="Source code to run")
     language: str = Field(..., description="Target language")
     input_str: Optional[str] = Field("", description="Stdin input for the program")
+    opt_level: Optional[str] = Field(None, description="C++ optimization profile (server default if omitted)")
 
     @validator('language')
     def validate_language(cls, v):
         if v.lower() not in ALLOWED_LANGUAGES: 
             raise ValueError(f"Language must be one of {ALLOWED_LANGUAGES}")
-        return v.lower()
\ No newline at end of file
+        return v.lower()
+
+    @validator('opt_level')
+    def validate_opt_level(cls, v):
+        if v is not None and v not in ALLOWED_OPT_LEVELS:
+            raise ValueError(f"opt_level must be one of {ALLOWED_OPT_LEVELS}")
+        return v
\ No newline at end of file
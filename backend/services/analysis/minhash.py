@@ -0,0 +1,51 @@
+"""
+MinHash signatures and LSH bands over the token sets used by the plagiarism check.
+
+Two token sets agree on any one signature position with probability equal to
+their Jaccard similarity, so the signature is a compact stand-in for the set.
+The signature is cut into BANDS bands of ROWS positions; submissions sharing a
+band bucket are candidates. With 32 x 4 a pair at Jaccard 0.5 becomes a
+candidate with probability ~0.87, at 0.7 ~1.0, and at 0.2 only ~0.05.
+"""
+import hashlib
+import numpy as np
+from backend.services.analysis.plagiarism import normalize_code
+
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 31) - 1  # keeps a * x + b below 2**63
+
+# Fixed seed: signatures are stored, so the permutations must never change
+_rng = np.random.RandomState(20240611)
+_A = _rng.randint(1, _PRIME, size=(NUM_PERM, 1)).astype(np.uint64)
+_B = _rng.randint(0, _PRIME, size=(NUM_PERM, 1)).astype(np.uint64)
+
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=4).digest(), 'little') % _PRIME
+
+def signature(code_text):
+    """MinHash signature (list of NUM_PERM ints) of the code's token set, or None if it has no tokens."""
+    tokens = normalize_code(code_text)
+    if not tokens: return None
+    x = np.fromiter((_token_hash(t) for t in tokens), dtype=np.uint64, count=len(tokens))
+    return ((_A * x + _B) % _PRIME).min(axis=1).tolist()
+
+def band_buckets(sig):
+    """One bucket id (signed 64-bit, to fit a BIGINT column) per band."""
+    buckets = []
+    for band in range(BANDS):
+        rows = ",".join(map(str, sig[band * ROWS:(band + 1) * ROWS]))
+        buckets.append(int.from_bytes(hashlib.blake2b(rows.encode(), digest_size=8).digest(), 'little', signed=True))
+    return buckets
+
+def estimate_similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity (0..1) of the two token sets."""
+    if not sig_a or not sig_b: return 0.0
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / NUM_PERM
+
+def estimate_similarity_batch(sig, sigs):
+    """estimate_similarity of sig against every row of an (N, NUM_PERM) array, as a float array."""
+    sigs = np.asarray(sigs).reshape(-1, NUM_PERM)
+    if not sig: return np.zeros(len(sigs))
+    return (sigs == np.asarray(sig)).mean(axis=1)
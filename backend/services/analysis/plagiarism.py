@@ -1,4 +1,11 @@
 import re
+import math
+import hashlib
+import numpy as np
+
+# Weisfeiler-Lehman refinement rounds and histogram size of stored flowchart signatures
+WL_ITERATIONS = 2
+WL_BINS = 64
 
 def normalize_code(code_text):
     """
@@ -27,6 +34,22 @@ def calculate_jaccard_similarity(code_a, code_b):
     
     return int((len(intersection) / len(union)) * 100)
 
+def idf_weight(df, documents):
+    """Smoothed inverse document frequency: a token found in every document weighs 1, an unseen one the most."""
+    return math.log((1 + documents) / (1 + df)) + 1
+
+def weighted_jaccard_similarity(tokens_a, tokens_b, weights, exclude=frozenset()):
+    """
+    Jaccard Index with every token counted by its weight (e.g. idf_weight, default 1),
+    ignoring the tokens in exclude (e.g. the reference template). Returns 0..100.
+    """
+    tokens_a = set(tokens_a) - exclude
+    tokens_b = set(tokens_b) - exclude
+    if not tokens_a or not tokens_b: return 0
+    union = sum(weights.get(t, 1.0) for t in tokens_a | tokens_b)
+    if union <= 0: return 0
+    return int(sum(weights.get(t, 1.0) for t in tokens_a & tokens_b) / union * 100)
+
 def extract_graph_signature(nodes, edges):
     """
     Creates a structural fingerprint of the flowchart.
@@ -56,6 +79,54 @@ def extract_graph_signature(nodes, edges):
         "degrees": tuple(degrees)
     }
 
+def node_kind(node):
+    """'start', 'end', 'decision' or 'process' for a flowchart node ({'value', 'style'}); the label text is ignored otherwise."""
+    value = node.get('value', '').strip().lower()
+    if value in ('start', 'end'): return value
+    if 'rhombus' in node.get('style', ''): return 'decision'
+    return 'process'
+
+def _label_bin(label):
+    return int.from_bytes(hashlib.blake2b(label.encode('utf-8'), digest_size=4).digest(), 'little') % WL_BINS
+
+def wl_histogram(nodes, edges):
+    """
+    Weisfeiler-Lehman subtree histogram of a flowchart (nodes/edges as returned by
+    parse_drawio_xml(return_graph=True)): a list of WL_BINS counts. Every node starts with its
+    kind; each of WL_ITERATIONS rounds relabels it with its label and the sorted labels of its
+    successors and predecessors. All labels of all rounds are hashed into the bins.
+    """
+    if not nodes: return None
+    successors = {n: [] for n in nodes}; predecessors = {n: [] for n in nodes}
+    for source, targets in edges.items():
+        for edge in targets:
+            target = edge['target'] if isinstance(edge, dict) else edge
+            if source in nodes and target in nodes:
+                successors[source].append(target); predecessors[target].append(source)
+    labels = {n: node_kind(data) for n, data in nodes.items()}
+    histogram = [0] * WL_BINS
+    for iteration in range(WL_ITERATIONS + 1):
+        if iteration:
+            labels = {n: f"{labels[n]}({','.join(sorted(labels[s] for s in successors[n]))}|{','.join(sorted(labels[p] for p in predecessors[n]))})"
+                      for n in nodes}
+        for label in labels.values(): histogram[_label_bin(f"{iteration}:{label}")] += 1
+    return histogram
+
+def wl_similarity_batch(hist, hists):
+    """
+    Min-max kernel (sum of minima over sum of maxima, 0..100) of one WL histogram against
+    every row of hists (an (N, WL_BINS) array) at once. Returns an int array.
+    """
+    hist = np.asarray(hist, dtype=np.float64); hists = np.asarray(hists, dtype=np.float64).reshape(-1, WL_BINS)
+    high = np.maximum(hists, hist).sum(axis=1)
+    low = np.minimum(hists, hist).sum(axis=1)
+    return (np.divide(low, high, out=np.zeros_like(low), where=high > 0) * 100).astype(int)
+
+def wl_similarity(hist_a, hist_b):
+    """Structural similarity (0..100) of two WL histograms."""
+    if not hist_a or not hist_b: return 0
+    return int(wl_similarity_batch(hist_a, [hist_b])[0])
+
 def calculate_structural_similarity(sig_a, sig_b):
     """
     Compares graph signatures. 
@@ -112,4 +183,40 @@ def detect_plagiarism(new_code, new_graph_sig, previous_submissions):
             highest_score = final_score
             match_id = sub.get('id')
             
-    return highest_score, match_id
\ No newline at end of file
+    return highest_score, match_id
+
+def detect_plagiarism_batch(new_code, new_graph_sig, candidates, structural=None):
+    """
+    detect_plagiarism with WL histograms (wl_histogram) as graph signatures and the structural half vectorized.
+    candidates: [{'id', 'generated_code', 'graph_signature' (WL histogram or None)}]; text is scored exactly,
+    or taken from a precomputed 'text_score' (e.g. fingerprint similarity) when the candidate has one.
+    structural: optional {'ids', 'text_scores', 'graph_signatures'} arrays for the other prior
+    submissions that have a graph signature but are not candidates, with their text scores
+    (e.g. plagiarism_index.structural_rows' weighted token similarity).
+    Returns (highest score, id of that submission).
+    """
+    highest_score = 0
+    match_id = None
+    ids = []; text = []; graphs = []
+    for sub in candidates:
+        t_score = sub['text_score'] if 'text_score' in sub else calculate_jaccard_similarity(new_code, sub.get('generated_code', ''))
+        if new_graph_sig and sub.get('graph_signature') and len(sub['graph_signature']) == WL_BINS:
+            ids.append(sub['id']); text.append(t_score); graphs.append(sub['graph_signature'])
+        elif t_score > highest_score:
+            highest_score = t_score
+            match_id = sub.get('id')
+
+    if new_graph_sig and structural is not None and len(structural['ids']):
+        ids = np.concatenate([np.asarray(structural['ids']), np.asarray(ids, dtype=np.int64)])
+        text = np.concatenate([np.asarray(structural['text_scores'], dtype=np.float64), np.asarray(text, dtype=np.float64)])
+        graphs = np.concatenate([np.asarray(structural['graph_signatures']).reshape(-1, WL_BINS),
+                                 np.asarray(graphs).reshape(-1, WL_BINS)])
+    if len(ids):
+        # Hybrid Weighting for every submission with a structure, in one pass
+        hybrid = ((np.asarray(text, dtype=np.float64) * 0.6) + (wl_similarity_batch(new_graph_sig, graphs) * 0.4)).astype(int)
+        best = int(np.argmax(hybrid))
+        if hybrid[best] > highest_score:
+            highest_score = int(hybrid[best])
+            match_id = int(ids[best])
+
+    return highest_score, match_id
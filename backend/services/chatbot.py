@@ -62,7 +62,7 @@ def chat_with_tutor(user_message, history=[]):
     }
 
     try:
-        response = post_with_retries(API_URL, payload, headers={"Content-Type": "application/json"})
+        response = post_with_retries(API_URL, payload, headers={"Content-Type": "application/json"}, operation="chat")
         ai_text = response.json()['candidates'][0]['content']['parts'][0]['text']
         return {"response": ai_text}
         
@@ -0,0 +1,183 @@
+"""
+Content-addressed disk cache for compiled artifacts (C++ binaries, Java class dirs).
+
+Entries live in <root>/<sha256(language, flags, source)>/ and are shared by every
+worker process on the host. Directory mtime doubles as the LRU clock: a hit touches
+the entry, and eviction removes the least recently used entries once the cache
+grows past its size cap.
+
+Cached binaries are executed as they are, so the root must be private: it is
+created with mode 0700 and refused (the cache is then skipped) when it belongs
+to another user or is writable by group/others. An entry in use holds a shared
+flock on its directory; eviction only removes entries it can lock exclusively.
+"""
+import os
+import time
+import uuid
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import threading
+from backend.core import metrics
+from backend.core.logger import logger
+from backend.services.execution.sandbox import private_dir
+
+CACHE_ROOT = os.environ.get("ARTIFACT_CACHE_DIR", os.path.join(tempfile.gettempdir(), f"structogram_artifacts-{os.geteuid()}"))
+MAX_CACHE_BYTES = int(float(os.environ.get("ARTIFACT_CACHE_MAX_MB", "256")) * 1024 * 1024)
+# Full eviction passes (a walk of the whole cache) run when this process's size estimate
+# goes over the cap, and at least this often to account for other workers' stores
+EVICT_INTERVAL_SECONDS = 300
+
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "stores": 0}
+_stats_lock = threading.Lock()
+_trusted_root = None
+_estimated_bytes = None
+_last_evict = 0.0
+
+def _count(name, amount=1):
+    with _stats_lock: _stats[name] += amount
+    if name in ("hits", "misses"): metrics.ARTIFACT_CACHE_LOOKUPS.labels(result=name[:-1]).inc(amount)
+    elif name == "evictions": metrics.ARTIFACT_CACHE_EVICTIONS.inc(amount)
+
+def _root_is_private():
+    """Creates CACHE_ROOT (0700) if needed and checks nobody else can plant entries in it."""
+    global _trusted_root
+    if _trusted_root == CACHE_ROOT: return True
+    if not private_dir(CACHE_ROOT):
+        logger.error(f"Artifact cache disabled: {CACHE_ROOT} must be a directory owned by this user and not writable by others")
+        return False
+    _trusted_root = CACHE_ROOT
+    return True
+
+def cache_enabled():
+    return MAX_CACHE_BYTES > 0 and _root_is_private()
+
+def artifact_key(language, flags, source):
+    h = hashlib.sha256()
+    for part in (language, "\0".join(flags), source):
+        h.update(part.encode('utf-8')); h.update(b"\x00\x01")
+    return h.hexdigest()
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, files in os.walk(path):
+        for name in files:
+            try: total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError: pass
+    return total
+
+def _lock(path, mode):
+    """Opens path and flocks it. Returns the fd, or None if it is gone or (non-blocking) locked."""
+    try: fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError: return None
+    try:
+        fcntl.flock(fd, mode)
+        return fd
+    except OSError:
+        os.close(fd)
+        return None
+
+def unpin(pin):
+    """Releases an entry pinned by get_or_build."""
+    if pin is not None: os.close(pin)
+
+def _pin(entry_dir):
+    """Shared lock on an existing entry, or None if it was evicted before we got it."""
+    fd = _lock(entry_dir, fcntl.LOCK_SH)
+    if fd is None: return None
+    try: current = os.stat(entry_dir)
+    except OSError: current = None
+    pinned = os.fstat(fd)
+    if current is None or (current.st_ino, current.st_dev) != (pinned.st_ino, pinned.st_dev):
+        os.close(fd)
+        return None
+    return fd
+
+def evict(max_bytes=None):
+    """Removes least recently used entries until the cache fits in max_bytes. Pinned entries stay."""
+    global _estimated_bytes, _last_evict
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    try: names = os.listdir(CACHE_ROOT)
+    except FileNotFoundError: return 0
+    entries = []
+    for name in names:
+        if name.startswith("tmp-"): continue
+        path = os.path.join(CACHE_ROOT, name)
+        try: entries.append((os.stat(path).st_mtime, _dir_size(path), path))
+        except OSError: continue
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes: break
+        fd = _lock(path, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if fd is None: continue  # a run is using it
+        try: shutil.rmtree(path, ignore_errors=True)
+        finally: os.close(fd)
+        total -= size; removed += 1
+    with _stats_lock: _estimated_bytes, _last_evict = total, time.monotonic()
+    if removed:
+        _count("evictions", removed)
+        logger.info(f"Artifact cache evicted {removed} entries ({total} bytes remain)")
+    return removed
+
+def _evict_if_due(added_bytes):
+    global _estimated_bytes
+    with _stats_lock:
+        if _estimated_bytes is not None: _estimated_bytes += added_bytes
+        due = _estimated_bytes is None or _estimated_bytes > MAX_CACHE_BYTES or time.monotonic() - _last_evict > EVICT_INTERVAL_SECONDS
+    if due: evict()
+
+def get_or_build(language, flags, source, build):
+    """
+    Returns {"dir", "error", "cached", "pin"} for the compiled artifact of `source`.
+    build(out_dir) compiles into out_dir and returns an error string or None.
+    Failed builds are not cached and their output dir is removed. A successful
+    entry is pinned against eviction until unpin(result["pin"]) is called.
+    """
+    key = artifact_key(language, flags, source)
+    entry_dir = os.path.join(CACHE_ROOT, key)
+    pin = _pin(entry_dir) if os.path.isdir(entry_dir) else None
+    if pin is not None:
+        try: os.utime(entry_dir)
+        except OSError: pass
+        _count("hits")
+        return {"dir": entry_dir, "error": None, "cached": True, "pin": pin}
+
+    _count("misses")
+    build_dir = os.path.join(CACHE_ROOT, f"tmp-{uuid.uuid4().hex}")
+    os.makedirs(build_dir, mode=0o700)
+    # The lock follows the directory inode through the rename below
+    pin = _lock(build_dir, fcntl.LOCK_SH)
+    try:
+        error = build(build_dir)
+        if error:
+            unpin(pin)
+            return {"dir": None, "error": error, "cached": False, "pin": None}
+        size = _dir_size(build_dir)
+        try:
+            os.rename(build_dir, entry_dir)
+            _count("stores")
+        except OSError:
+            # Another worker published the same artifact first; use theirs
+            unpin(pin)
+            pin = _pin(entry_dir)
+            if pin is None: raise
+            size = 0
+    except BaseException:
+        unpin(pin)
+        raise
+    finally:
+        if os.path.isdir(build_dir): shutil.rmtree(build_dir, ignore_errors=True)
+    _evict_if_due(size)
+    return {"dir": entry_dir, "error": None, "cached": False, "pin": pin}
+
+def get_stats():
+    """Hit/miss/eviction counters for this process plus the current on-disk footprint."""
+    with _stats_lock: stats = dict(_stats)
+    try: names = [n for n in os.listdir(CACHE_ROOT) if not n.startswith("tmp-")]
+    except FileNotFoundError: names = []
+    stats["entries"] = len(names)
+    stats["bytes"] = sum(_dir_size(os.path.join(CACHE_ROOT, n)) for n in names)
+    stats["max_bytes"] = MAX_CACHE_BYTES
+    return stats
@@ -0,0 +1,88 @@
+"""
+C++ toolchain settings: optimization profiles and a precompiled header for the
+standard prelude emitted by CppGenerator.program_start.
+
+The prelude header is force-included (-include) into every student compile, so
+g++ loads the prebuilt .gch instead of re-parsing <iostream> each time. The
+generated `#include <iostream>` line is then a no-op thanks to include guards.
+A PCH is only valid for the exact flags it was built with, so one is kept per
+optimization level. The header lands in every build, so its root must be private
+(per user, 0700, like the artifact cache); otherwise compiles go without a PCH.
+"""
+import os
+import uuid
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+from backend.services.execution.generators import CppGenerator
+from backend.services.execution.sandbox import private_dir
+from backend.core.logger import logger
+
+# -O0 compiles fastest (the old default); -O2 makes long-running programs faster
+OPT_LEVELS = {
+    'fast-compile': '-O0',
+    'balanced': '-O1',
+    'fast-run': '-O2'
+}
+DEFAULT_OPT_LEVEL = os.environ.get("CPP_OPT_LEVEL", "fast-compile")
+PCH_ENABLED = os.environ.get("CPP_PCH_ENABLED", "1") != "0"
+PCH_ROOT = os.environ.get("CPP_PCH_DIR", os.path.join(tempfile.gettempdir(), f"structogram_pch-{os.geteuid()}"))
+
+_pch_headers = {}
+_pch_lock = threading.Lock()
+
+def prelude_source():
+    """The #include lines every generated C++ program starts with."""
+    return "\n".join(line for line in CppGenerator().program_start() if line.startswith("#include")) + "\n"
+
+def _compiler_version():
+    try: return subprocess.run(["g++", "--version"], capture_output=True, text=True, timeout=10).stdout
+    except Exception: return ""
+
+def _build_pch(opt_flag):
+    """Builds <root>/<hash>/prelude.h(.gch) for opt_flag. Returns the header path or None."""
+    if not private_dir(PCH_ROOT):
+        logger.error(f"Precompiled header disabled: {PCH_ROOT} must be a directory owned by this user and not writable by others")
+        return None
+    prelude = prelude_source()
+    key = hashlib.sha256(f"{_compiler_version()}\0{opt_flag}\0{prelude}".encode('utf-8')).hexdigest()[:16]
+    target = os.path.join(PCH_ROOT, key)
+    header = os.path.join(target, "prelude.h")
+    if os.path.exists(header + ".gch"): return header
+
+    build_dir = os.path.join(PCH_ROOT, f"tmp-{uuid.uuid4().hex}")
+    os.mkdir(build_dir, 0o700)
+    try:
+        with open(os.path.join(build_dir, "prelude.h"), "w") as f: f.write(prelude)
+        res = subprocess.run(["g++", opt_flag, "-x", "c++-header", "prelude.h", "-o", "prelude.h.gch"],
+                             cwd=build_dir, capture_output=True, text=True, timeout=60)
+        if res.returncode != 0:
+            logger.warning(f"Precompiled header build failed: {res.stderr.strip()}")
+            return None
+        try: os.rename(build_dir, target)
+        except OSError:
+            if not os.path.exists(header + ".gch"): raise  # else another worker built it first
+        return header
+    finally:
+        if os.path.isdir(build_dir): shutil.rmtree(build_dir, ignore_errors=True)
+
+def precompiled_header(opt_flag):
+    """Path of the prelude header whose .gch matches opt_flag, built on first use."""
+    with _pch_lock:
+        if opt_flag not in _pch_headers:
+            try: _pch_headers[opt_flag] = _build_pch(opt_flag)
+            except Exception as e:
+                logger.warning(f"Precompiled header unavailable: {e}")
+                _pch_headers[opt_flag] = None
+        return _pch_headers[opt_flag]
+
+def compile_flags(opt_level=None, use_pch=None):
+    """g++ flags for a student compile at the given optimization profile."""
+    opt_flag = OPT_LEVELS.get(opt_level or DEFAULT_OPT_LEVEL, OPT_LEVELS['fast-compile'])
+    flags = [opt_flag]
+    if PCH_ENABLED if use_pch is None else use_pch:
+        header = precompiled_header(opt_flag)
+        if header: flags += ["-include", header]
+    return flags
@@ -1,133 +1,312 @@
 import subprocess
+import shutil
 import sys
 import os
-import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from backend.services.execution.python_runner import get_runner_pool, RunnerUnavailable
+from backend.services.execution import artifact_cache, jvm_daemon, cpp_toolchain, sandbox, memo, workspace
+from backend.core.logger import logger
 
-def run_command(command, input_str=None, timeout=5):
-    """Helper to run shell commands with timeout and input."""
+# Test cases of one submission run concurrently, bounded per submission and per process.
+# Threads only drive child processes, so they spend their time waiting on pipes.
+TEST_CASE_CONCURRENCY = int(os.environ.get("TEST_CASE_CONCURRENCY", "4"))
+GLOBAL_EXECUTION_LIMIT = int(os.environ.get("GLOBAL_EXECUTION_LIMIT", str(os.cpu_count() or 2)))
+_execution_slots = threading.BoundedSemaphore(max(1, GLOBAL_EXECUTION_LIMIT))
+# Python test cases run in batched harness processes (one load, many cases) when enabled
+PYTHON_HARNESS_ENABLED = os.environ.get("PYTHON_TEST_HARNESS", "1") != "0"
+
+# rlimits for student programs (compilers run without them). The JVM reserves far more
+# address space than it uses, so Java gets a heap cap instead of RLIMIT_AS.
+RUN_LIMITS = {"memory_bytes": sandbox.MEMORY_LIMIT_BYTES, "open_files": sandbox.OPEN_FILES_LIMIT}
+JAVA_RUN_LIMITS = {"memory_bytes": None, "open_files": 256}
+JAVA_RUN_OPTIONS = [f"-Xmx{max(16, sandbox.MEMORY_LIMIT_BYTES // (1024 * 1024))}m"]
+# Per-run accounting copied into every test case result
+RESOURCE_FIELDS = ("cpu_time", "wall_time", "peak_memory_kb")
+
+def run_command(command, input_str=None, timeout=5, limits=None, cwd=None):
+    """
+    Helper to run shell commands with timeout and input.
+    Output is streamed with a hard size cap; `limits` (apply_limits kwargs) puts
+    CPU/memory/open-file rlimits on the child. Results carry cpu_time, wall_time
+    and peak_memory_kb.
+    """
     try:
+        if limits is not None:
+            # No preexec_fn: run_command is called from test-case and request threads.
+            # Look the program up first so a missing one stays a System Error, not a shell exit code.
+            if os.sep not in command[0]:
+                executable = shutil.which(command[0])
+                if not executable: raise FileNotFoundError(f"No such file or directory: '{command[0]}'")
+                command = [executable, *command[1:]]
+            command = sandbox.limit_command(command, timeout + 1, **limits)
         process = subprocess.Popen(
             command,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True
+            start_new_session=True,
+            cwd=cwd
         )
-        stdout, stderr = process.communicate(input=input_str, timeout=timeout)
-        return {
-            "success": process.returncode == 0,
-            "output": stdout.strip(),
-            "error": stderr.strip(),
-            "timeout": False
-        }
-    except subprocess.TimeoutExpired:
-        process.kill()
+    except Exception as e:
         return {
             "success": False,
             "output": "",
-            "error": "Execution Timed Out (Possible Infinite Loop)",
-            "timeout": True
+            "error": f"System Error: {str(e)}",
+            "timeout": False
         }
+    streams = {f.fileno(): f for f in (process.stdin, process.stdout, process.stderr)}
+    try:
+        result = sandbox.collect(process.pid, process.stdin.fileno(), process.stdout.fileno(), process.stderr.fileno(),
+                                 (input_str or '').encode('utf-8'), timeout, close=lambda fd: streams[fd].close())
+        process.returncode = 0 if result['success'] else 1  # already reaped by collect
+        return result
     except Exception as e:
+        sandbox.kill_group(process.pid)
         return {
             "success": False,
             "output": "",
             "error": f"System Error: {str(e)}",
             "timeout": False
         }
+    finally:
+        for f in streams.values(): f.close()
 
 def execute_python(code, input_str):
-    filename = f"temp_{uuid.uuid4().hex}.py"
-    try:
-        with open(filename, "w") as f: f.write(code)
-        return run_command([sys.executable, filename], input_str)
-    finally:
-        if os.path.exists(filename): os.remove(filename)
-
-def execute_cpp(code, input_str):
-    # C++ requires compilation
-    base_name = f"temp_{uuid.uuid4().hex}"
-    source_file = f"{base_name}.cpp"
-    exe_file = f"./{base_name}.out"
-    
-    try:
-        with open(source_file, "w") as f: f.write(code)
-        
-        # 1. Compile
-        compile_res = run_command(["g++", source_file, "-o", exe_file], timeout=10)
-        if not compile_res['success']:
-            return {"success": False, "output": "", "error": f"Compilation Error:\n{compile_res['error']}"}
-            
-        # 2. Execute
-        return run_command([exe_file], input_str)
-        
-    finally:
-        if os.path.exists(source_file): os.remove(source_file)
-        if os.path.exists(exe_file): os.remove(exe_file)
+    # Fast path: a warm runner forks a fresh child instead of starting a new interpreter
+    pool = get_runner_pool()
+    if pool:
+        try:
+            return pool.run(code, input_str)
+        except RunnerUnavailable as e:
+            logger.warning(f"Python runner pool unavailable, falling back to subprocess: {e}")
 
-def execute_java(code, input_str):
+    with workspace.scratch() as work:
+        with open(os.path.join(work, "main.py"), "w") as f: f.write(code)
+        return run_command([sys.executable, "main.py"], input_str, limits=RUN_LIMITS, cwd=work)
+
+# Compiler flags are part of the artifact cache key (C++ flags come from cpp_toolchain)
+JAVA_FLAGS = []
+
+def _build_cpp(out_dir, code, flags):
+    source_file = os.path.join(out_dir, "main.cpp")
+    with open(source_file, "w") as f: f.write(code)
+    compile_res = run_command(["g++", *flags, source_file, "-o", os.path.join(out_dir, "main.out")], timeout=10)
+    os.remove(source_file)
+    if not compile_res['success']: return f"Compilation Error:\n{compile_res['error']}"
+    return None
+
+def _build_java(out_dir, code, flags):
     # Java is tricky: Class name MUST match filename. 
     # We assume the generator creates 'public class Main'.
-    # To avoid collisions, we create a unique folder.
-    unique_dir = f"java_{uuid.uuid4().hex}"
-    os.makedirs(unique_dir, exist_ok=True)
-    source_file = os.path.join(unique_dir, "Main.java")
-    
+    source_file = os.path.join(out_dir, "Main.java")
+    with open(source_file, "w") as f: f.write(code)
+    compile_res = run_command(["javac", *flags, source_file], timeout=10)
+    if not compile_res['success']: return f"Compilation Error:\n{compile_res['error']}"
+    return None
+
+def _compile(language, code, flags, build, command, limits=RUN_LIMITS):
+    """
+    Compiles source once. Returns an artifact dict:
+    {"success", "error", "command" (argv to run it), "limits" (rlimits for each run),
+     "workspace" (scratch dir to release, None for cached builds), "pin" (cache entry
+     pinned until release), "cached"}.
+    Artifacts come from the shared content-addressed cache when it is enabled.
+    """
+    if artifact_cache.cache_enabled():
+        entry = artifact_cache.get_or_build(language, flags, code, lambda out_dir: build(out_dir, code, flags))
+        if entry['error']: return {"success": False, "error": entry['error'], "workspace": None}
+        return {"success": True, "error": None, "command": command(entry['dir']), "limits": limits,
+                "workspace": None, "pin": entry['pin'], "cached": entry['cached']}
+
+    # Uncached builds go to a scratch directory that is released with the artifact
+    out_dir = workspace.acquire()
     try:
-        with open(source_file, "w") as f: f.write(code)
-        
-        # 1. Compile
-        compile_res = run_command(["javac", source_file], timeout=10)
-        if not compile_res['success']:
-            return {"success": False, "output": "", "error": f"Compilation Error:\n{compile_res['error']}"}
-            
-        # 2. Execute (classpath must include the temp dir)
-        return run_command(["java", "-cp", unique_dir, "Main"], input_str)
-        
+        error = build(out_dir, code, flags)
+    except BaseException:
+        workspace.release(out_dir)
+        raise
+    if error:
+        workspace.release(out_dir)
+        return {"success": False, "error": error, "workspace": None}
+    return {"success": True, "error": None, "command": command(out_dir), "limits": limits,
+            "workspace": out_dir, "cached": False}
+
+def compile_cpp(code, opt_level=None):
+    """opt_level: one of cpp_toolchain.OPT_LEVELS (defaults to CPP_OPT_LEVEL)."""
+    flags = cpp_toolchain.compile_flags(opt_level)
+    return _compile('cpp', code, flags, _build_cpp, lambda d: [os.path.join(d, "main.out")])
+
+def _compile_java_subprocess(code):
+    # Classpath must include the artifact dir
+    return _compile('java', code, JAVA_FLAGS, _build_java, lambda d: ["java", *JAVA_RUN_OPTIONS, "-cp", d, "Main"],
+                    limits=JAVA_RUN_LIMITS)
+
+def compile_java(code):
+    # Prefer the persistent JVM daemon; it keeps the compiled classes in memory
+    try:
+        res = jvm_daemon.compile_java(code)
+        return {**res, "daemon_source": code, "workspace": None, "cached": False}
+    except jvm_daemon.JvmDaemonUnavailable:
+        return _compile_java_subprocess(code)
+
+def memo_flags(language, opt_level=None):
+    """Compile flags that can change what a run does, for the execution memo key (the PCH only speeds up compiles)."""
+    if language == 'cpp': return cpp_toolchain.compile_flags(opt_level, use_pch=False)
+    if language == 'java': return JAVA_FLAGS
+    return []
+
+COMPILERS = {
+    'cpp': compile_cpp,
+    'java': compile_java
+}
+
+def release_artifact(artifact):
+    """Returns the scratch directory of an uncached build to the workspace pool and unpins a cached one."""
+    if artifact.get('workspace'):
+        workspace.release(artifact['workspace'])
+        artifact['workspace'] = None
+    if artifact.get('pin') is not None:
+        artifact_cache.unpin(artifact['pin'])
+        artifact['pin'] = None
+
+def run_artifact(artifact, input_str):
+    if 'daemon_source' in artifact:
+        try:
+            return jvm_daemon.run_java(artifact['daemon_source'], input_str)
+        except jvm_daemon.JvmDaemonUnavailable as e:
+            logger.warning(f"JVM daemon unavailable, falling back to subprocess: {e}")
+            fallback = _compile_java_subprocess(artifact['daemon_source'])
+            try:
+                if not fallback['success']: return {"success": False, "output": "", "error": fallback['error']}
+                with workspace.scratch() as work:
+                    return run_command(fallback['command'], input_str, limits=fallback['limits'], cwd=work)
+            finally:
+                release_artifact(fallback)
+    # Each run gets an empty working directory of its own
+    with workspace.scratch() as work:
+        return run_command(artifact['command'], input_str, limits=artifact.get('limits'), cwd=work)
+
+def _execute_compiled(language, code, input_str, **compile_options):
+    artifact = COMPILERS[language](code, **compile_options)
+    try:
+        if not artifact['success']:
+            return {"success": False, "output": "", "error": artifact['error']}
+        return run_artifact(artifact, input_str)
     finally:
-        # Cleanup folder
-        for file in os.listdir(unique_dir):
-            os.remove(os.path.join(unique_dir, file))
-        os.rmdir(unique_dir)
+        release_artifact(artifact)
+
+def execute_cpp(code, input_str, opt_level=None):
+    return _execute_compiled('cpp', code, input_str, opt_level=opt_level)
+
+def execute_java(code, input_str):
+    return _execute_compiled('java', code, input_str)
+
+def _check_output(tc, run_result):
+    inp = tc.get('input', '')
+    expected = tc.get('output', '').strip()
+    actual = run_result['output']
+    # Normalize line endings for comparison
+    is_match = run_result['success'] and (actual.replace('\r\n', '\n') == expected.replace('\r\n', '\n'))
+    return {
+        "input": inp,
+        "expected": expected,
+        "actual": actual,
+        "passed": is_match,
+        "error": run_result.get('error'),
+        "cached": run_result.get('cached', False),
+        **{key: run_result.get(key) for key in RESOURCE_FIELDS}
+    }
+
+def _resource_totals(results):
+    """Aggregate usage of a test run: summed CPU/wall seconds and the largest peak RSS."""
+    def values(key): return [r[key] for r in results if r.get(key) is not None]
+    memory = values('peak_memory_kb')
+    return {
+        "cpu_time": round(sum(values('cpu_time')), 4),
+        "wall_time": round(sum(values('wall_time')), 4),
+        "peak_memory_kb": max(memory) if memory else None
+    }
+
+def _run_python_harness(code, test_cases):
+    """Runs a slice of test cases in one harness process; cases it cannot finish get their own process. Returns run dicts."""
+    inputs = [tc.get('input', '') for tc in test_cases]
+    with _execution_slots:
+        try:
+            runs = get_runner_pool().run_batch(code, inputs)
+        except RunnerUnavailable as e:
+            logger.warning(f"Python test harness unavailable, running cases one by one: {e}")
+            runs = [None] * len(inputs)
+    return [run if run is not None else execute_python(code, inp) for run, inp in zip(runs, inputs)]
 
-def run_test_cases(code, test_cases, language='python'):
+def run_test_cases(code, test_cases, language='python', concurrency=None, opt_level=None):
     """
     Runs a list of test cases against the code in the specified language.
+    opt_level picks the C++ optimization profile (cpp_toolchain.OPT_LEVELS); other languages ignore it.
+    Cases whose (language, code, input) run is in the execution memo reuse the stored
+    result (marked "cached") and start no process. The rest run as below:
+    compiled languages are built once and the artifact is reused for every case;
+    a compilation error fails all cases with the same shared error.
+    Cases run concurrently (at most `concurrency` at a time, TEST_CASE_CONCURRENCY
+    by default, and never more than GLOBAL_EXECUTION_LIMIT across the process);
+    results keep the original order.
     """
-    results = []
-    passed_count = 0
-    
-    executor = {
-        'python': execute_python,
-        'cpp': execute_cpp,
-        'java': execute_java
-    }.get(language)
-
-    if not executor:
+    if language not in COMPILERS and language != 'python':
         return {"total": 0, "passed": 0, "results": [], "error": "Unsupported Language"}
 
-    for tc in test_cases:
-        inp = tc.get('input', '')
-        expected = tc.get('output', '').strip()
-        
-        run_result = executor(code, inp)
-        
-        actual = run_result['output']
-        # Normalize line endings for comparison
-        is_match = run_result['success'] and (actual.replace('\r\n', '\n') == expected.replace('\r\n', '\n'))
-        
-        if is_match: passed_count += 1
-            
-        results.append({
-            "input": inp,
-            "expected": expected,
-            "actual": actual,
-            "passed": is_match,
-            "error": run_result.get('error')
-        })
-        
+    flags = memo_flags(language, opt_level)
+    keys = [memo.memo_key(language, code, tc.get('input', ''), flags) for tc in test_cases]
+    runs = memo.lookup(keys)
+    pending = [(key, tc) for key, tc in zip(keys, test_cases) if key not in runs]
+    report = {}
+    if pending:
+        fresh = _run_uncached(code, [tc for _, tc in pending], language, concurrency, opt_level)
+        if 'error' in fresh:
+            report['error'] = fresh['error']
+        else:
+            memo.store(language, [(key, run) for (key, _), run in zip(pending, fresh['runs'])])
+        runs.update((key, run) for (key, _), run in zip(pending, fresh['runs']))
+
+    results = [_check_output(tc, runs[key]) for key, tc in zip(keys, test_cases)]
     return {
         "total": len(test_cases),
-        "passed": passed_count,
-        "results": results
-    }
\ No newline at end of file
+        "passed": sum(1 for r in results if r['passed']),
+        "results": results,
+        "resources": _resource_totals(results),
+        **report
+    }
+
+def _run_uncached(code, test_cases, language, concurrency, opt_level=None):
+    """Executes test cases. Returns {"runs": run dicts aligned with test_cases, "error" on compile failure}."""
+    if language in COMPILERS:
+        artifact = COMPILERS[language](code, **({'opt_level': opt_level} if language == 'cpp' else {}))
+        if not artifact['success']:
+            release_artifact(artifact)
+            failed = {"success": False, "output": "", "error": artifact['error']}
+            return {"runs": [failed] * len(test_cases), "error": artifact['error']}
+        executor = lambda c, inp: run_artifact(artifact, inp)
+    else:
+        artifact = None
+        executor = execute_python
+
+    def run_cases(chunk):
+        with _execution_slots:
+            return [executor(code, tc.get('input', '')) for tc in chunk]
+
+    workers = max(1, min(concurrency or TEST_CASE_CONCURRENCY, len(test_cases)))
+    if language == 'python' and PYTHON_HARNESS_ENABLED and get_runner_pool():
+        # One harness per worker, each taking a contiguous slice of the cases
+        size = -(-len(test_cases) // workers)
+        chunks = [test_cases[i:i + size] for i in range(0, len(test_cases), size)]
+        run_cases = lambda chunk: _run_python_harness(code, chunk)
+    else:
+        chunks = [[tc] for tc in test_cases]
+    try:
+        if len(chunks) <= 1 or workers == 1:
+            runs = [r for chunk in chunks for r in run_cases(chunk)]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                runs = [r for chunk_runs in pool.map(run_cases, chunks) for r in chunk_runs]
+    finally:
+        if artifact: release_artifact(artifact)
+    return {"runs": runs}
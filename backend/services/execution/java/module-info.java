@@ -0,0 +1,8 @@
+/**
+ * The runner daemon is a named module that exports and opens nothing, so student code
+ * (loaded into the unnamed module of its own classloader) cannot reflect into it.
+ */
+module structogram.runner {
+    requires java.compiler;
+    requires java.management;
+}
@@ -0,0 +1,334 @@
+package structogram.runner;
+
+import java.io.*;
+import java.lang.management.ManagementFactory;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.InetAddress;
+import java.net.ServerSocket;
+import java.net.Socket;
+import java.net.URI;
+import java.nio.charset.StandardCharsets;
+import java.security.MessageDigest;
+import java.util.*;
+import java.util.concurrent.*;
+import javax.tools.*;
+
+/**
+ * Long-lived helper that compiles and runs student Java submissions inside one JVM.
+ *
+ * Started by backend/services/execution/jvm_daemon.py, which writes the request token as
+ * the first line of stdin. Listens on 127.0.0.1 (port printed as "READY <port>" on stdout)
+ * and serves one request per connection:
+ *
+ *   request : op, token, source, stdin, timeoutMs, maxOutputBytes   (each field: int32 length + UTF-8 bytes)
+ *   response: status, stdout, stderr, cpuMillis, wallMillis          (same framing)
+ *
+ * op is "compile" or "run". status is "ok", "compile_error", "runtime_error", "timeout"
+ * or "output_limit" (the run printed more than maxOutputBytes on one stream).
+ * Sources are compiled with the in-process compiler API and cached by hash; every run
+ * loads Main in its own throwaway classloader with System.in/out/err routed to the run.
+ * That loader only delegates to the platform loader, and this class lives in a module
+ * that opens nothing, so a submission cannot reach the cache of other programs or the token.
+ * A run that ignores interruption after its timeout cannot be reclaimed, so the daemon
+ * answers and then halts; the Python side restarts it on demand.
+ */
+public class JavaRunnerDaemon {
+
+    private static final int MAX_CACHED_PROGRAMS = 256;
+    // Read from stdin rather than the environment, which any submission can print
+    private static String token;
+
+    private static final JavaCompiler COMPILER = ToolProvider.getSystemJavaCompiler();
+    private static final Map<String, Map<String, byte[]>> PROGRAMS = Collections.synchronizedMap(
+        new LinkedHashMap<String, Map<String, byte[]>>(16, 0.75f, true) {
+            protected boolean removeEldestEntry(Map.Entry<String, Map<String, byte[]>> eldest) {
+                return size() > MAX_CACHED_PROGRAMS;
+            }
+        });
+
+    // Per-run stream routing: student threads inherit the streams of the run that started them
+    private static final InheritableThreadLocal<InputStream> RUN_IN = new InheritableThreadLocal<>();
+    private static final InheritableThreadLocal<PrintStream> RUN_OUT = new InheritableThreadLocal<>();
+    private static final InheritableThreadLocal<PrintStream> RUN_ERR = new InheritableThreadLocal<>();
+
+    public static void main(String[] args) throws Exception {
+        InputStream parentIn = System.in;
+        token = readLine(parentIn);
+        if (COMPILER == null || token.isEmpty()) {
+            System.err.println("JavaRunnerDaemon needs a JDK and a token on stdin");
+            System.exit(2);
+        }
+        // The parent keeps our stdin open; EOF means the web worker is gone
+        Thread watchdog = new Thread(() -> {
+            try {
+                while (parentIn.read() != -1) { }
+            } catch (IOException ignored) { }
+            Runtime.getRuntime().halt(0);
+        }, "parent-watchdog");
+        watchdog.setDaemon(true);
+        watchdog.start();
+
+        PrintStream daemonOut = System.out;
+        PrintStream daemonErr = System.err;
+        System.setIn(new RoutedInputStream());
+        System.setOut(new PrintStream(new RoutedOutputStream(RUN_OUT, daemonOut), true));
+        System.setErr(new PrintStream(new RoutedOutputStream(RUN_ERR, daemonErr), true));
+
+        ServerSocket server = new ServerSocket(0, 50, InetAddress.getLoopbackAddress());
+        daemonOut.println("READY " + server.getLocalPort());
+        daemonOut.flush();
+
+        ExecutorService handlers = Executors.newCachedThreadPool(r -> {
+            Thread t = new Thread(r, "request-handler");
+            t.setDaemon(true);
+            return t;
+        });
+        while (true) {
+            Socket socket = server.accept();
+            handlers.submit(() -> handle(socket));
+        }
+    }
+
+    // --- Protocol ---
+
+    private static String readLine(InputStream in) throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int b;
+        while ((b = in.read()) != -1 && b != '\n') line.write(b);
+        return line.toString(StandardCharsets.UTF_8).trim();
+    }
+
+    private static String readField(DataInputStream in) throws IOException {
+        int length = in.readInt();
+        byte[] data = new byte[length];
+        in.readFully(data);
+        return new String(data, StandardCharsets.UTF_8);
+    }
+
+    private static void writeField(DataOutputStream out, String value) throws IOException {
+        byte[] data = value.getBytes(StandardCharsets.UTF_8);
+        out.writeInt(data.length);
+        out.write(data);
+    }
+
+    private static void handle(Socket socket) {
+        boolean halt = false;
+        try (Socket s = socket) {
+            DataInputStream in = new DataInputStream(new BufferedInputStream(s.getInputStream()));
+            DataOutputStream out = new DataOutputStream(new BufferedOutputStream(s.getOutputStream()));
+            String op = readField(in);
+            String requestToken = readField(in);
+            String source = readField(in);
+            String stdin = readField(in);
+            long timeoutMs = Long.parseLong(readField(in));
+            int maxOutput = Integer.parseInt(readField(in));
+            if (!token.equals(requestToken)) return;
+
+            String[] result;
+            Map<String, byte[]> classes = PROGRAMS.get(hash(source));
+            String compileErrors = null;
+            if (classes == null) {
+                StringWriter diagnostics = new StringWriter();
+                classes = compile(source, diagnostics);
+                if (classes == null) compileErrors = diagnostics.toString();
+                else PROGRAMS.put(hash(source), classes);
+            }
+            if (compileErrors != null) {
+                result = new String[]{"compile_error", "", compileErrors, "0", "0"};
+            } else if (op.equals("compile")) {
+                result = new String[]{"ok", "", "", "0", "0"};
+            } else {
+                RunOutcome outcome = run(classes, stdin, timeoutMs, maxOutput);
+                result = new String[]{outcome.status, outcome.stdout, outcome.stderr,
+                                      Long.toString(outcome.cpuMillis), Long.toString(outcome.wallMillis)};
+                halt = outcome.leaked;
+            }
+            for (String field : result) writeField(out, field);
+            out.flush();
+        } catch (Exception e) {
+            // Malformed request or client went away; nothing to answer
+        }
+        if (halt) Runtime.getRuntime().halt(3);
+    }
+
+    private static String hash(String source) throws Exception {
+        byte[] digest = MessageDigest.getInstance("SHA-256").digest(source.getBytes(StandardCharsets.UTF_8));
+        StringBuilder sb = new StringBuilder();
+        for (byte b : digest) sb.append(String.format("%02x", b));
+        return sb.toString();
+    }
+
+    // --- Compilation (in memory) ---
+
+    private static Map<String, byte[]> compile(String source, Writer diagnostics) {
+        Map<String, ByteArrayOutputStream> outputs = new HashMap<>();
+        StandardJavaFileManager standard = COMPILER.getStandardFileManager(null, null, StandardCharsets.UTF_8);
+        JavaFileManager manager = new ForwardingJavaFileManager<JavaFileManager>(standard) {
+            @Override
+            public JavaFileObject getJavaFileForOutput(Location location, String className,
+                                                       JavaFileObject.Kind kind, FileObject sibling) {
+                return new SimpleJavaFileObject(URI.create("mem:///" + className.replace('.', '/') + kind.extension), kind) {
+                    @Override
+                    public OutputStream openOutputStream() {
+                        ByteArrayOutputStream buffer = new ByteArrayOutputStream();
+                        outputs.put(className, buffer);
+                        return buffer;
+                    }
+                };
+            }
+        };
+        JavaFileObject file = new SimpleJavaFileObject(URI.create("string:///Main.java"), JavaFileObject.Kind.SOURCE) {
+            @Override
+            public CharSequence getCharContent(boolean ignoreEncodingErrors) {
+                return source;
+            }
+        };
+        boolean ok = COMPILER.getTask(diagnostics, manager, null, null, null, Collections.singletonList(file)).call();
+        if (!ok) return null;
+        Map<String, byte[]> classes = new HashMap<>();
+        outputs.forEach((name, buffer) -> classes.put(name, buffer.toByteArray()));
+        return classes;
+    }
+
+    private static class MemoryClassLoader extends ClassLoader {
+        private final Map<String, byte[]> classes;
+
+        MemoryClassLoader(Map<String, byte[]> classes) {
+            // Not the application loader: the daemon's own classes stay out of reach
+            super(ClassLoader.getPlatformClassLoader());
+            this.classes = classes;
+        }
+
+        @Override
+        protected Class<?> findClass(String name) throws ClassNotFoundException {
+            byte[] bytes = classes.get(name);
+            if (bytes == null) throw new ClassNotFoundException(name);
+            return defineClass(name, bytes, 0, bytes.length);
+        }
+    }
+
+    // --- Execution ---
+
+    private static class RunOutcome {
+        String status; String stdout; String stderr; boolean leaked; long cpuMillis; long wallMillis;
+    }
+
+    private static class OutputLimitExceeded extends Error {
+        OutputLimitExceeded() { super("Output Limit Exceeded", null, false, false); }
+    }
+
+    /** Buffer that refuses to grow past its limit; the Error unwinds the student's print call. */
+    private static class CappedOutputStream extends ByteArrayOutputStream {
+        private final int limit;
+        volatile boolean exceeded;
+
+        CappedOutputStream(int limit) { this.limit = limit; }
+
+        @Override
+        public synchronized void write(int b) {
+            if (count + 1 > limit) { exceeded = true; throw new OutputLimitExceeded(); }
+            super.write(b);
+        }
+        @Override
+        public synchronized void write(byte[] b, int off, int len) {
+            if (count + len > limit) { exceeded = true; throw new OutputLimitExceeded(); }
+            super.write(b, off, len);
+        }
+    }
+
+    private static RunOutcome run(Map<String, byte[]> classes, String stdin, long timeoutMs, int maxOutput) throws InterruptedException {
+        CappedOutputStream stdout = new CappedOutputStream(maxOutput);
+        CappedOutputStream stderr = new CappedOutputStream(maxOutput);
+        PrintStream runOut = new PrintStream(stdout, true);
+        PrintStream runErr = new PrintStream(stderr, true);
+        boolean[] failed = {false};
+        long[] cpuNanos = {0};
+        long started = System.nanoTime();
+        MemoryClassLoader loader = new MemoryClassLoader(classes);
+
+        Thread worker = new Thread(() -> {
+            RUN_IN.set(new ByteArrayInputStream(stdin.getBytes(StandardCharsets.UTF_8)));
+            RUN_OUT.set(runOut);
+            RUN_ERR.set(runErr);
+            try {
+                Class<?> main = loader.loadClass("Main");
+                Method entry = main.getMethod("main", String[].class);
+                entry.invoke(null, (Object) new String[0]);
+            } catch (InvocationTargetException e) {
+                failed[0] = true;
+                // Hide the daemon's reflection frames below Main.main
+                Throwable cause = e.getCause();
+                List<StackTraceElement> frames = new ArrayList<>();
+                for (StackTraceElement frame : cause.getStackTrace()) {
+                    frames.add(frame);
+                    if (frame.getClassName().equals("Main") && frame.getMethodName().equals("main")) break;
+                }
+                cause.setStackTrace(frames.toArray(new StackTraceElement[0]));
+                runErr.print("Exception in thread \"main\" ");
+                cause.printStackTrace(runErr);
+            } catch (Throwable e) {
+                failed[0] = true;
+                runErr.println("Error: " + e);
+            } finally {
+                runOut.flush();
+                runErr.flush();
+                cpuNanos[0] = ManagementFactory.getThreadMXBean().getCurrentThreadCpuTime();
+            }
+        }, "main");
+        worker.setDaemon(true);
+        worker.setContextClassLoader(loader);
+        worker.start();
+        worker.join(timeoutMs);
+
+        RunOutcome outcome = new RunOutcome();
+        outcome.wallMillis = (System.nanoTime() - started) / 1_000_000;
+        outcome.cpuMillis = cpuNanos[0] / 1_000_000;
+        if (worker.isAlive()) {
+            worker.interrupt();
+            worker.join(100);
+            outcome.status = stdout.exceeded || stderr.exceeded ? "output_limit" : "timeout";
+            outcome.stdout = "";
+            outcome.stderr = "";
+            outcome.leaked = worker.isAlive();
+            return outcome;
+        }
+        if (stdout.exceeded || stderr.exceeded) {
+            outcome.status = "output_limit";
+            outcome.stdout = "";
+            outcome.stderr = "";
+            return outcome;
+        }
+        outcome.status = failed[0] ? "runtime_error" : "ok";
+        outcome.stdout = stdout.toString(StandardCharsets.UTF_8);
+        outcome.stderr = stderr.toString(StandardCharsets.UTF_8);
+        return outcome;
+    }
+
+    private static class RoutedInputStream extends InputStream {
+        private InputStream target() {
+            InputStream in = RUN_IN.get();
+            return in != null ? in : InputStream.nullInputStream();
+        }
+        @Override public int read() throws IOException { return target().read(); }
+        @Override public int read(byte[] b, int off, int len) throws IOException { return target().read(b, off, len); }
+        @Override public int available() throws IOException { return target().available(); }
+    }
+
+    private static class RoutedOutputStream extends OutputStream {
+        private final ThreadLocal<PrintStream> route;
+        private final PrintStream fallback;
+
+        RoutedOutputStream(ThreadLocal<PrintStream> route, PrintStream fallback) {
+            this.route = route;
+            this.fallback = fallback;
+        }
+        private PrintStream target() {
+            PrintStream out = route.get();
+            return out != null ? out : fallback;
+        }
+        @Override public void write(int b) { target().write(b); }
+        @Override public void write(byte[] b, int off, int len) { target().write(b, off, len); }
+        @Override public void flush() { target().flush(); }
+    }
+}
@@ -0,0 +1,171 @@
+"""
+Client for the persistent Java helper (java/structogram/runner/JavaRunnerDaemon.java).
+
+One daemon JVM per web worker compiles submissions with the in-process compiler
+API and runs each one in a throwaway classloader, so a Java run no longer pays
+for two JVM start-ups. Every call raises JvmDaemonUnavailable when the daemon
+cannot serve it; callers then fall back to the javac/java subprocess path.
+
+Off by default (JVM_DAEMON_ENABLED=1 turns it on): all runs share one JVM, so
+there is no per-run heap cap or rlimit, and a submission that calls System.exit,
+exhausts the heap or leaks a thread ends every run in flight. The subprocess
+path gives each run its own process and limits.
+"""
+import os
+import time
+import atexit
+import shutil
+import socket
+import struct
+import hashlib
+import secrets
+import tempfile
+import threading
+import subprocess
+from backend.services.execution import sandbox
+from backend.core.logger import logger
+
+DAEMON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "java")
+DAEMON_SOURCES = [os.path.join(DAEMON_DIR, "module-info.java"),
+                  os.path.join(DAEMON_DIR, "structogram", "runner", "JavaRunnerDaemon.java")]
+DAEMON_MODULE = "structogram.runner/structogram.runner.JavaRunnerDaemon"
+ENABLED = os.environ.get("JVM_DAEMON_ENABLED", "0") == "1"
+# --limit-modules keeps jdk.unsupported (sun.misc.Unsafe) out of reach of submissions
+JVM_OPTIONS = ["-XX:+UseSerialGC", "-Xss8m", "--limit-modules", "structogram.runner,jdk.compiler", "--add-modules", "jdk.compiler"]
+STARTUP_TIMEOUT = 20
+# After a failed start, wait this long before trying to start the daemon again
+RETRY_BACKOFF_SECONDS = 60
+COMPILE_BUDGET_SECONDS = 10
+
+_LENGTH = struct.Struct(">i")
+
+
+class JvmDaemonUnavailable(Exception):
+    """Raised when the daemon is disabled, cannot start, or dropped the request."""
+
+
+def _daemon_classes():
+    """
+    Compiles the daemon module into <tmp>/structogram_jvm_daemon-<uid>/<source hash>/ once.
+    Kept out of the artifact cache so LRU eviction never removes classes of a running daemon;
+    private (0700) for the same reason as the cache: the classes are run as they are.
+    """
+    digest = hashlib.sha256()
+    for path in DAEMON_SOURCES:
+        with open(path, 'rb') as f: digest.update(f.read())
+    root = os.path.join(tempfile.gettempdir(), f"structogram_jvm_daemon-{os.geteuid()}")
+    os.makedirs(root, mode=0o700, exist_ok=True)
+    st = os.lstat(root)
+    if os.path.islink(root) or st.st_uid != os.geteuid() or st.st_mode & 0o022:
+        raise JvmDaemonUnavailable(f"{root} is not private to this user")
+    target = os.path.join(root, digest.hexdigest()[:16])
+    if os.path.isdir(target): return target
+    build_dir = f"{target}.tmp-{os.getpid()}"
+    os.makedirs(build_dir, exist_ok=True)
+    res = subprocess.run(["javac", "-d", build_dir, *DAEMON_SOURCES], capture_output=True, text=True, timeout=60)
+    if res.returncode != 0:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise JvmDaemonUnavailable(f"Could not build daemon: {res.stderr.strip()}")
+    try: os.rename(build_dir, target)
+    except OSError: shutil.rmtree(build_dir, ignore_errors=True)  # built concurrently by another worker
+    return target
+
+
+class _Daemon:
+    def __init__(self):
+        classes_dir = _daemon_classes()
+        self.token = secrets.token_hex(16)
+        self.process = subprocess.Popen(
+            ["java", *JVM_OPTIONS, "-p", classes_dir, "-m", DAEMON_MODULE],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        # Over stdin, not the environment: submissions can read System.getenv
+        try:
+            self.process.stdin.write(self.token + "\n"); self.process.stdin.flush()
+        except OSError as e:
+            self.process.kill()
+            raise JvmDaemonUnavailable(f"Daemon exited on start: {e}")
+        self.port = self._wait_ready()
+
+    def _wait_ready(self):
+        ready = {}
+        reader = threading.Thread(target=lambda: ready.setdefault('line', self.process.stdout.readline()), daemon=True)
+        reader.start(); reader.join(STARTUP_TIMEOUT)
+        line = ready.get('line', '')
+        if not line.startswith("READY "):
+            self.process.kill()
+            raise JvmDaemonUnavailable("Daemon did not report ready")
+        return int(line.split()[1])
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def request(self, op, source, input_str, timeout):
+        fields = [op, self.token, source, input_str or '', str(int(timeout * 1000)), str(sandbox.MAX_OUTPUT_BYTES)]
+        payload = b"".join(_LENGTH.pack(len(data)) + data for data in (f.encode('utf-8') for f in fields))
+        try:
+            with socket.create_connection(("127.0.0.1", self.port), timeout=timeout + COMPILE_BUDGET_SECONDS) as conn:
+                conn.sendall(payload)
+                reader = conn.makefile('rb')
+                return [self._read_field(reader) for _ in range(5)]
+        except (OSError, EOFError) as e:
+            raise JvmDaemonUnavailable(str(e))
+
+    @staticmethod
+    def _read_field(reader):
+        header = reader.read(_LENGTH.size)
+        if len(header) < _LENGTH.size: raise EOFError("Daemon closed the connection")
+        data = reader.read(_LENGTH.unpack(header)[0])
+        return data.decode('utf-8', errors='replace')
+
+    def close(self):
+        # Closing stdin lets the daemon's watchdog exit it
+        try: self.process.stdin.close()
+        except OSError: pass
+        if self.alive(): self.process.kill()
+
+
+_daemon = None
+_daemon_pid = None
+_last_failure = 0.0
+_lock = threading.Lock()
+
+def _get_daemon():
+    global _daemon, _daemon_pid, _last_failure
+    if not ENABLED: raise JvmDaemonUnavailable("JVM daemon disabled")
+    with _lock:
+        # A forked web worker starts its own daemon
+        if _daemon and _daemon_pid == os.getpid() and _daemon.alive():
+            return _daemon
+        if _last_failure and time.monotonic() - _last_failure < RETRY_BACKOFF_SECONDS:
+            raise JvmDaemonUnavailable("JVM daemon recently failed to start")
+        try:
+            _daemon = _Daemon(); _daemon_pid = os.getpid()
+            atexit.register(_daemon.close)
+            logger.info(f"JVM daemon listening on 127.0.0.1:{_daemon.port}")
+            return _daemon
+        except Exception as e:
+            _daemon = None; _last_failure = time.monotonic()
+            raise JvmDaemonUnavailable(str(e))
+
+def compile_java(code):
+    """Compiles (and caches) code in the daemon. Returns {"success", "error"}."""
+    status, _, err, _, _ = _get_daemon().request("compile", code, "", 0)
+    if status == "compile_error":
+        return {"success": False, "error": f"Compilation Error:\n{err.strip()}"}
+    return {"success": True, "error": None}
+
+def run_java(code, input_str, timeout=5):
+    """
+    Runs Main.main of code with input_str on stdin. Same result shape as run_command;
+    cpu_time is the main thread's CPU time and peak memory is not measured in the shared JVM.
+    """
+    status, out, err, cpu_ms, wall_ms = _get_daemon().request("run", code, input_str, timeout)
+    usage = {"cpu_time": int(cpu_ms) / 1000, "wall_time": int(wall_ms) / 1000, "peak_memory_kb": None}
+    if status == "compile_error":
+        return {"success": False, "output": "", "error": f"Compilation Error:\n{err.strip()}"}
+    if status == "timeout":
+        return {"success": False, "output": "", "error": sandbox.TIMEOUT_ERROR, "timeout": True, **usage}
+    if status == "output_limit":
+        return {"success": False, "output": "", "error": sandbox.OUTPUT_LIMIT_ERROR, "timeout": False, **usage}
+    return {"success": status == "ok", "output": out.strip(), "error": err.strip(), "timeout": False, **usage}
@@ -0,0 +1,110 @@
+"""
+Persistent memo of execution results (table execution_memo).
+
+A run is identified by hash(language, compile flags, code, stdin), so a resubmitted diagram that
+generates the same code reuses the stored output instead of starting a process.
+Entries expire after EXEC_MEMO_TTL_HOURS and the table is trimmed to the
+EXEC_MEMO_MAX_ENTRIES most recently used rows. The memo is best effort: any
+database problem is logged and treated as a miss.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from backend.core.database import get_db_connection, release_db_connection
+from backend.services.execution import sandbox
+from backend.core.logger import logger
+
+ENABLED = os.environ.get("EXEC_MEMO_ENABLED", "1") != "0"
+TTL_SECONDS = int(float(os.environ.get("EXEC_MEMO_TTL_HOURS", "24")) * 3600)
+MAX_ENTRIES = int(os.environ.get("EXEC_MEMO_MAX_ENTRIES", "20000"))
+# Trim the table after this many stores
+PRUNE_EVERY = 200
+# After a database failure, skip the memo for this long instead of retrying every run
+RETRY_BACKOFF_SECONDS = 30
+# Bump when the engine changes what a run returns for the same program
+KEY_VERSION = "2"
+
+_lock = threading.Lock()
+_stores_since_prune = 0
+_last_failure = 0.0
+
+def memo_key(language, code, input_str, flags=()):
+    # Limits and compile flags are part of the key: a run that hit a limit may pass under
+    # another, and an -O2 build may behave differently from an -O0 one
+    parts = [KEY_VERSION, language, str(sandbox.MAX_OUTPUT_BYTES), str(sandbox.MEMORY_LIMIT_BYTES), " ".join(flags), code, input_str or '']
+    return hashlib.sha256("\0".join(parts).encode('utf-8')).hexdigest()
+
+def _cacheable(result):
+    # Timeouts and system errors depend on load, not on the program
+    return not result.get('timeout') and not (result.get('error') or '').startswith("System Error")
+
+def _execute(query, params, fetch=False):
+    """Runs one statement on a pooled connection. Returns fetched rows, or None on failure."""
+    global _last_failure
+    if not ENABLED or (_last_failure and time.monotonic() - _last_failure < RETRY_BACKOFF_SECONDS):
+        return None
+    conn = get_db_connection()
+    if not conn:
+        _last_failure = time.monotonic()
+        return None
+    try:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        rows = cur.fetchall() if fetch else []
+        conn.commit()
+        return rows
+    except Exception as e:
+        try: conn.rollback()
+        except Exception: pass
+        logger.warning(f"Execution memo unavailable: {e}")
+        _last_failure = time.monotonic()
+        return None
+    finally:
+        release_db_connection(conn)
+
+def lookup(keys):
+    """Returns {key: result} for the live entries among keys, each marked "cached": True."""
+    if not keys: return {}
+    rows = _execute("""
+        UPDATE execution_memo SET last_used_at = NOW(), hits = hits + 1
+        WHERE key = ANY(%s) AND created_at > NOW() - %s * INTERVAL '1 second'
+        RETURNING key, result
+    """, (list(set(keys)), TTL_SECONDS), fetch=True)
+    return {key: {**result, "cached": True} for key, result in rows or []}
+
+def store(language, entries):
+    """Saves (key, result) pairs; results that depend on load rather than on the program are skipped."""
+    global _stores_since_prune
+    # One row per key: ON CONFLICT cannot touch the same row twice in a statement
+    unique = {key: result for key, result in entries if _cacheable(result)}
+    rows = [(key, language, json.dumps(result)) for key, result in unique.items()]
+    if not rows: return
+    values = ", ".join(["(%s, %s, %s)"] * len(rows))
+    _execute(f"""
+        INSERT INTO execution_memo (key, language, result) VALUES {values}
+        ON CONFLICT (key) DO UPDATE SET result = EXCLUDED.result, created_at = NOW(), last_used_at = NOW()
+    """, [v for row in rows for v in row])
+    with _lock:
+        _stores_since_prune += len(rows)
+        if _stores_since_prune < PRUNE_EVERY: return
+        _stores_since_prune = 0
+    prune()
+
+def prune():
+    """Drops expired entries and everything beyond the MAX_ENTRIES most recently used."""
+    _execute("""
+        DELETE FROM execution_memo
+        WHERE created_at < NOW() - %s * INTERVAL '1 second'
+           OR key IN (SELECT key FROM execution_memo ORDER BY last_used_at DESC OFFSET %s)
+    """, (TTL_SECONDS, MAX_ENTRIES))
+
+def memoized_run(language, code, input_str, run, flags=()):
+    """Returns the memoized result of one run, or calls run(code, input_str) and stores it."""
+    key = memo_key(language, code, input_str, flags)
+    hit = lookup([key]).get(key)
+    if hit: return hit
+    result = run(code, input_str)
+    store(language, [(key, result)])
+    return result
@@ -0,0 +1,411 @@
+"""
+Warm Python runner pool (forkserver style).
+
+Each runner is a long-lived interpreter started with `python -m` on this module.
+It receives (code, stdin, timeout) requests over its stdin pipe and forks a fresh
+child for every run, so submissions never pay for interpreter start-up.
+The child gets its own stdin/stdout/stderr pipes and a clean `__main__` namespace.
+"""
+import io
+import os
+import sys
+import json
+import time
+import struct
+import select
+import signal
+import atexit
+import builtins
+import resource
+import threading
+import traceback
+import linecache
+import subprocess
+from backend.services.execution import sandbox
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# Modules imported once in the runner so forked children get them for free
+PRELOAD_MODULES = ['math', 'random', 'string', 're', 'collections', 'itertools', 'functools', 'decimal', 'fractions']
+
+SUBMISSION_FILENAME = "main.py"
+TIMEOUT_ERROR = sandbox.TIMEOUT_ERROR
+OUTPUT_LIMIT_ERROR = sandbox.OUTPUT_LIMIT_ERROR
+# Per-case cap on captured stdout/stderr in harness mode (characters)
+HARNESS_OUTPUT_LIMIT = sandbox.MAX_OUTPUT_BYTES
+# Slack on top of the per-case timeout before a wedged harness is killed from outside
+HARNESS_GRACE_SECONDS = 1.0
+_HEADER = struct.Struct(">I")
+
+
+class RunnerUnavailable(Exception):
+    """Raised when no warm runner can serve the request (caller should fall back)."""
+
+
+# --- WIRE PROTOCOL (length-prefixed JSON) ---
+
+def _write_message(fd, payload):
+    data = json.dumps(payload).encode('utf-8')
+    data = _HEADER.pack(len(data)) + data
+    while data:
+        written = os.write(fd, data)
+        data = data[written:]
+
+def _read_exact(fd, size, deadline=None):
+    chunks = []; remaining = size
+    while remaining:
+        if deadline is not None:
+            wait = deadline - time.monotonic()
+            if wait <= 0 or not select.select([fd], [], [], wait)[0]:
+                raise TimeoutError("Runner did not answer in time")
+        chunk = os.read(fd, remaining)
+        if not chunk: raise EOFError("Runner closed the pipe")
+        chunks.append(chunk); remaining -= len(chunk)
+    return b"".join(chunks)
+
+def _read_message(fd, deadline=None):
+    size = _HEADER.unpack(_read_exact(fd, _HEADER.size, deadline))[0]
+    return json.loads(_read_exact(fd, size, deadline).decode('utf-8'))
+
+
+# --- RUNNER SIDE (inside the warm interpreter) ---
+
+def _exit_status(exc):
+    """Mirrors how the interpreter turns SystemExit into a process exit code."""
+    if exc.code is None: return 0
+    if isinstance(exc.code, int): return exc.code
+    print(exc.code, file=sys.stderr)
+    return 1
+
+def _fresh_namespace():
+    return {"__name__": "__main__", "__file__": SUBMISSION_FILENAME, "__builtins__": builtins}
+
+def _print_submission_error():
+    # Drop our own frame so the traceback looks like a plain `python main.py` run
+    etype, value, tb = sys.exc_info()
+    traceback.print_exception(etype, value, tb.tb_next)
+
+def _exec_submission(code):
+    """Runs in the forked child. Never returns."""
+    linecache.cache[SUBMISSION_FILENAME] = (len(code), None, code.splitlines(True), SUBMISSION_FILENAME)
+    status = 0
+    try:
+        exec(compile(code, SUBMISSION_FILENAME, "exec"), _fresh_namespace())
+    except SystemExit as e:
+        status = _exit_status(e)
+    except BaseException:
+        _print_submission_error()
+        status = 1
+    for stream in (sys.stdout, sys.stderr):
+        try: stream.flush()
+        except Exception: status = status or 1
+    os._exit(status)
+
+def _spawn_child(code, proto_fds, timeout):
+    """Forks a rlimited child wired to fresh pipes. Returns (pid, stdin_w, stdout_r, stderr_r)."""
+    in_r, in_w = os.pipe(); out_r, out_w = os.pipe(); err_r, err_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.setpgid(0, 0)
+            sandbox.apply_limits(timeout + 1)
+            for fd in proto_fds + (in_w, out_r, err_r): os.close(fd)
+            os.dup2(in_r, 0); os.dup2(out_w, 1); os.dup2(err_w, 2)
+            for fd in (in_r, out_w, err_w): os.close(fd)
+            signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+            sys.stdin = open(0, 'r', encoding='utf-8', closefd=False)
+            sys.stdout = open(1, 'w', encoding='utf-8', closefd=False)
+            sys.stderr = open(2, 'w', encoding='utf-8', errors='backslashreplace', closefd=False)
+            _exec_submission(code)
+        finally:
+            os._exit(1)
+    for fd in (in_r, out_w, err_w): os.close(fd)
+    return pid, in_w, out_r, err_r
+
+# --- BATCH HARNESS (one process, many test cases) ---
+
+class _HarnessTimeout(BaseException):
+    """Raised by SIGALRM inside a case. BaseException so `except Exception` in student code can't swallow it."""
+
+class _OutputLimitExceeded(BaseException):
+    pass
+
+class _CappedWriter(io.StringIO):
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit; self.size = 0
+    def write(self, text):
+        self.size += len(text)
+        if self.size > self.limit: raise _OutputLimitExceeded()
+        return super().write(text)
+
+def _on_alarm(signum, frame):
+    # Re-arm so a bare `except:` in a loop cannot swallow the timeout for good
+    signal.setitimer(signal.ITIMER_REAL, 0.05)
+    raise _HarnessTimeout()
+
+def _run_case(code_obj, input_str, timeout):
+    """
+    Runs one case in-process. Returns a result dict, or None if it must be re-run standalone.
+    CPU and wall time are per case; peak memory is the harness high-water mark so far.
+    """
+    before = resource.getrusage(resource.RUSAGE_SELF); started = time.monotonic()
+    result = _run_case_body(code_obj, input_str, timeout)
+    if result is None: return None
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    result.update(sandbox.usage_report(after, time.monotonic() - started))
+    result['cpu_time'] = round(result['cpu_time'] - before.ru_utime - before.ru_stime, 4)
+    return result
+
+def _run_case_body(code_obj, input_str, timeout):
+    stdout = _CappedWriter(HARNESS_OUTPUT_LIMIT); stderr = _CappedWriter(HARNESS_OUTPUT_LIMIT)
+    sys.stdin = io.StringIO(input_str); sys.stdout = stdout; sys.stderr = stderr
+    status = 0
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        try:
+            exec(code_obj, _fresh_namespace())
+        except SystemExit:
+            return None  # exiting the interpreter: exact semantics need a real process
+        except (_HarnessTimeout, _OutputLimitExceeded):
+            raise
+        except BaseException:
+            _print_submission_error()
+            status = 1
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    except _HarnessTimeout:
+        return {"success": False, "output": "", "error": TIMEOUT_ERROR, "timeout": True}
+    except _OutputLimitExceeded:
+        return {"success": False, "output": "", "error": OUTPUT_LIMIT_ERROR, "timeout": False}
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        sys.stdin, sys.stdout, sys.stderr = sys.__stdin__, sys.__stdout__, sys.__stderr__
+    return {"success": status == 0, "output": stdout.getvalue().strip(), "error": stderr.getvalue().strip(), "timeout": False}
+
+def _harness_main(code, inputs, timeout, result_fd):
+    """Runs in the forked harness child: compile once, run every case, stream one JSON line per case."""
+    linecache.cache[SUBMISSION_FILENAME] = (len(code), None, code.splitlines(True), SUBMISSION_FILENAME)
+    signal.signal(signal.SIGALRM, _on_alarm)
+    try:
+        code_obj = compile(code, SUBMISSION_FILENAME, "exec")
+    except SyntaxError as e:
+        error = "".join(traceback.format_exception_only(type(e), e)).strip()
+        code_obj = None
+    with os.fdopen(result_fd, 'w', encoding='utf-8') as out:
+        for input_str in inputs:
+            if code_obj is None:
+                result = {"success": False, "output": "", "error": error, "timeout": False}
+            else:
+                result = _run_case(code_obj, input_str, timeout)
+            out.write(json.dumps(result) + "\n"); out.flush()
+    os._exit(0)
+
+def _run_batch(code, inputs, timeout, proto_fds):
+    """
+    Forks one harness child for all inputs. Returns a list aligned with inputs;
+    None marks a case that must fall back to its own process (harness crashed or the case exited).
+    """
+    res_r, res_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.setpgid(0, 0)
+            sandbox.apply_limits(timeout * len(inputs) + HARNESS_GRACE_SECONDS)
+            for fd in proto_fds + (res_r,): os.close(fd)
+            _harness_main(code, inputs, timeout, res_w)
+        finally:
+            os._exit(1)
+    os.close(res_w)
+
+    results = []; buffer = b""
+    deadline = time.monotonic() + timeout + HARNESS_GRACE_SECONDS
+    try:
+        while len(results) < len(inputs):
+            wait = deadline - time.monotonic()
+            if wait <= 0 or not select.select([res_r], [], [], wait)[0]:
+                # The running case blew through its timeout without the alarm stopping it
+                sandbox.kill_group(pid)
+                results.append({"success": False, "output": "", "error": TIMEOUT_ERROR, "timeout": True})
+                break
+            chunk = os.read(res_r, 65536)
+            if not chunk: break  # harness died; remaining cases fall back
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                results.append(json.loads(line))
+                deadline = time.monotonic() + timeout + HARNESS_GRACE_SECONDS
+    finally:
+        os.close(res_r)
+        sandbox.kill_group(pid)
+        os.waitpid(pid, 0)
+    return results + [None] * (len(inputs) - len(results))
+
+def serve():
+    """Request loop of a warm runner. Exits when the parent closes the pipe."""
+    for name in PRELOAD_MODULES: __import__(name)
+    # Move the protocol pipes off fds 0/1 so forked children can take them over
+    proto_in, proto_out = os.dup(0), os.dup(1)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0); os.dup2(devnull, 1); os.close(devnull)
+    while True:
+        try: request = _read_message(proto_in)
+        except EOFError: return
+        try:
+            if request.get('op') == 'batch':
+                result = {"results": _run_batch(request['code'], request['inputs'], request.get('timeout', 5), (proto_in, proto_out))}
+            else:
+                input_bytes = (request.get('input') or '').encode('utf-8')
+                timeout = request.get('timeout', 5)
+                pid, stdin_w, stdout_r, stderr_r = _spawn_child(request['code'], (proto_in, proto_out), timeout)
+                try: result = sandbox.collect(pid, stdin_w, stdout_r, stderr_r, input_bytes, timeout)
+                finally:
+                    os.close(stdout_r); os.close(stderr_r)
+        except Exception as e:
+            result = {"success": False, "output": "", "error": f"System Error: {str(e)}", "timeout": False}
+            if request.get('op') == 'batch': result = {"results": [None] * len(request.get('inputs', []))}
+        _write_message(proto_out, result)
+
+
+# --- CLIENT SIDE (inside the web worker) ---
+
+class _Runner:
+    def __init__(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = PROJECT_ROOT + os.pathsep + env.get('PYTHONPATH', '')
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "backend.services.execution.python_runner"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0, env=env
+        )
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, code, input_str, timeout):
+        _write_message(self.process.stdin.fileno(), {"code": code, "input": input_str or '', "timeout": timeout})
+        # The runner enforces the real timeout; this only guards against a wedged runner
+        return _read_message(self.process.stdout.fileno(), deadline=time.monotonic() + timeout + 5)
+
+    def run_batch(self, code, inputs, timeout):
+        _write_message(self.process.stdin.fileno(), {"op": "batch", "code": code, "inputs": inputs, "timeout": timeout})
+        deadline = time.monotonic() + len(inputs) * (timeout + HARNESS_GRACE_SECONDS) + 5
+        return _read_message(self.process.stdout.fileno(), deadline=deadline)['results']
+
+    def kill(self):
+        """Kills the runner and waits for it, so alive() is False from here on."""
+        self.process.kill()
+        self.process.wait()
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except Exception:
+            self.kill()
+
+
+class PythonRunnerPool:
+    """Fixed-size pool of warm runners. Thread-safe; each runner serves one run at a time."""
+    def __init__(self, size):
+        self.size = size
+        self._idle = []
+        self._cond = threading.Condition()
+        self._started = 0
+        self._closed = False
+
+    def _acquire(self):
+        with self._cond:
+            while True:
+                while self._idle:
+                    runner = self._idle.pop()
+                    if runner.alive(): return runner
+                    runner.close(); self._started -= 1
+                if self._started < self.size:
+                    self._started += 1
+                    break
+                self._cond.wait()
+        # Start outside the lock so other threads can hand back runners meanwhile
+        try: return _Runner()
+        except Exception as e:
+            with self._cond:
+                self._started -= 1
+                self._cond.notify()
+            raise RunnerUnavailable(f"Could not start runner: {e}")
+
+    def _release(self, runner):
+        if runner.alive() and not self._closed:
+            with self._cond:
+                self._idle.append(runner)
+                self._cond.notify()
+            return
+        runner.close()
+        replacement = None
+        if not self._closed:
+            # Keep the pool warm: the next run should not pay for a cold start
+            try: replacement = _Runner()
+            except Exception: pass
+        with self._cond:
+            if replacement is None: self._started -= 1
+            else: self._idle.append(replacement)
+            self._cond.notify()
+
+    def run(self, code, input_str, timeout=5):
+        return self._call(lambda runner: runner.run(code, input_str, timeout))
+
+    def run_batch(self, code, inputs, timeout=5):
+        """
+        Harness mode: one process loads the code once and runs it per input with swapped
+        stdin/stdout and a fresh namespace. Returns results aligned with inputs; None
+        entries must be re-run with run().
+        """
+        return self._call(lambda runner: runner.run_batch(code, inputs, timeout))
+
+    def _call(self, request):
+        runner = self._acquire()
+        try:
+            result = request(runner)
+        except (OSError, EOFError, TimeoutError, ValueError) as e:
+            runner.kill()
+            self._release(runner)
+            raise RunnerUnavailable(str(e))
+        self._release(runner)
+        return result
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+            self._cond.notify_all()
+        for runner in idle: runner.close()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_runner_pool():
+    """
+    Returns the process-wide runner pool, or None when warm runners are disabled
+    (PYTHON_RUNNER_POOL_SIZE=0) or unsupported on this platform.
+    """
+    global _pool, _pool_pid
+    size = int(os.environ.get("PYTHON_RUNNER_POOL_SIZE", "4"))
+    if size <= 0 or not hasattr(os, 'fork'): return None
+    with _pool_lock:
+        # A forked web worker must not share the parent's runner pipes
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = PythonRunnerPool(size)
+            _pool_pid = os.getpid()
+            atexit.register(_pool.close)
+        return _pool
+
+def reset_runner_pool():
+    """Closes the process-wide pool; the next get_runner_pool() starts fresh (cold) runners."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool and _pool_pid == os.getpid(): pool.close()
+
+
+if __name__ == "__main__":
+    serve()
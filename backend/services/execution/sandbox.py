@@ -0,0 +1,140 @@
+"""
+Resource limits, bounded output capture and resource accounting for child processes.
+
+Shared by run_command (subprocess path) and the warm Python runner (forked children),
+so every run gets the same caps and reports the same numbers. Also the check for
+the private directories that hold files the engine later executes. Stdlib only: the
+runner imports this module inside its own interpreter.
+"""
+import os
+import math
+import stat
+import time
+import select
+import signal
+import resource
+
+TIMEOUT_ERROR = "Execution Timed Out (Possible Infinite Loop)"
+OUTPUT_LIMIT_ERROR = "Output Limit Exceeded"
+
+# Hard cap per stream; a run that prints more is killed on the spot
+MAX_OUTPUT_BYTES = int(os.environ.get("EXEC_MAX_OUTPUT_KB", "1024")) * 1024
+MEMORY_LIMIT_BYTES = int(os.environ.get("EXEC_MEMORY_LIMIT_MB", "256")) * 1024 * 1024
+OPEN_FILES_LIMIT = int(os.environ.get("EXEC_OPEN_FILES_LIMIT", "64"))
+
+def apply_limits(cpu_seconds, memory_bytes=MEMORY_LIMIT_BYTES, open_files=OPEN_FILES_LIMIT):
+    """
+    Sets rlimits on the current process. Call in a child forked from a single-threaded
+    process (the warm runner); threaded callers use limit_command instead.
+    """
+    if cpu_seconds:
+        cpu = math.ceil(cpu_seconds)
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    if memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    if open_files:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (open_files, open_files))
+
+def limit_command(command, cpu_seconds, memory_bytes=MEMORY_LIMIT_BYTES, open_files=OPEN_FILES_LIMIT):
+    """
+    Same limits as apply_limits, as an argv: a /bin/sh wrapper sets them and execs command
+    (same pid, so wait4 accounting still sees the program). Unlike a preexec_fn this is
+    safe to start from threads.
+    """
+    steps = []
+    if cpu_seconds:
+        cpu = math.ceil(cpu_seconds)
+        steps += [f"ulimit -St {cpu}", f"ulimit -Ht {cpu + 1}"]
+    if memory_bytes:
+        steps.append(f"ulimit -v {memory_bytes // 1024}")
+    if open_files:
+        steps.append(f"ulimit -n {open_files}")
+    return ["/bin/sh", "-c", " && ".join(steps + ['exec "$@"']), "sh", *command]
+
+def private_dir(path):
+    """
+    Creates path (mode 0700) if needed. True if it is a real directory owned by this user
+    that nobody else can write to, so no other local user can plant or swap files in it.
+    """
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.geteuid() and not st.st_mode & 0o022
+
+def usage_report(rusage, wall_time):
+    """CPU seconds, wall seconds and peak RSS (KB) of a finished child."""
+    return {
+        "cpu_time": round(rusage.ru_utime + rusage.ru_stime, 4),
+        "wall_time": round(wall_time, 4),
+        "peak_memory_kb": rusage.ru_maxrss
+    }
+
+def kill_group(pid):
+    try: os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        try: os.kill(pid, signal.SIGKILL)
+        except OSError: pass
+
+def collect(pid, stdin_fd, stdout_fd, stderr_fd, input_bytes, timeout, max_output=MAX_OUTPUT_BYTES, close=os.close):
+    """
+    communicate() replacement: feeds stdin and streams stdout/stderr with a hard byte cap
+    per stream and a wall-clock deadline, killing the child (and its process group) as
+    soon as either is exceeded. Reaps the child with wait4 to report its resource usage.
+    Returns the usual run dict plus the usage_report fields.
+    stdin_fd is closed here; the output fds are left to the caller.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    outputs = {stdout_fd: [], stderr_fd: []}
+    sizes = {stdout_fd: 0, stderr_fd: 0}
+    readers = [stdout_fd, stderr_fd]
+    writers = [stdin_fd] if input_bytes else []
+    if not input_bytes: close(stdin_fd)
+    failure = None
+    try:
+        while readers or writers:
+            wait = deadline - time.monotonic()
+            if wait <= 0: failure = TIMEOUT_ERROR; break
+            ready_r, ready_w, _ = select.select(readers, writers, [], wait)
+            for fd in ready_w:
+                try:
+                    sent = os.write(fd, input_bytes[:65536])
+                    input_bytes = input_bytes[sent:]
+                except BrokenPipeError:
+                    input_bytes = b""
+                if not input_bytes:
+                    writers.remove(fd); close(fd)
+            for fd in ready_r:
+                chunk = os.read(fd, 65536)
+                if not chunk: readers.remove(fd); continue
+                sizes[fd] += len(chunk)
+                if sizes[fd] > max_output: failure = OUTPUT_LIMIT_ERROR; break
+                outputs[fd].append(chunk)
+            if failure: break
+    finally:
+        for fd in writers: close(fd)
+
+    # Output pipes closed; the child may still be running (e.g. it closed stdout)
+    while not failure:
+        done, status, rusage = os.wait4(pid, os.WNOHANG)
+        if done: break
+        if time.monotonic() >= deadline: failure = TIMEOUT_ERROR; break
+        time.sleep(0.002)
+    if failure:
+        kill_group(pid)
+        _, status, rusage = os.wait4(pid, 0)
+    wall_time = time.monotonic() - start
+
+    if failure:
+        result = {"success": False, "output": "", "error": failure, "timeout": failure == TIMEOUT_ERROR}
+    else:
+        result = {
+            "success": os.waitstatus_to_exitcode(status) == 0,
+            "output": b"".join(outputs[stdout_fd]).decode('utf-8', errors='replace').strip(),
+            "error": b"".join(outputs[stderr_fd]).decode('utf-8', errors='replace').strip(),
+            "timeout": False
+        }
+    result.update(usage_report(rusage, wall_time))
+    return result
@@ -0,0 +1,144 @@
+"""
+Pool of per-run scratch directories for the execution engine.
+
+Source files, uncached build outputs and the working directory of every student
+run live here instead of the project root. The root defaults to /dev/shm (RAM
+backed) when available. Directories are emptied and reused rather than created
+per run; their names start with the owning pid, so sweep() can delete the ones
+left behind by a worker that crashed.
+
+Student files are executed from here, so the root is per user and must be
+private (0700, owned by this user) and every directory is created 0700 by this
+process. When the root is not private, runs get directories from
+tempfile.mkdtemp instead.
+"""
+import os
+import stat
+import time
+import shutil
+import atexit
+import tempfile
+import threading
+from contextlib import contextmanager
+from backend.core.logger import logger
+from backend.services.execution.sandbox import private_dir
+
+def _default_root():
+    shm = "/dev/shm"
+    base = shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else tempfile.gettempdir()
+    return os.path.join(base, f"structogram_work-{os.geteuid()}")
+
+WORKSPACE_ROOT = os.environ.get("EXEC_WORKSPACE_DIR") or _default_root()
+# Idle directories kept for reuse per process
+POOL_SIZE = int(os.environ.get("EXEC_WORKSPACE_POOL_SIZE", "16"))
+SWEEP_INTERVAL_SECONDS = 600
+
+_lock = threading.Lock()
+_free = []
+_owned = set()
+_counter = 0
+_pool_pid = None
+_last_sweep = 0.0
+_trusted_root = None
+_refused_root = None
+
+def _pid_alive(pid):
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except PermissionError: return True
+    return True
+
+def sweep():
+    """Removes scratch directories whose owning process no longer exists. Returns how many."""
+    removed = 0
+    try: names = os.listdir(WORKSPACE_ROOT)
+    except FileNotFoundError: return 0
+    for name in names:
+        owner = name.split("-", 1)[0]
+        if not owner.isdigit() or _pid_alive(int(owner)): continue
+        shutil.rmtree(os.path.join(WORKSPACE_ROOT, name), ignore_errors=True)
+        removed += 1
+    if removed: logger.info(f"Removed {removed} orphaned scratch directories")
+    return removed
+
+def _root_is_private():
+    """Creates WORKSPACE_ROOT (0700) if needed and checks nobody else can touch files in it."""
+    global _trusted_root, _refused_root
+    if _trusted_root == WORKSPACE_ROOT: return True
+    if private_dir(WORKSPACE_ROOT):
+        _trusted_root = WORKSPACE_ROOT
+        return True
+    if _refused_root != WORKSPACE_ROOT:
+        _refused_root = WORKSPACE_ROOT
+        logger.error(f"Scratch root {WORKSPACE_ROOT} must be a directory owned by this user and not writable by others; using private temp directories")
+    return False
+
+def _make_dir(path):
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        st = os.lstat(path)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.geteuid():
+            raise PermissionError(f"Scratch directory {path} already exists and is not ours")
+        # Left behind by an earlier process that had the same pid
+        shutil.rmtree(path)
+        os.mkdir(path, 0o700)
+
+def _reset_after_fork():
+    # A forked web worker must not share directories with its parent
+    global _pool_pid, _counter
+    _free.clear(); _owned.clear(); _counter = 0
+    _pool_pid = os.getpid()
+
+def acquire():
+    """Returns an empty scratch directory owned by this process."""
+    global _counter, _last_sweep
+    with _lock:
+        if _pool_pid != os.getpid(): _reset_after_fork()
+        private = _root_is_private()
+        if private and (time.monotonic() - _last_sweep > SWEEP_INTERVAL_SECONDS or not _last_sweep):
+            _last_sweep = time.monotonic()
+            sweep()
+        if _free: return _free.pop()
+        _counter += 1
+        path = os.path.join(WORKSPACE_ROOT, f"{os.getpid()}-{_counter}") if private else None
+    if path: _make_dir(path)
+    else: path = tempfile.mkdtemp(prefix=f"structogram_work-{os.getpid()}-")
+    with _lock: _owned.add(path)
+    return path
+
+def _empty(path):
+    for name in os.listdir(path):
+        target = os.path.join(path, name)
+        if os.path.isdir(target) and not os.path.islink(target): shutil.rmtree(target, ignore_errors=True)
+        else: os.remove(target)
+
+def release(path):
+    """Empties a directory from acquire() and returns it to the pool (or deletes it when the pool is full)."""
+    try:
+        _empty(path)
+    except OSError as e:
+        logger.warning(f"Could not empty scratch directory {path}: {e}")
+        shutil.rmtree(path, ignore_errors=True)
+        with _lock: _owned.discard(path)
+        return
+    with _lock:
+        if path in _owned and len(_free) < POOL_SIZE and _pool_pid == os.getpid():
+            _free.append(path)
+            return
+        _owned.discard(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+@contextmanager
+def scratch():
+    """with scratch() as path: ... — the directory is released however the block exits."""
+    path = acquire()
+    try:
+        yield path
+    finally:
+        release(path)
+
+@atexit.register
+def _cleanup():
+    if _pool_pid != os.getpid(): return
+    for path in list(_owned): shutil.rmtree(path, ignore_errors=True)
@@ -6,6 +6,12 @@ from backend.core.api_utils import post_with_retries # Updated Import
 API_KEY = os.environ.get("GEMINI_API_KEY")
 API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={API_KEY}"
 
+class AIGradingError(Exception):
+    """No grade could be obtained (missing key, API error, unusable response); the job should be retried."""
+
+# Feedback that earlier versions stored as a score-0 grade when the AI call failed (LIKE patterns)
+LEGACY_FAILURE_FEEDBACK = ["System Error: AI Key Missing%", "AI Grading Failed:%"]
+
 # --- THESIS-LEVEL GRADING SCHEMA ---
 GRADING_SCHEMA = {
     "type": "OBJECT",
@@ -45,8 +51,9 @@ GRADING_SCHEMA = {
 }
 
 def grade_with_ai(student_code: str, template_code: str, assignment_prompt: str, custom_grading_instructions: str = "") -> dict:
+    """The AI grade of the student's code. Raises AIGradingError instead of returning a made-up score."""
     if not API_KEY:
-        return {"score": 0, "feedback": "System Error: AI Key Missing", "is_correct": False, "logic_errors": []}
+        raise AIGradingError("AI Key Missing")
     
     # --- UPDATED: STRICTER SYSTEM PROMPT ---
     system_prompt = (
@@ -87,7 +94,7 @@ def grade_with_ai(student_code: str, template_code: str, assignment_prompt: str,
     }
 
     try:
-        response = post_with_retries(API_URL, payload, headers={"Content-Type": "application/json"})
+        response = post_with_retries(API_URL, payload, headers={"Content-Type": "application/json"}, operation="grading")
         data = json.loads(response.json()['candidates'][0]['content']['parts'][0]['text'])
         
         # Flatten for frontend compatibility while keeping deep data
@@ -99,9 +106,4 @@ def grade_with_ai(student_code: str, template_code: str, assignment_prompt: str,
         
     except Exception as e:
         print(f"AI Error: {e}")
-        return {
-            "score": 0, 
-            "feedback": f"AI Grading Failed: {str(e)}", 
-            "is_correct": False, 
-            "logic_errors": ["AI Service Error"]
-        }
\ No newline at end of file
+        raise AIGradingError(f"AI Grading Failed: {e}") from e
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+In-process cache of assignment rows and their reference templates.
+
+During an exam most submissions hit the same few assignments, so the row and
+the template file are kept in memory instead of being re-read per submission.
+A trigger announces every update or delete of an assignment with
+NOTIFY assignment_changes, '<id>', whoever makes it; each process keeps one
+LISTEN connection on a background thread that drops its copies of that id, so
+a hit costs no query at all. Whenever the listener is not connected (it is
+starting, or lost its connection and may have missed notifications) lookups
+fall back to asking Postgres for the assignment's version, which updates bump;
+created_at is compared too, so a recreated row that reuses an id is not
+mistaken for the old one. The cache is cleared each time the listener
+(re)connects. Entries are also dropped after ASSIGNMENT_CACHE_TTL_SECONDS.
+"""
+import os
+import time
+import select
+import hashlib
+import threading
+import psycopg2
+from backend.core.database import DB_CONFIG
+from backend.core.logger import logger
+
+ENABLED = os.environ.get("ASSIGNMENT_CACHE_ENABLED", "1") != "0"
+TTL_SECONDS = int(os.environ.get("ASSIGNMENT_CACHE_TTL_SECONDS", "300"))
+MAX_ENTRIES = int(os.environ.get("ASSIGNMENT_CACHE_MAX_ENTRIES", "256"))
+CHANNEL = "assignment_changes"
+RECONNECT_SECONDS = 5
+
+_lock = threading.RLock()
+# assignment id -> {"token", "row", "loaded_at"}
+_rows = {}
+# (assignment id, token) -> {"data", "hash", "loaded_at"}
+_templates = {}
+# Bumped by every invalidation: a row read while it changed is not stored
+_invalidations = 0
+_listening = False
+_listener = None
+
+def _token(row):
+    return (row.get('version'), row.get('created_at'))
+
+def _fresh(entry):
+    return time.monotonic() - entry['loaded_at'] < TTL_SECONDS
+
+def _trim(cache):
+    # Oldest first; the cache is small so a sort on overflow is fine
+    for key in sorted(cache, key=lambda k: cache[k]['loaded_at'])[:len(cache) - MAX_ENTRIES]:
+        del cache[key]
+
+def invalidate(assignment_id):
+    """Drops the local copies of one assignment (other processes are notified by the trigger)."""
+    global _invalidations
+    with _lock:
+        _invalidations += 1
+        _rows.pop(assignment_id, None)
+        for key in [k for k in _templates if k[0] == assignment_id]: del _templates[key]
+
+def clear():
+    global _invalidations
+    with _lock:
+        _invalidations += 1
+        _rows.clear(); _templates.clear()
+
+def _set_listening(value):
+    global _listening
+    with _lock:
+        # Notifications may have been missed while no listener was connected
+        if value: clear()
+        _listening = value
+
+def _listen_forever():
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(**DB_CONFIG)
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {CHANNEL}")
+            _set_listening(True)
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []): continue
+                conn.poll()
+                for note in conn.notifies:
+                    try: invalidate(int(note.payload))
+                    except ValueError: continue
+                conn.notifies.clear()
+        except Exception as e:
+            _set_listening(False)
+            logger.warning(f"Assignment cache listener disconnected: {e}; checking versions per lookup")
+            time.sleep(RECONNECT_SECONDS)
+        finally:
+            if conn is not None:
+                try: conn.close()
+                except Exception: pass
+
+def _ensure_listener():
+    global _listener
+    with _lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen_forever, name="assignment-cache-listener", daemon=True)
+            _listener.start()
+
+def get_assignment(cur, assignment_id):
+    """The assignment row (a dict) or None. Expects a RealDictCursor."""
+    if not ENABLED:
+        cur.execute("SELECT * FROM assignments WHERE id = %s", (assignment_id,))
+        return cur.fetchone()
+    _ensure_listener()
+    with _lock:
+        entry = _rows.get(assignment_id)
+        listening, generation = _listening, _invalidations
+        if listening and entry and _fresh(entry):
+            return dict(entry['row'])
+    if not listening:
+        cur.execute("SELECT version, created_at FROM assignments WHERE id = %s", (assignment_id,))
+        current = cur.fetchone()
+        if not current:
+            invalidate(assignment_id)
+            return None
+        if entry and entry['token'] == _token(current) and _fresh(entry):
+            return dict(entry['row'])
+
+    cur.execute("SELECT * FROM assignments WHERE id = %s", (assignment_id,))
+    row = cur.fetchone()
+    if not row:
+        invalidate(assignment_id)
+        return None
+    with _lock:
+        unchanged = _invalidations == generation
+        if entry and entry['token'] != _token(row): invalidate(assignment_id)
+        if unchanged:
+            _rows[assignment_id] = {"token": _token(row), "row": dict(row), "loaded_at": time.monotonic()}
+            if len(_rows) > MAX_ENTRIES: _trim(_rows)
+    return dict(row)
+
+def _template_entry(assignment):
+    key = (assignment['id'], _token(assignment))
+    with _lock:
+        entry = _templates.get(key)
+        if entry and _fresh(entry): return entry
+    with open(assignment['template_path'], 'rb') as f: data = f.read()
+    entry = {"data": data, "hash": hashlib.sha256(data).hexdigest(), "loaded_at": time.monotonic()}
+    if ENABLED:
+        with _lock:
+            _templates[key] = entry
+            if len(_templates) > MAX_ENTRIES: _trim(_templates)
+    return entry
+
+def template_text(assignment):
+    """Contents of the assignment's reference template. Raises OSError if the file is missing."""
+    return _template_entry(assignment)['data'].decode('utf-8')
+
+def template_hash(assignment):
+    """sha256 of the reference template file, or None if it is missing."""
+    try: return _template_entry(assignment)['hash']
+    except OSError: return None
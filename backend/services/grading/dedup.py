@@ -0,0 +1,72 @@
+"""
+Upload deduplication: a student who re-uploads the same diagram bytes for an
+assignment whose grading configuration has not changed gets the earlier
+result instead of a new parse + Gemini call.
+
+Submissions store two hashes: content_hash (the uploaded bytes) and
+grading_config_hash (everything else the result depends on: the assignment's
+grading settings, its reference template and the submission options).
+"""
+import json
+import hashlib
+from backend.services.grading import assignment_cache, plagiarism_index
+from backend.services.grading.ai_grader import LEGACY_FAILURE_FEEDBACK
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def grading_config_hash(assignment, options):
+    """Hash of the assignment grading configuration, its template file and the submission options."""
+    config = {key: assignment.get(key) for key in (
+        'language', 'grading_type', 'grading_prompt', 'description', 'test_cases',
+        'static_analysis_enabled', 'plagiarism_check_enabled'
+    )}
+    config['template'] = assignment_cache.template_hash(assignment)
+    config['options'] = options
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def find_previous(cur, assignment_id, student_id, upload_hash, config_hash):
+    """
+    Latest earlier submission of the same bytes under the same configuration that is
+    either graded or still waiting in the queue. Results whose grading stage did not
+    finish cleanly, or that are a failed AI call stored as a grade, are never reused. Returns {"submission_id", "job_id", "status",
+    "result"} or None. Expects a RealDictCursor.
+    """
+    cur.execute("""
+        SELECT s.id AS submission_id, j.id AS job_id, j.status, j.result
+        FROM submissions s JOIN grading_jobs j ON j.submission_id = s.id
+        WHERE s.assignment_id = %s AND s.student_id = %s AND s.content_hash = %s AND s.grading_config_hash = %s
+          AND (j.status IN ('queued', 'running') OR (j.status = 'done' AND j.result->'stages'->'grading'->>'status' = 'ok'
+                                                     AND NOT COALESCE(j.result->'grading_result'->>'feedback' LIKE ANY(%s), FALSE)))
+        ORDER BY s.created_at DESC, j.id DESC
+        LIMIT 1
+    """, (assignment_id, student_id, upload_hash, config_hash, LEGACY_FAILURE_FEEDBACK))
+    return cur.fetchone()
+
+def copy_submission(cur, previous_id):
+    """
+    Inserts a new submission row carrying the graded results of previous_id. Returns its id.
+    The row still points at the earlier file; the caller saves the upload for it and updates file_path.
+    """
+    cur.execute("""
+        INSERT INTO submissions (assignment_id, student_id, file_path, original_filename, submission_mode, diagram_type,
+                                 generated_code, grading_result, complexity, plagiarism_score, static_analysis_report,
+                                 test_results, content_hash, grading_config_hash, reused_from, minhash, graph_signature, graph_size,
+                                 fingerprint_count, plagiarism_matches, tokens)
+        SELECT assignment_id, student_id, file_path, original_filename, submission_mode, diagram_type,
+               generated_code, grading_result, complexity, plagiarism_score, static_analysis_report,
+               test_results, content_hash, grading_config_hash, id, minhash, graph_signature, graph_size,
+               fingerprint_count, plagiarism_matches, tokens
+        FROM submissions WHERE id = %s
+        RETURNING id, assignment_id, student_id
+    """, (previous_id,))
+    copy = cur.fetchone()
+    new_id = copy['id']
+    # The copy is indexed for the plagiarism check like the original
+    cur.execute("""INSERT INTO plagiarism_lsh_bands (assignment_id, band, bucket, submission_id)
+                   SELECT assignment_id, band, bucket, %s FROM plagiarism_lsh_bands WHERE submission_id = %s""", (new_id, previous_id))
+    cur.execute("""INSERT INTO plagiarism_fingerprints (assignment_id, hash, submission_id, start_line, end_line)
+                   SELECT assignment_id, hash, %s, start_line, end_line FROM plagiarism_fingerprints WHERE submission_id = %s""", (new_id, previous_id))
+    # Not a new document for the token frequencies: the student still counts once, now with the copy's tokens
+    plagiarism_index.sync_student_tokens(cur, copy['assignment_id'], copy['student_id'])
+    return new_id
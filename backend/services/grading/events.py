@@ -0,0 +1,168 @@
+"""
+Grading progress events (table grading_events) for the /grading-jobs/<id>/events stream.
+
+The grading workers publish an event as each step of a job finishes
+(code generated, complexity, tests, plagiarism, AI grade, done/failed). Every
+event is stored, so a client that connects late or reconnects with
+Last-Event-ID gets exactly what it missed, and is announced with
+NOTIFY grading_events, '<job id>'.
+
+Each web process keeps one LISTEN connection on a background thread and wakes
+the streams waiting on that job, so open streams cost a sleeping thread, not
+a database connection or a polling loop. Streams also re-check the table every
+POLL_SECONDS, so a lost notification only delays an event. A stream is closed
+after STREAM_SECONDS; the client reconnects and resumes from its last event id.
+
+Each open stream still holds a server thread, so a process serves at most
+MAX_STREAMS of them at once; beyond that open_stream refuses and the client
+polls the job instead, leaving the remaining threads for ordinary requests.
+"""
+import os
+import json
+import time
+import select
+import threading
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from backend.core.database import get_db_connection, release_db_connection, DB_CONFIG
+from backend.core.logger import logger
+
+CHANNEL = "grading_events"
+STREAM_SECONDS = int(os.environ.get("GRADING_EVENTS_STREAM_SECONDS", "55"))
+POLL_SECONDS = float(os.environ.get("GRADING_EVENTS_POLL_SECONDS", "5"))
+TTL_HOURS = int(os.environ.get("GRADING_EVENTS_TTL_HOURS", "24"))
+# Keep this well below the gunicorn thread count (run.sh)
+MAX_STREAMS = int(os.environ.get("GRADING_EVENTS_MAX_STREAMS", "8"))
+FINAL_EVENTS = ("done", "failed")
+
+_cond = threading.Condition()
+# job id -> open streams, and job id -> notifications seen while they are open
+_waiting = {}
+_notified = {}
+_listener = None
+_stream_slots = threading.BoundedSemaphore(max(1, MAX_STREAMS))
+
+def publish(job_id, event, data=None):
+    """Stores and announces one event. Best effort: a failure is logged and grading goes on."""
+    conn = get_db_connection()
+    if not conn: return
+    try:
+        cur = conn.cursor()
+        cur.execute("INSERT INTO grading_events (job_id, event, data) VALUES (%s, %s, %s)", (job_id, event, json.dumps(data, default=str)))
+        cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, str(job_id)))
+        conn.commit(); cur.close()
+    except Exception as e:
+        conn.rollback(); logger.warning(f"Could not publish grading event '{event}' for job {job_id}: {e}")
+    finally: release_db_connection(conn)
+
+def fetch(cur, job_id, after_id=0):
+    cur.execute("SELECT id, event, data FROM grading_events WHERE job_id = %s AND id > %s ORDER BY id", (job_id, after_id))
+    return cur.fetchall()
+
+def prune(cur):
+    """Deletes events older than TTL_HOURS. Returns how many."""
+    cur.execute("DELETE FROM grading_events WHERE created_at < NOW() - %s * INTERVAL '1 hour'", (TTL_HOURS,))
+    return cur.rowcount
+
+# --- Listener (one per web process) ---
+
+def _listen_forever():
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(**DB_CONFIG)
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {CHANNEL}")
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []): continue
+                conn.poll()
+                if not conn.notifies: continue
+                with _cond:
+                    for note in conn.notifies:
+                        try: job_id = int(note.payload)
+                        except ValueError: continue
+                        if job_id in _waiting: _notified[job_id] = _notified.get(job_id, 0) + 1
+                    conn.notifies.clear()
+                    _cond.notify_all()
+        except Exception as e:
+            logger.warning(f"Grading event listener disconnected: {e}; streams fall back to polling")
+            time.sleep(POLL_SECONDS)
+        finally:
+            if conn is not None:
+                try: conn.close()
+                except Exception: pass
+
+def _ensure_listener():
+    global _listener
+    with _cond:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen_forever, name="grading-events-listener", daemon=True)
+            _listener.start()
+
+def _format(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def _load(job_id, after_id):
+    """(new events, job row) read on a short-lived pooled connection."""
+    conn = get_db_connection()
+    if not conn: return [], None
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        rows = fetch(cur, job_id, after_id)
+        cur.execute("SELECT status, result, error FROM grading_jobs WHERE id = %s", (job_id,))
+        job = cur.fetchone()
+        conn.commit()
+        return rows, job
+    finally: cur.close(); release_db_connection(conn)
+
+class _SlotStream:
+    """Iterates a stream and frees its slot on close(), which the WSGI server calls even if iteration never started."""
+    def __init__(self, messages):
+        self.messages = messages; self.closed = False
+    def __iter__(self): return self
+    def __next__(self): return next(self.messages)
+    def close(self):
+        if self.closed: return
+        self.closed = True
+        try: self.messages.close()
+        finally: _stream_slots.release()
+
+def open_stream(job_id, after_id=0):
+    """stream() for the response body, or None when MAX_STREAMS streams are already open in this process."""
+    if not _stream_slots.acquire(blocking=False): return None
+    return _SlotStream(stream(job_id, after_id))
+
+def stream(job_id, after_id=0):
+    """
+    Generator of SSE messages for one job, starting after event id after_id.
+    Ends after the final event (done/failed) or after STREAM_SECONDS.
+    """
+    _ensure_listener()
+    deadline = time.monotonic() + STREAM_SECONDS
+    with _cond: _waiting[job_id] = _waiting.get(job_id, 0) + 1
+    try:
+        yield "retry: 2000\n\n"
+        while True:
+            with _cond: seen = _notified.get(job_id, 0)
+            rows, job = _load(job_id, after_id)
+            for row in rows:
+                after_id = row['id']
+                yield _format(row['id'], row['event'], row['data'])
+                if row['event'] in FINAL_EVENTS: return
+            if job is None:
+                yield _format(after_id, "failed", {"error": "Job not found"}); return
+            # Finished without a stored final event (e.g. a reused result): report it from the job row
+            if job['status'] in FINAL_EVENTS and not rows:
+                data = {"result": job['result']} if job['status'] == 'done' else {"error": job['error']}
+                yield _format(after_id, job['status'], data); return
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: return
+            with _cond:
+                woken = _cond.wait_for(lambda: _notified.get(job_id, 0) != seen, timeout=min(POLL_SECONDS, remaining))
+            # Comment lines keep proxies from closing an idle connection
+            if not woken: yield ": keep-alive\n\n"
+    finally:
+        with _cond:
+            _waiting[job_id] -= 1
+            if not _waiting[job_id]: del _waiting[job_id]; _notified.pop(job_id, None)
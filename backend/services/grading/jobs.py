@@ -0,0 +1,100 @@
+"""
+Postgres-backed grading job queue (table grading_jobs).
+
+The /submit route saves the submission and enqueues a job in the same
+transaction; grading workers (backend.services.grading.worker) claim jobs with
+FOR UPDATE SKIP LOCKED, so any number of workers can drain the queue without
+handing the same job out twice. A job whose worker died stays 'running' until
+its lease expires and is then claimed again, up to MAX_ATTEMPTS times. A job
+whose grading stage failed (e.g. the AI call timed out) goes back to the queue
+and waits RETRY_DELAY_SECONDS times its attempt count before it is claimed again.
+
+Re-grade jobs (regrade_run_id set, see regrade.py) yield to student
+submissions and are throttled across all workers: at most REGRADE_MAX_RUNNING
+run at once and at most REGRADE_JOBS_PER_MINUTE start per minute, which bounds
+the AI calls a bulk re-grade makes. Two workers claiming at the same instant
+can overshoot either limit by one job each.
+"""
+import os
+import json
+import socket
+
+# A running job not finished within this many seconds is assumed abandoned
+LEASE_SECONDS = int(os.environ.get("GRADING_JOB_LEASE_SECONDS", "600"))
+MAX_ATTEMPTS = int(os.environ.get("GRADING_JOB_MAX_ATTEMPTS", "3"))
+RETRY_DELAY_SECONDS = int(os.environ.get("GRADING_JOB_RETRY_DELAY_SECONDS", "30"))
+REGRADE_MAX_RUNNING = int(os.environ.get("REGRADE_MAX_RUNNING", "2"))
+REGRADE_JOBS_PER_MINUTE = int(os.environ.get("REGRADE_JOBS_PER_MINUTE", "30"))
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def enqueue(cur, submission_id, assignment_id, student_id, payload):
+    """Inserts a queued job on the caller's cursor (commit is up to the caller). Returns the job id."""
+    cur.execute("""INSERT INTO grading_jobs (submission_id, assignment_id, student_id, payload) VALUES (%s, %s, %s, %s) RETURNING id""",
+                (submission_id, assignment_id, student_id, json.dumps(payload)))
+    row = cur.fetchone()
+    return row['id'] if isinstance(row, dict) else row[0]
+
+def record_done(cur, submission_id, assignment_id, student_id, payload, result):
+    """Inserts an already finished job (a result reused without grading). Returns the job id."""
+    cur.execute("""INSERT INTO grading_jobs (submission_id, assignment_id, student_id, payload, status, result, started_at, finished_at)
+                   VALUES (%s, %s, %s, %s, 'done', %s, NOW(), NOW()) RETURNING id""",
+                (submission_id, assignment_id, student_id, json.dumps(payload), json.dumps(result)))
+    row = cur.fetchone()
+    return row['id'] if isinstance(row, dict) else row[0]
+
+def claim_job(cur, worker=None):
+    """
+    Marks the oldest claimable job as running and returns it (a dict), or None when the queue is empty.
+    Expects a RealDictCursor; commit right after so other workers see the claim.
+    """
+    cur.execute("""
+        UPDATE grading_jobs SET status = 'running', started_at = NOW(), attempts = attempts + 1, worker = %(worker)s
+        WHERE id = (
+            SELECT id FROM grading_jobs
+            WHERE attempts < %(max_attempts)s AND (status = 'queued' OR (status = 'running' AND started_at < NOW() - %(lease)s * INTERVAL '1 second'))
+              AND (run_after IS NULL OR run_after <= NOW())
+              AND (regrade_run_id IS NULL OR (
+                  (SELECT COUNT(*) FROM grading_jobs r WHERE r.regrade_run_id IS NOT NULL AND r.status = 'running'
+                      AND r.started_at >= NOW() - %(lease)s * INTERVAL '1 second') < %(regrade_running)s
+                  AND (SELECT COUNT(*) FROM grading_jobs r WHERE r.regrade_run_id IS NOT NULL
+                      AND r.started_at >= NOW() - INTERVAL '1 minute') < %(regrade_per_minute)s))
+            ORDER BY regrade_run_id IS NOT NULL, created_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+    """, {"worker": worker or worker_name(), "max_attempts": MAX_ATTEMPTS, "lease": LEASE_SECONDS,
+          "regrade_running": REGRADE_MAX_RUNNING, "regrade_per_minute": REGRADE_JOBS_PER_MINUTE})
+    return cur.fetchone()
+
+def expire_abandoned(cur):
+    """Fails running jobs whose lease ran out on their last attempt. Returns how many."""
+    cur.execute("""
+        UPDATE grading_jobs SET status = 'failed', finished_at = NOW(), error = 'Grading worker stopped responding'
+        WHERE status = 'running' AND attempts >= %s AND started_at < NOW() - %s * INTERVAL '1 second'
+    """, (MAX_ATTEMPTS, LEASE_SECONDS))
+    return cur.rowcount
+
+def complete_job(cur, job_id, result):
+    cur.execute("UPDATE grading_jobs SET status = 'done', finished_at = NOW(), result = %s, error = NULL WHERE id = %s",
+                (json.dumps(result), job_id))
+
+def fail_job(cur, job_id, error):
+    cur.execute("UPDATE grading_jobs SET status = 'failed', finished_at = NOW(), error = %s WHERE id = %s", (error, job_id))
+
+def retry_job(cur, job, error):
+    """Queues a claimed job again after a delay, or fails it on its last attempt. Returns True when it will be retried."""
+    if job['attempts'] >= MAX_ATTEMPTS:
+        fail_job(cur, job['id'], error)
+        return False
+    cur.execute("""UPDATE grading_jobs SET status = 'queued', error = %s, run_after = NOW() + %s * INTERVAL '1 second' WHERE id = %s""",
+                (error, RETRY_DELAY_SECONDS * job['attempts'], job['id']))
+    return True
+
+def get_job(cur, job_id):
+    """The job row plus the creator of its assignment (for permission checks), or None."""
+    cur.execute("""SELECT j.*, a.creator_id AS assignment_creator_id FROM grading_jobs j
+                   LEFT JOIN assignments a ON a.id = j.assignment_id WHERE j.id = %s""", (job_id,))
+    return cur.fetchone()
@@ -0,0 +1,210 @@
+"""
+Grading pipeline for one saved submission: parse the diagram, analyse and test
+the generated code, check plagiarism, grade, and store the outcome.
+Runs inside the grading workers (see worker.py), not in the web request.
+"""
+import os
+import json
+
+from backend.services.parsers.flowchart import parse_drawio_xml as parse_flowchart
+from backend.services.parsers.nassi import parse_nassi_shneiderman_xml as parse_ns
+from backend.services.parsers.image import parse_image_diagram
+from backend.services.parsers.document import load_document
+from backend.services.grading.ai_grader import grade_with_ai
+from backend.services.grading.static_analysis import analyze_code_style
+from backend.services.grading.keyword import grade_with_keywords
+from backend.services.analysis.complexity import calculate_cyclomatic_complexity
+from backend.services.analysis.plagiarism import detect_plagiarism_batch, wl_histogram, normalize_code
+from backend.services.analysis import minhash, winnowing
+from backend.services.analysis.cfg import analyze_flowchart_cfg
+from backend.services.execution.engine import run_test_cases
+from backend.services.grading.stages import run_stage_graph
+from backend.services.grading import assignment_cache, dedup, plagiarism_index
+from backend.core import metrics
+
+# Seconds each stage may take before its result is given up on
+STAGE_TIMEOUTS = {
+    "static_analysis": int(os.environ.get("GRADING_STATIC_ANALYSIS_TIMEOUT", "30")),
+    "plagiarism": int(os.environ.get("GRADING_PLAGIARISM_TIMEOUT", "60")),
+    "tests": int(os.environ.get("GRADING_TESTS_TIMEOUT", "120")),
+    "grading": int(os.environ.get("GRADING_AI_TIMEOUT", "180")),
+}
+
+
+class SubmissionRejected(Exception):
+    """The diagram produced code that must not be graded; the submission is discarded."""
+
+
+class GradingIncomplete(Exception):
+    """The grading stage failed or timed out; nothing was stored and the job should be retried."""
+
+
+def validate_code_safety(code, language):
+    forbidden_patterns = {
+        'python': ['import os', 'import sys', 'import subprocess', 'from os', 'from sys', 'exec(', 'eval(', 'open(', '__import__', 'os.system'],
+        'cpp': ['system(', 'popen(', 'fork(', 'execv', 'execl', '<cstdlib>'],
+        'java': ['Runtime.getRuntime', 'ProcessBuilder', 'System.exit']
+    }
+    patterns = forbidden_patterns.get(language, [])
+    for pattern in patterns:
+        if pattern in code:
+            return False, pattern
+    return True, None
+
+def _test_cases(assignment):
+    test_cases_data = assignment.get('test_cases')
+    if isinstance(test_cases_data, str):
+        try: test_cases_data = json.loads(test_cases_data)
+        except: pass
+    return test_cases_data if isinstance(test_cases_data, list) and len(test_cases_data) > 0 else None
+
+def _plagiarism_check(generated_code, graph_signature, candidates, structural):
+    """{"score", "submission_id" of the closest match, "matches": its matching line ranges, if known}."""
+    plagiarism_score, match_id = detect_plagiarism_batch(generated_code, graph_signature, candidates, structural)
+    matches = next((c.get('matches') for c in candidates if c['id'] == match_id), None)
+    return {"score": plagiarism_score, "submission_id": match_id, "matches": matches or []}
+
+def _grade(assignment, generated_code, template_code):
+    if assignment.get('grading_type') == 'keyword':
+        return grade_with_keywords(generated_code, assignment.get('grading_prompt', ''))
+    return grade_with_ai(generated_code, template_code, assignment['description'], assignment.get('grading_prompt', ''))
+
+def _stage_event(name, outcome):
+    """The progress event payload for a finished stage."""
+    value = outcome['value']
+    data = {"status": outcome['status'], "error": outcome['error'], "duration": outcome['duration']}
+    if name == "tests": data.update({"passed": value['passed'], "total": value['total']} if value else {})
+    elif name == "plagiarism": data["plagiarism_score"] = value['score'] if value else 0
+    elif name == "static_analysis": data["static_analysis"] = value
+    elif name == "grading": data["grading_result"] = value
+    return data
+
+def grade_submission(cur, assignment, submission, options, on_event=None, on_reads_done=None):
+    """
+    Grades a saved submission and writes the outcome to its row (commit is up to the caller).
+    on_reads_done(), if given, is called after the last read and before the stages run, so the
+    caller can end its transaction instead of holding it open across AI calls and test runs.
+    Raises GradingIncomplete, before writing anything, when the grading stage fails or times out.
+    options: the job payload {"is_image", "diagram_type", "description"}, plus "regrade": True for
+    bulk re-grade jobs, which reuse the stored generated_code when there is one instead of parsing the
+    diagram again (the flowchart CFG warnings are then left out of the feedback).
+    on_event(event, data), if given, is called as each step finishes: code_generated, complexity,
+    then static_analysis / plagiarism / tests / grading in whatever order they complete.
+    Returns the result payload shown to the student.
+    """
+    emit = on_event or (lambda event, data: None)
+    submission_path = submission['file_path']
+    target_language = assignment['language']
+    generated_code = ""; used_method = ""; complexity_score = 1
+    dead_code_report = []; uninit_vars_report = []; graph_signature = None
+
+    if options.get('regrade') and submission.get('generated_code'):
+        generated_code = submission['generated_code']
+        graph_signature = submission.get('graph_signature')
+        used_method = submission.get('diagram_type') or options.get('diagram_type')
+        complexity_score = submission.get('complexity') or calculate_cyclomatic_complexity(generated_code, language=target_language)
+    # --- TRUST FILE EXTENSION OVER USER INPUT ---
+    elif options.get('is_image'):
+        used_method = "ai_vision"
+        with metrics.time_stage("parse"):
+            generated_code = parse_image_diagram(submission_path, options.get('description'), language=target_language)
+        complexity_score = calculate_cyclomatic_complexity(generated_code, language=target_language)
+    else:
+        with metrics.time_stage("parse"):
+            # Parsed once; detection and the parsers share the in-memory document
+            document = load_document(submission_path)
+            used_method = options.get('diagram_type')
+            if used_method == 'auto': used_method = document.diagram_type()
+            if used_method == 'flowchart':
+                generated_code, nodes, edges, start_id = parse_flowchart(document, language=target_language, return_graph=True)
+            else:
+                generated_code = parse_ns(document, language=target_language)
+        if used_method == 'flowchart':
+            with metrics.time_stage("cfg"):
+                cfg_stats = analyze_flowchart_cfg(nodes, edges, start_id)
+            complexity_score = cfg_stats['cyclomatic_complexity']; dead_code_report = cfg_stats['dead_code_nodes']; uninit_vars_report = cfg_stats['uninitialized_vars']
+            graph_signature = wl_histogram(nodes, edges)
+        else:
+            complexity_score = calculate_cyclomatic_complexity(generated_code, language=target_language)
+
+    # --- SECURITY CHECK ---
+    is_safe, unsafe_keyword = validate_code_safety(generated_code, target_language)
+    if not is_safe:
+        raise SubmissionRejected(f"Security Violation: Your diagram produces code with forbidden keyword '{unsafe_keyword}'.")
+    emit("code_generated", {"generated_code": generated_code, "diagram_type": used_method, "language": target_language})
+    emit("complexity", {"complexity": complexity_score, "dead_code": dead_code_report, "uninitialized_vars": uninit_vars_report})
+
+    # Loaded before the stages start: they run on other threads and must not use the cursor.
+    # Only submissions sharing a fingerprint (or, for very short code, an LSH bucket) are scored;
+    # the reference template's fingerprints and tokens do not count.
+    code_signature = minhash.signature(generated_code)
+    code_prints = winnowing.fingerprints(generated_code)
+    code_tokens = normalize_code(generated_code)
+    candidates = []; structural = None
+    if assignment['plagiarism_check_enabled']:
+        template_tokens, template_prints = plagiarism_index.template_features(assignment)
+        lookup_prints = [p for p in code_prints if p[0] not in template_prints]
+        if lookup_prints: candidates = plagiarism_index.fingerprint_candidates(cur, assignment['id'], submission['student_id'], lookup_prints)
+        elif not code_prints: candidates = plagiarism_index.find_candidates(cur, assignment['id'], submission['student_id'], code_signature)
+        plagiarism_index.score_candidates(cur, assignment['id'], code_tokens, candidates, exclude=template_tokens)
+        # Structure is compared with the other flowcharts of similar size, not only the text candidates
+        if graph_signature:
+            structural = plagiarism_index.structural_rows(cur, assignment['id'], submission['student_id'], graph_signature, code_tokens,
+                                                          [c['id'] for c in candidates], exclude=template_tokens)
+    test_cases_data = _test_cases(assignment) if generated_code and target_language == 'python' else None
+    template_code = None
+    if assignment.get('grading_type') != 'keyword':
+        template_code = assignment_cache.template_text(assignment)
+
+    # Independent stages run concurrently; a failed or timed-out stage falls back to its default
+    stages = {"grading": {"run": lambda _: _grade(assignment, generated_code, template_code), "default": None}}
+    if assignment.get('static_analysis_enabled'):
+        stages["static_analysis"] = {"run": lambda _: analyze_code_style(generated_code, language=target_language), "default": None}
+    if assignment['plagiarism_check_enabled']:
+        stages["plagiarism"] = {"run": lambda _: _plagiarism_check(generated_code, graph_signature, candidates, structural), "default": None}
+    if test_cases_data:
+        stages["tests"] = {"run": lambda _: run_test_cases(generated_code, test_cases_data, language=target_language), "default": None}
+    for name, stage in stages.items(): stage['timeout'] = STAGE_TIMEOUTS[name]
+    if on_reads_done: on_reads_done()
+    outcomes = run_stage_graph(stages, on_done=lambda name, outcome: emit(name, _stage_event(name, outcome)))
+    for name, o in outcomes.items(): metrics.GRADING_STAGE_SECONDS.labels(stage=name, status=o['status']).observe(o['duration'])
+    if outcomes['grading']['status'] != 'ok':
+        raise GradingIncomplete(f"Grading unavailable: {outcomes['grading']['error']}")
+
+    def value(name, default=None): return outcomes[name]['value'] if name in outcomes else default
+    static_report = value("static_analysis")
+    plagiarism = value("plagiarism")
+    plagiarism_score = plagiarism['score'] if plagiarism else 0
+    plagiarism_matches = plagiarism if plagiarism and plagiarism['submission_id'] else None
+    test_results = value("tests")
+    grade_result = value("grading")
+
+    if uninit_vars_report or dead_code_report:
+        grade_result['feedback'] += "\n\n[Automated Analysis Warnings]:"
+        if dead_code_report: grade_result['feedback'] += f"\n- Dead code detected in {len(dead_code_report)} blocks."
+        if uninit_vars_report: grade_result['feedback'] += "\n- " + "\n- ".join(uninit_vars_report[:3])
+    
+    if test_results:
+        grade_result['feedback'] += f"\n\n[Execution Test Results]: Passed {test_results['passed']}/{test_results['total']} tests."
+    elif "tests" in outcomes:
+        grade_result['feedback'] += f"\n\n[Execution Test Results]: Tests could not be run ({outcomes['tests']['error']})."
+
+    cur.execute("""UPDATE submissions SET generated_code=%s, grading_result=%s, diagram_type=%s, complexity=%s, plagiarism_score=%s, static_analysis_report=%s, test_results=%s, graph_signature=%s, graph_size=%s, plagiarism_matches=%s WHERE id=%s""",
+               (generated_code, json.dumps(grade_result), used_method, complexity_score, plagiarism_score, json.dumps(static_report), json.dumps(test_results) if test_results else None, graph_signature, sum(graph_signature) if graph_signature else None, json.dumps(plagiarism_matches) if plagiarism_matches else None, submission['id']))
+    plagiarism_index.index_submission(cur, submission['id'], assignment['id'], code_signature or [])
+    plagiarism_index.index_fingerprints(cur, submission['id'], assignment['id'], code_prints)
+    plagiarism_index.index_tokens(cur, submission['id'], assignment['id'], code_tokens)
+    if options.get('regrade'):
+        # Graded under the current configuration now, so identical re-uploads may reuse this result
+        submit_options = {key: options.get(key) for key in ('is_image', 'diagram_type', 'description')}
+        cur.execute("UPDATE submissions SET grading_config_hash=%s WHERE id=%s", (dedup.grading_config_hash(assignment, submit_options), submission['id']))
+
+    return {
+        "submission_id": submission['id'],
+        "generated_code": generated_code, "grading_result": grade_result,
+        "language": target_language, "complexity": complexity_score,
+        "plagiarism_score": plagiarism_score, "plagiarism_matches": plagiarism_matches, "dead_code": dead_code_report,
+        "static_analysis": static_report,
+        "test_results": test_results,
+        "stages": {name: {"status": o['status'], "duration": o['duration'], "error": o['error']} for name, o in outcomes.items()}
+    }
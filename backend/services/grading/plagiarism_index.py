@@ -0,0 +1,242 @@
+"""
+Persisted plagiarism index, so a submission is only compared with likely matches.
+
+Each graded submission stores its MinHash signature (submissions.minhash) and
+one row per LSH band bucket in plagiarism_lsh_bands. The plagiarism check then
+looks up the submissions that share a bucket with the new code and scores only
+those exactly, instead of loading and re-tokenizing every other submission of
+the assignment.
+
+Text candidates come from winnowing fingerprints (plagiarism_fingerprints,
+indexed by hash): one lookup of the new code's fingerprints returns every
+submission sharing a run of tokens, with the matching lines, so the cost
+follows the number of fingerprints rather than the number of submissions.
+Fingerprints shared by more than COMMON_FRACTION of the assignment's
+students are boilerplate and ignored. Code too short to fingerprint falls
+back to the LSH lookup.
+
+Text similarity is weighted by inverse document frequency, so the generator
+boilerplate every program shares counts for little and the reference
+template's tokens not at all. Each submission stores its token set
+(submissions.tokens), and the assignment's document frequencies in
+plagiarism_token_df count students: each contributes the tokens of their
+latest indexed submission (recorded in plagiarism_student_tokens), like the
+cohort report compares. Resubmissions and reused copies therefore cannot
+inflate the frequency of copied tokens, and scoring reads a few rows instead
+of re-tokenizing the cohort.
+
+Flowchart submissions also store a Weisfeiler-Lehman histogram of the graph
+(submissions.graph_signature) and its total (graph_size). The min-max kernel of
+two histograms is at most the ratio of their totals, so only other students'
+flowcharts within STRUCTURAL_SIZE_RATIO of the new one's size can score high,
+and at most STRUCTURAL_LIMIT of the closest sizes are loaded (an index range,
+not the whole assignment). They are scored in one vectorized pass, not just the
+text candidates; their text half uses the same IDF weights and template
+exclusion as the candidates.
+"""
+import os
+import math
+import numpy as np
+from backend.services.analysis import minhash, winnowing, similarity_matrix
+from backend.services.grading import assignment_cache
+from backend.services.analysis.plagiarism import WL_BINS, normalize_code, idf_weight, weighted_jaccard_similarity
+
+# Submissions graded before the index existed are indexed lazily, this many per lookup
+BACKFILL_BATCH = 500
+# A fingerprint found in more than this share of students (and at least COMMON_MIN of them) is boilerplate.
+# Students, not submissions: resubmissions and reused copies must not turn a copied fingerprint common
+COMMON_FRACTION = float(os.environ.get("PLAGIARISM_COMMON_FRACTION", "0.3"))
+COMMON_MIN = 5
+# Flowcharts compared structurally: sizes within this ratio (WL similarity can reach it), the closest this many
+STRUCTURAL_SIZE_RATIO = float(os.environ.get("PLAGIARISM_STRUCTURAL_SIZE_RATIO", "0.5"))
+STRUCTURAL_LIMIT = int(os.environ.get("PLAGIARISM_STRUCTURAL_LIMIT", "500"))
+
+def index_submission(cur, submission_id, assignment_id, signature):
+    """(Re)writes the band rows and stored signature of one submission."""
+    cur.execute("DELETE FROM plagiarism_lsh_bands WHERE submission_id = %s", (submission_id,))
+    cur.execute("UPDATE submissions SET minhash = %s WHERE id = %s", (signature, submission_id))
+    if not signature: return
+    buckets = minhash.band_buckets(signature)
+    cur.execute("""INSERT INTO plagiarism_lsh_bands (assignment_id, band, bucket, submission_id)
+                   SELECT %s, band, bucket, %s FROM unnest(%s::int[], %s::bigint[]) AS q(band, bucket)""",
+                (assignment_id, submission_id, list(range(len(buckets))), buckets))
+
+def index_fingerprints(cur, submission_id, assignment_id, prints):
+    """(Re)writes the winnowing fingerprints of one submission."""
+    cur.execute("DELETE FROM plagiarism_fingerprints WHERE submission_id = %s", (submission_id,))
+    cur.execute("UPDATE submissions SET fingerprint_count = %s WHERE id = %s", (len({h for h, _, _ in prints}), submission_id))
+    if not prints: return
+    hashes, starts, ends = zip(*prints)
+    cur.execute("""INSERT INTO plagiarism_fingerprints (assignment_id, hash, submission_id, start_line, end_line)
+                   SELECT %s, hash, %s, start_line, end_line FROM unnest(%s::bigint[], %s::int[], %s::int[]) AS q(hash, start_line, end_line)""",
+                (assignment_id, submission_id, list(hashes), list(starts), list(ends)))
+
+def index_tokens(cur, submission_id, assignment_id, tokens):
+    """Stores the submission's token set and brings its student's share of the document frequencies up to date."""
+    cur.execute("UPDATE submissions SET tokens = %s WHERE id = %s RETURNING student_id", (sorted(set(tokens)), submission_id))
+    row = cur.fetchone()
+    if row: sync_student_tokens(cur, assignment_id, row['student_id'])
+
+def sync_student_tokens(cur, assignment_id, student_id):
+    """Moves the student's contribution to the document frequencies to their latest indexed submission."""
+    # The student's row serializes concurrent workers grading submissions of the same student
+    cur.execute("""INSERT INTO plagiarism_student_tokens (assignment_id, student_id) VALUES (%s, %s)
+                   ON CONFLICT (assignment_id, student_id) DO NOTHING""", (assignment_id, student_id))
+    cur.execute("SELECT tokens FROM plagiarism_student_tokens WHERE assignment_id = %s AND student_id = %s FOR UPDATE",
+                (assignment_id, student_id))
+    previous = set(cur.fetchone()['tokens'])
+    cur.execute("""SELECT tokens FROM submissions WHERE assignment_id = %s AND student_id = %s AND tokens IS NOT NULL
+                   ORDER BY id DESC LIMIT 1""", (assignment_id, student_id))
+    row = cur.fetchone()
+    tokens = set(row['tokens']) if row else set()
+    # Sorted, so concurrent workers lock shared token rows in the same order
+    added = sorted(tokens - previous); removed = sorted(previous - tokens)
+    if added:
+        cur.execute("""INSERT INTO plagiarism_token_df (assignment_id, token, df)
+                       SELECT %s, token, 1 FROM unnest(%s::text[]) AS q(token) ORDER BY token
+                       ON CONFLICT (assignment_id, token) DO UPDATE SET df = plagiarism_token_df.df + 1""", (assignment_id, added))
+    if removed:
+        cur.execute("UPDATE plagiarism_token_df SET df = df - 1 WHERE assignment_id = %s AND token = ANY(%s)", (assignment_id, removed))
+    if added or removed:
+        cur.execute("UPDATE plagiarism_student_tokens SET tokens = %s WHERE assignment_id = %s AND student_id = %s",
+                    (sorted(tokens), assignment_id, student_id))
+
+def backfill(cur, assignment_id):
+    """Indexes graded submissions of the assignment that have no signature yet. Returns how many."""
+    cur.execute("""SELECT id, generated_code FROM submissions
+                   WHERE assignment_id = %s AND (minhash IS NULL OR fingerprint_count IS NULL OR tokens IS NULL) AND generated_code IS NOT NULL LIMIT %s""",
+                (assignment_id, BACKFILL_BATCH))
+    rows = cur.fetchall()
+    for row in rows:
+        # An empty signature is stored as {} so the row is not picked up again
+        index_submission(cur, row['id'], assignment_id, minhash.signature(row['generated_code']) or [])
+        index_fingerprints(cur, row['id'], assignment_id, winnowing.fingerprints(row['generated_code']))
+        index_tokens(cur, row['id'], assignment_id, normalize_code(row['generated_code']))
+    return len(rows)
+
+def fingerprint_candidates(cur, assignment_id, exclude_student_id, prints):
+    """
+    Other students' submissions sharing a non-boilerplate fingerprint with prints:
+    [{"id", "text_score", "graph_signature", "tokens", "matches"}], where text_score is the Jaccard
+    similarity (0..100) of the two fingerprint sets and matches the merged matching line
+    ranges. Expects a RealDictCursor.
+    """
+    if not prints: return []
+    backfill(cur, assignment_id)
+    cur.execute("SELECT COUNT(DISTINCT student_id) AS n FROM submissions WHERE assignment_id = %s AND fingerprint_count > 0", (assignment_id,))
+    common_limit = max(COMMON_MIN, int(cur.fetchone()['n'] * COMMON_FRACTION))
+    cur.execute("""
+        WITH hits AS (
+            SELECT f.hash, f.submission_id, f.start_line, f.end_line
+            FROM plagiarism_fingerprints f
+            WHERE f.assignment_id = %s AND f.hash = ANY(%s::bigint[])
+        ), common AS (
+            SELECT h.hash FROM hits h JOIN submissions s ON s.id = h.submission_id
+            GROUP BY h.hash HAVING COUNT(DISTINCT s.student_id) > %s
+        )
+        SELECT h.hash, h.submission_id, h.start_line, h.end_line, s.fingerprint_count, s.graph_signature, s.tokens
+        FROM hits h JOIN submissions s ON s.id = h.submission_id
+        WHERE s.student_id != %s AND h.hash NOT IN (SELECT hash FROM common)
+    """, (assignment_id, list({h for h, _, _ in prints}), common_limit, exclude_student_id))
+
+    own = {}
+    for h, start, end in prints: own.setdefault(h, (start, end))
+    found = {}
+    for row in cur.fetchall():
+        entry = found.setdefault(row['submission_id'], {"id": row['submission_id'], "count": row['fingerprint_count'] or 0,
+                                                        "graph_signature": row['graph_signature'], "tokens": row['tokens'],
+                                                        "hashes": set(), "pairs": []})
+        entry["hashes"].add(row['hash'])
+        entry["pairs"].append((*own[row['hash']], row['start_line'], row['end_line']))
+    candidates = []
+    for entry in found.values():
+        shared = len(entry["hashes"])
+        union = len(own) + entry["count"] - shared
+        candidates.append({"id": entry["id"], "graph_signature": entry["graph_signature"], "tokens": entry["tokens"],
+                           "text_score": int(shared / union * 100) if union > 0 else 0,
+                           "matches": winnowing.merge_ranges(entry["pairs"])})
+    return candidates
+
+def find_candidates(cur, assignment_id, exclude_student_id, signature):
+    """
+    Other students' submissions sharing at least one LSH bucket with signature:
+    [{"id", "generated_code", "graph_signature", "tokens"}]. Expects a RealDictCursor.
+    """
+    if not signature: return []
+    backfill(cur, assignment_id)
+    buckets = minhash.band_buckets(signature)
+    cur.execute("""
+        SELECT s.id, s.generated_code, s.graph_signature, s.tokens
+        FROM submissions s
+        WHERE s.id IN (
+            SELECT b.submission_id FROM plagiarism_lsh_bands b
+            JOIN unnest(%s::int[], %s::bigint[]) AS q(band, bucket) ON b.band = q.band AND b.bucket = q.bucket
+            WHERE b.assignment_id = %s
+        ) AND s.student_id != %s AND s.generated_code IS NOT NULL
+    """, (list(range(len(buckets))), buckets, assignment_id, exclude_student_id))
+    return cur.fetchall()
+
+def template_features(assignment):
+    """Token set and fingerprint hashes of the reference template, ignored by the plagiarism check."""
+    try: template = assignment_cache.template_text(assignment)
+    except (OSError, TypeError, UnicodeDecodeError): return frozenset(), frozenset()
+    return frozenset(normalize_code(template)), frozenset(h for h, _, _ in winnowing.fingerprints(template))
+
+def document_frequencies(cur, assignment_id, tokens):
+    """(number of students with an indexed submission, {token: number of those students using it}) for the given tokens."""
+    cur.execute("SELECT COUNT(*) AS n FROM plagiarism_student_tokens WHERE assignment_id = %s AND tokens != '{}'", (assignment_id,))
+    documents = cur.fetchone()['n']
+    cur.execute("SELECT token, df FROM plagiarism_token_df WHERE assignment_id = %s AND token = ANY(%s)", (assignment_id, list(tokens)))
+    return documents, {row['token']: row['df'] for row in cur.fetchall()}
+
+def score_candidates(cur, assignment_id, tokens, candidates, exclude=frozenset()):
+    """
+    Sets each candidate's text_score to the IDF-weighted token similarity of its stored tokens
+    to tokens, ignoring the tokens in exclude (the reference template). A fingerprint score
+    already present is lowered to it: copied code is similar both ways, while reordered code
+    fails the fingerprints and shared boilerplate fails the weighted tokens.
+    """
+    if not candidates: return candidates
+    for c in candidates:
+        if c.get('tokens') is None: c['tokens'] = normalize_code(c.get('generated_code'))
+    vocabulary = set(tokens).union(*(c['tokens'] for c in candidates))
+    documents, df = document_frequencies(cur, assignment_id, vocabulary)
+    weights = {t: idf_weight(df.get(t, 0), documents) for t in vocabulary}
+    for c in candidates:
+        score = weighted_jaccard_similarity(tokens, c['tokens'], weights, exclude)
+        c['text_score'] = min(c['text_score'], score) if 'text_score' in c else score
+    return candidates
+
+def structural_rows(cur, assignment_id, exclude_student_id, graph_signature, tokens, exclude_ids=(), exclude=frozenset()):
+    """
+    Other students' flowchart submissions not in exclude_ids whose size is close to graph_signature's
+    (at most STRUCTURAL_LIMIT, closest first), as arrays for detect_plagiarism_batch:
+    {"ids", "text_scores", "graph_signatures"}. text_scores are the IDF-weighted token similarities
+    (0..100) to tokens ignoring the tokens in exclude, as score_candidates computes them.
+    """
+    backfill(cur, assignment_id)
+    size = sum(graph_signature)
+    cur.execute("""SELECT id, tokens, graph_signature FROM submissions
+                   WHERE assignment_id = %s AND graph_size BETWEEN %s AND %s
+                     AND student_id != %s AND cardinality(graph_signature) = %s AND NOT (id = ANY(%s))
+                   ORDER BY abs(graph_size - %s), id DESC
+                   LIMIT %s""",
+                (assignment_id, math.ceil(size * STRUCTURAL_SIZE_RATIO), math.floor(size / STRUCTURAL_SIZE_RATIO),
+                 exclude_student_id, WL_BINS, list(exclude_ids), size, STRUCTURAL_LIMIT))
+    rows = cur.fetchall()
+    text_scores = np.zeros(len(rows), dtype=int)
+    tokens = set(tokens) - exclude
+    if rows and tokens:
+        # The new code is the last row: one sparse product gives the shared weight with every stored row
+        matrix, vocabulary = similarity_matrix.token_matrix([r['tokens'] or [] for r in rows] + [tokens])
+        documents, df = document_frequencies(cur, assignment_id, vocabulary)
+        weights = np.array([0.0 if t in exclude else idf_weight(df.get(t, 0), documents) for t in vocabulary])
+        stored, own = matrix[:-1], matrix[-1]
+        shared = stored @ own.multiply(weights).T.toarray().ravel()
+        union = stored @ weights + (own @ weights)[0] - shared
+        text_scores = (np.divide(shared, union, out=np.zeros_like(shared), where=union > 0) * 100).astype(int)
+    return {
+        "ids": np.array([r['id'] for r in rows], dtype=np.int64),
+        "text_scores": text_scores,
+        "graph_signatures": np.array([r['graph_signature'] for r in rows], dtype=np.int64).reshape(-1, WL_BINS),
+    }
@@ -0,0 +1,85 @@
+"""
+Assignment-wide plagiarism reports (tables plagiarism_reports, plagiarism_clusters).
+
+A teacher requests a report, typically after the deadline; a grading worker
+picks it up when no grading job is waiting, scores every pair of the
+students' latest submissions at once (similarity_matrix) and stores the groups
+of students linked by a score of at least the report's threshold. Scores use
+the same IDF weights and template exclusion as the check at submit time. A report
+whose worker died is taken over after its lease expires, like a grading job.
+"""
+import json
+from backend.services.analysis import similarity_matrix
+from backend.services.analysis.plagiarism import normalize_code, idf_weight
+from backend.services.grading import assignment_cache, plagiarism_index
+from backend.services.grading.jobs import LEASE_SECONDS, MAX_ATTEMPTS
+
+def create(cur, assignment_id, requested_by, threshold):
+    """Queues a report (commit is up to the caller). Returns the report row."""
+    cur.execute("INSERT INTO plagiarism_reports (assignment_id, requested_by, threshold) VALUES (%s, %s, %s) RETURNING *",
+                (assignment_id, requested_by, threshold))
+    return cur.fetchone()
+
+def claim(cur):
+    """Marks the oldest claimable report as running and returns it, or None. Commit right after."""
+    cur.execute("""
+        UPDATE plagiarism_reports SET status = 'running', started_at = NOW(), attempts = attempts + 1
+        WHERE id = (
+            SELECT id FROM plagiarism_reports
+            WHERE attempts < %(max_attempts)s AND (status = 'queued' OR (status = 'running' AND started_at < NOW() - %(lease)s * INTERVAL '1 second'))
+            ORDER BY created_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+    """, {"max_attempts": MAX_ATTEMPTS, "lease": LEASE_SECONDS})
+    return cur.fetchone()
+
+def build(cur, report):
+    """Computes and stores the clusters of a claimed report and marks it done. Expects a RealDictCursor."""
+    while plagiarism_index.backfill(cur, report['assignment_id']): pass
+    cur.execute("""SELECT DISTINCT ON (student_id) id, student_id, generated_code, tokens FROM submissions
+                   WHERE assignment_id = %s AND generated_code IS NOT NULL
+                   ORDER BY student_id, id DESC""", (report['assignment_id'],))
+    rows = cur.fetchall()
+    matrix, vocabulary = similarity_matrix.token_matrix([r['tokens'] if r['tokens'] is not None else normalize_code(r['generated_code']) for r in rows])
+    assignment = assignment_cache.get_assignment(cur, report['assignment_id'])
+    template_tokens, _ = plagiarism_index.template_features(assignment) if assignment else (frozenset(), frozenset())
+    documents, df = plagiarism_index.document_frequencies(cur, report['assignment_id'], vocabulary)
+    weights = [0.0 if t in template_tokens else idf_weight(df.get(t, 0), documents) for t in vocabulary]
+    pair_rows, pair_cols, scores = similarity_matrix.similar_pairs(matrix, report['threshold'], weights)
+
+    groups = similarity_matrix.clusters(len(rows), pair_rows, pair_cols)
+    group_of = {i: g for g, members in enumerate(groups) for i in members}
+    group_pairs = [[] for _ in groups]
+    for i, j, score in zip(pair_rows.tolist(), pair_cols.tolist(), scores.tolist()):
+        group_pairs[group_of[i]].append([rows[i]['id'], rows[j]['id'], score])
+
+    cur.execute("DELETE FROM plagiarism_clusters WHERE report_id = %s", (report['id'],))
+    for members, pairs in zip(groups, group_pairs):
+        cur.execute("""INSERT INTO plagiarism_clusters (report_id, submission_ids, student_ids, max_similarity, pairs)
+                       VALUES (%s, %s, %s, %s, %s)""",
+                    (report['id'], [rows[i]['id'] for i in members], [rows[i]['student_id'] for i in members],
+                     max(p[2] for p in pairs), json.dumps(pairs)))
+    cur.execute("""UPDATE plagiarism_reports SET status = 'done', finished_at = NOW(), submission_count = %s, pair_count = %s, error = NULL
+                   WHERE id = %s""", (len(rows), len(scores), report['id']))
+
+def fail(cur, report_id, error):
+    cur.execute("UPDATE plagiarism_reports SET status = 'failed', finished_at = NOW(), error = %s WHERE id = %s", (error, report_id))
+
+def get_report(cur, report_id):
+    """The report row plus the creator of its assignment (for permission checks), or None."""
+    cur.execute("""SELECT r.*, a.creator_id AS assignment_creator_id FROM plagiarism_reports r
+                   JOIN assignments a ON a.id = r.assignment_id WHERE r.id = %s""", (report_id,))
+    return cur.fetchone()
+
+def get_clusters(cur, report_id):
+    """Clusters of a report, largest first, with the members' usernames."""
+    cur.execute("""
+        SELECT c.submission_ids, c.student_ids, c.max_similarity, c.pairs,
+               ARRAY(SELECT u.username FROM unnest(c.student_ids) WITH ORDINALITY AS m(id, pos)
+                     JOIN users u ON u.id = m.id ORDER BY m.pos) AS usernames
+        FROM plagiarism_clusters c WHERE c.report_id = %s
+        ORDER BY cardinality(c.submission_ids) DESC, c.max_similarity DESC
+    """, (report_id,))
+    return cur.fetchall()
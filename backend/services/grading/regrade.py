@@ -0,0 +1,71 @@
+"""
+Bulk re-grading of an assignment's submissions (tables regrade_runs, grading_jobs).
+
+A run enqueues one grading job per selected submission in a single statement;
+the grading workers then work through them at the throttled pace set in
+jobs.py, so a run never crowds out fresh student submissions. Re-grade jobs
+reuse the stored generated_code (no diagram parsing or AI vision call) and
+overwrite the submission's results in place. Progress is read from the jobs
+themselves, and a run is resumable: jobs survive restarts like any other job,
+and resume() re-queues the ones that failed.
+"""
+import json
+
+def start_run(cur, assignment_id, requested_by, filters):
+    """
+    Creates a run and queues its jobs (commit is up to the caller). Returns the run row.
+    filters: {"submission_ids", "student_ids", "latest_only", "max_score"}, all optional.
+    Submissions that are already waiting for a grading job are skipped.
+    """
+    conditions = ["s.assignment_id = %s",
+                  "NOT EXISTS (SELECT 1 FROM grading_jobs p WHERE p.submission_id = s.id AND p.status IN ('queued', 'running'))"]
+    params = [assignment_id]
+    if filters.get('submission_ids'):
+        conditions.append("s.id = ANY(%s)"); params.append(list(filters['submission_ids']))
+    if filters.get('student_ids'):
+        conditions.append("s.student_id = ANY(%s)"); params.append(list(filters['student_ids']))
+    if filters.get('latest_only'):
+        conditions.append("s.id = (SELECT MAX(l.id) FROM submissions l WHERE l.assignment_id = s.assignment_id AND l.student_id = s.student_id)")
+    if filters.get('max_score') is not None:
+        conditions.append("COALESCE(CAST(s.grading_result->>'score' AS NUMERIC), 0) <= %s"); params.append(filters['max_score'])
+
+    cur.execute("INSERT INTO regrade_runs (assignment_id, requested_by, filters) VALUES (%s, %s, %s) RETURNING *",
+                (assignment_id, requested_by, json.dumps(filters)))
+    run = cur.fetchone()
+    # The original submit options are kept (they are part of the dedup config hash);
+    # submissions without a job get them rebuilt from the row
+    cur.execute(f"""
+        INSERT INTO grading_jobs (submission_id, assignment_id, student_id, payload, regrade_run_id)
+        SELECT s.id, s.assignment_id, s.student_id,
+               COALESCE(
+                   (SELECT j.payload FROM grading_jobs j WHERE j.submission_id = s.id AND j.regrade_run_id IS NULL ORDER BY j.id LIMIT 1),
+                   jsonb_build_object('is_image', s.original_filename ~* '\\.(png|jpe?g|webp)$', 'diagram_type', COALESCE(s.diagram_type, 'auto'), 'description', '')
+               ) || jsonb_build_object('regrade', true),
+               %s
+        FROM submissions s
+        WHERE {' AND '.join(conditions)}
+        ORDER BY s.id
+    """, [run['id']] + params)
+    run['total'] = cur.rowcount
+    cur.execute("UPDATE regrade_runs SET total = %s WHERE id = %s", (run['total'], run['id']))
+    return run
+
+def get_run(cur, run_id):
+    """The run row plus the creator of its assignment (for permission checks), or None."""
+    cur.execute("""SELECT r.*, a.creator_id AS assignment_creator_id FROM regrade_runs r
+                   JOIN assignments a ON a.id = r.assignment_id WHERE r.id = %s""", (run_id,))
+    return cur.fetchone()
+
+def progress(cur, run):
+    """{"total", "queued", "running", "done", "failed", "status"}; status is 'running' until no job is pending."""
+    cur.execute("SELECT status, COUNT(*) AS n FROM grading_jobs WHERE regrade_run_id = %s GROUP BY status", (run['id'],))
+    counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+    for row in cur.fetchall(): counts[row['status']] = row['n']
+    status = "running" if counts['queued'] or counts['running'] else "done"
+    return {"total": run['total'], **counts, "status": status}
+
+def resume(cur, run_id):
+    """Re-queues the failed jobs of a run. Returns how many."""
+    cur.execute("""UPDATE grading_jobs SET status = 'queued', attempts = 0, error = NULL, worker = NULL, started_at = NULL, finished_at = NULL
+                   WHERE regrade_run_id = %s AND status = 'failed'""", (run_id,))
+    return cur.rowcount
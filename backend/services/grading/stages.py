@@ -0,0 +1,66 @@
+"""
+Runs the grading stages of one submission as a dependency graph.
+
+Each stage is a dict:
+    {"run": fn(values) -> value, "after": [stage names], "timeout": seconds, "default": value}
+A stage starts as soon as every stage in "after" has finished and receives
+their values by name. Independent stages run concurrently on a thread pool:
+the slow ones (AI call, test runs) mostly wait on the network or on child
+processes. A stage that raises or overruns its timeout gets its "default"
+value, and the other stages are unaffected. A timed-out stage's thread is
+abandoned, not killed, so stages must not share state with the caller.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from backend.core.logger import logger
+
+DEFAULT_STAGE_TIMEOUT = 60
+
+def _outcome(status, value, error, started):
+    return {"status": status, "value": value, "error": error, "duration": round(time.monotonic() - started, 3)}
+
+def run_stage_graph(stages, max_workers=None, on_done=None):
+    """
+    Runs stages and returns {name: {"status": "ok" | "failed" | "timeout", "value", "error", "duration"}}.
+    on_done(name, outcome), if given, is called on the calling thread as each stage finishes.
+    Raises ValueError when a dependency is unknown or the graph has a cycle.
+    """
+    for name, stage in stages.items():
+        unknown = [dep for dep in stage.get('after', ()) if dep not in stages]
+        if unknown: raise ValueError(f"Stage '{name}' depends on unknown stages {unknown}")
+
+    results = {}
+    pending = dict(stages)
+    running = {}
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(stages) or 1, thread_name_prefix="grading-stage")
+    try:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if all(dep in results for dep in stage.get('after', ())):
+                    values = {dep: results[dep]['value'] for dep in stage.get('after', ())}
+                    running[executor.submit(stage['run'], values)] = (name, time.monotonic())
+                    del pending[name]
+            if not running: raise ValueError(f"Stage graph has a cycle: {sorted(pending)}")
+
+            deadline = min(started + stages[name].get('timeout', DEFAULT_STAGE_TIMEOUT) for name, started in running.values())
+            done, _ = wait(running, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future, (name, started) in list(running.items()):
+                stage = stages[name]
+                timeout = stage.get('timeout', DEFAULT_STAGE_TIMEOUT)
+                if future in done:
+                    try: results[name] = _outcome("ok", future.result(), None, started)
+                    except Exception as e:
+                        logger.warning(f"Grading stage '{name}' failed: {e}")
+                        results[name] = _outcome("failed", stage.get('default'), str(e), started)
+                elif time.monotonic() - started >= timeout:
+                    future.cancel()
+                    logger.warning(f"Grading stage '{name}' timed out after {timeout}s")
+                    results[name] = _outcome("timeout", stage.get('default'), f"Timed out after {timeout}s", started)
+                else:
+                    continue
+                del running[future]
+                if on_done: on_done(name, results[name])
+    finally:
+        # Don't wait for abandoned (timed-out) stages
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
@@ -0,0 +1,161 @@
+"""
+Grading worker: drains the grading_jobs queue outside the web server.
+
+Usage (from the project root):
+    python -m backend.services.grading.worker [--processes 2]
+
+Each process claims one job at a time, so a slow AI call only holds up its own
+process. When the queue is empty, processes build queued plagiarism reports.
+Stop with SIGTERM/SIGINT; the job in progress is finished first.
+"""
+import os
+import time
+import signal
+import argparse
+import multiprocessing
+from psycopg2.extras import RealDictCursor
+
+from backend.core.database import get_db_connection, release_db_connection
+from backend.core.logger import logger
+from backend.core import metrics
+from backend.services.grading import jobs, assignment_cache, events, plagiarism_report
+from backend.services.grading.pipeline import grade_submission, SubmissionRejected, GradingIncomplete
+
+POLL_INTERVAL_SECONDS = float(os.environ.get("GRADING_POLL_INTERVAL", "1.0"))
+WORKER_PROCESSES = int(os.environ.get("GRADING_WORKERS", "2"))
+# How often each worker deletes expired grading events
+EVENTS_PRUNE_INTERVAL_SECONDS = 3600
+
+_stopping = False
+
+def _claim():
+    conn = get_db_connection()
+    if not conn: return None
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        jobs.expire_abandoned(cur)
+        job = jobs.claim_job(cur)
+        conn.commit()
+        return job
+    except Exception as e:
+        conn.rollback(); logger.error(f"Could not claim grading job: {e}")
+        return None
+    finally: cur.close(); release_db_connection(conn)
+
+def _discard_submission(cur, submission):
+    cur.execute("DELETE FROM submissions WHERE id = %s", (submission['id'],))
+    if submission.get('file_path') and os.path.exists(submission['file_path']): os.remove(submission['file_path'])
+
+def process_job(job):
+    """Grades one claimed job and records its outcome. Never raises."""
+    conn = get_db_connection()
+    if not conn:
+        logger.error(f"Database unavailable; job {job['id']} will be retried when its lease expires")
+        return
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    submission = None
+    try:
+        assignment = assignment_cache.get_assignment(cur, job['assignment_id'])
+        cur.execute("SELECT * FROM submissions WHERE id = %s", (job['submission_id'],))
+        submission = cur.fetchone()
+        if not assignment or not submission:
+            jobs.fail_job(cur, job['id'], "Submission no longer exists"); conn.commit()
+            events.publish(job['id'], "failed", {"error": "Submission no longer exists"})
+            return
+        events.publish(job['id'], "started", {"attempt": job['attempts']})
+        # The reads are committed before the stages run; the result is stored in a short transaction of its own
+        result = grade_submission(cur, assignment, submission, job['payload'] or {}, on_event=lambda event, data: events.publish(job['id'], event, data),
+                                  on_reads_done=conn.commit)
+        jobs.complete_job(cur, job['id'], result)
+        conn.commit(); metrics.GRADING_JOBS.labels(status="done").inc()
+        events.publish(job['id'], "done", {"result": result})
+        logger.info(f"Graded submission {submission['id']} (job {job['id']})")
+    except SubmissionRejected as e:
+        conn.rollback()
+        # A re-grade never deletes a submission the student already has a grade for
+        if not (job['payload'] or {}).get('regrade'): _discard_submission(cur, submission)
+        jobs.fail_job(cur, job['id'], str(e)); conn.commit()
+        metrics.GRADING_JOBS.labels(status="rejected").inc()
+        events.publish(job['id'], "failed", {"error": str(e)})
+    except GradingIncomplete as e:
+        conn.rollback()
+        retrying = jobs.retry_job(cur, job, str(e)); conn.commit()
+        logger.warning(f"Grading job {job['id']} attempt {job['attempts']} incomplete ({e}); {'retrying' if retrying else 'giving up'}")
+        metrics.GRADING_JOBS.labels(status="retried" if retrying else "failed").inc()
+        events.publish(job['id'], "retrying" if retrying else "failed", {"error": str(e)})
+    except Exception as e:
+        conn.rollback()
+        logger.exception(f"Grading job {job['id']} failed")
+        metrics.GRADING_JOBS.labels(status="failed").inc()
+        try:
+            jobs.fail_job(cur, job['id'], str(e)); conn.commit()
+            events.publish(job['id'], "failed", {"error": str(e)})
+        except Exception: conn.rollback()
+    finally: cur.close(); release_db_connection(conn)
+
+def run_once():
+    """Claims and processes one job. Returns False when the queue was empty."""
+    job = _claim()
+    if not job: return False
+    process_job(job)
+    return True
+
+def run_report_once():
+    """Claims and builds one plagiarism report. Returns False when none was queued."""
+    conn = get_db_connection()
+    if not conn: return False
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        report = plagiarism_report.claim(cur); conn.commit()
+        if not report: return False
+        try:
+            plagiarism_report.build(cur, report); conn.commit()
+            logger.info(f"Built plagiarism report {report['id']} for assignment {report['assignment_id']}")
+        except Exception as e:
+            conn.rollback(); logger.exception(f"Plagiarism report {report['id']} failed")
+            plagiarism_report.fail(cur, report['id'], str(e)); conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback(); logger.error(f"Could not claim plagiarism report: {e}")
+        return False
+    finally: cur.close(); release_db_connection(conn)
+
+def _prune_events():
+    conn = get_db_connection()
+    if not conn: return
+    cur = conn.cursor()
+    try: events.prune(cur); conn.commit()
+    except Exception as e: conn.rollback(); logger.warning(f"Could not prune grading events: {e}")
+    finally: cur.close(); release_db_connection(conn)
+
+def _request_stop(signum, frame):
+    global _stopping
+    _stopping = True
+
+def run_worker():
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    logger.info(f"Grading worker {jobs.worker_name()} started")
+    last_prune = 0
+    while not _stopping:
+        if time.monotonic() - last_prune > EVENTS_PRUNE_INTERVAL_SECONDS:
+            _prune_events(); last_prune = time.monotonic()
+        if not run_once() and not run_report_once(): time.sleep(POLL_INTERVAL_SECONDS)
+    logger.info(f"Grading worker {jobs.worker_name()} stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description="Grading queue worker")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES)
+    args = parser.parse_args()
+    if args.processes <= 1:
+        run_worker(); return
+    # spawn, not fork: every process opens its own database connections
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=run_worker, name=f"grading-worker-{i}") for i in range(args.processes)]
+    for p in processes: p.start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: [p.terminate() for p in processes if p.is_alive()])
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # children get the terminal's SIGINT themselves
+    for p in processes: p.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+In-memory draw.io document shared by every consumer of one XML upload.
+
+The file is parsed once; type detection, the flowchart parser and the
+Nassi-Shneiderman parser all read the same element tree and the same list of
+mxCell elements instead of each running ET.parse on the path again.
+"""
+import xml.etree.ElementTree as ET
+
+
+class DiagramDocument:
+    def __init__(self, root):
+        self.root = root
+        self.cells = root.findall(".//mxCell")
+        # Results derived from the tree (e.g. the flowchart graph), keyed by consumer
+        self.cache = {}
+
+    def diagram_type(self):
+        return 'flowchart' if any(cell.get('edge') == '1' for cell in self.cells) else 'nassi_shneiderman'
+
+
+def load_document(source):
+    """Parses a file path, bytes or str of draw.io XML into a DiagramDocument."""
+    try:
+        if isinstance(source, bytes) or (isinstance(source, str) and source.lstrip().startswith('<')):
+            return DiagramDocument(ET.fromstring(source))
+        return DiagramDocument(ET.parse(source).getroot())
+    except ET.ParseError as e:
+        raise Exception(f"Failed to parse diagram XML: {e}")
+
+def as_document(source):
+    """Returns source unchanged if it is already a DiagramDocument, otherwise loads it."""
+    return source if isinstance(source, DiagramDocument) else load_document(source)
@@ -1,6 +1,6 @@
-import xml.etree.ElementTree as ET
 import re
 from backend.services.execution.generators import get_generator
+from backend.services.parsers.document import as_document
 
 # --- IMPROVED LABEL MATCHING (REGEX) ---
 # Matches: yes, y, yep, yeah, true, t, 1, ok
@@ -8,9 +8,10 @@ YES_PATTERN = re.compile(r"^\s*(y(es|ep|eah|up)?|t(rue)?|1|ok)\s*$", re.IGNORECA
 # Matches: no, n, nope, nah, false, f, 0
 NO_PATTERN = re.compile(r"^\s*(n(o|ope|ah)?|f(alse)?|0)\s*$", re.IGNORECASE)
 
-def parse_drawio_xml(file_path, language='python', return_graph=False):
+def parse_drawio_xml(document, language='python', return_graph=False):
+    """document: a DiagramDocument (or anything load_document accepts, e.g. a file path)."""
     try:
-        nodes, edges = _build_graph(file_path)
+        nodes, edges = _build_graph(as_document(document))
     except Exception as e:
         raise Exception(f"Failed to build graph: {e}")
 
@@ -42,12 +43,10 @@ def _clean_value(text):
     clean = clean.replace('&nbsp;', ' ').replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&')
     return clean.strip()
 
-def _build_graph(file_path):
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    all_cells = root.findall(".//mxCell")
+def _build_graph(document):
+    if 'flowchart_graph' in document.cache: return document.cache['flowchart_graph']
     nodes = {}; edges = {}
-    for cell in all_cells:
+    for cell in document.cells:
         cell_id = cell.get('id')
         if not cell_id: continue
         value = _clean_value(cell.get('value', ''))
@@ -61,6 +60,7 @@ def _build_graph(file_path):
                 if source_id not in edges: edges[source_id] = []
                 # Store the value for later regex checking
                 edges[source_id].append({'target': target_id, 'value': value})
+    document.cache['flowchart_graph'] = (nodes, edges)
     return nodes, edges
 
 def _is_yes_label(text):
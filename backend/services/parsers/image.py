@@ -55,7 +55,7 @@ def parse_image_diagram(image_path, user_description="", language="python"):
     }
 
     try:
-        response = post_with_retries(API_URL, payload, headers={"Content-Type": "application/json"})
+        response = post_with_retries(API_URL, payload, headers={"Content-Type": "application/json"}, operation="vision")
         
         # Parse AI Response
         ai_text = response.json()['candidates'][0]['content']['parts'][0]['text']
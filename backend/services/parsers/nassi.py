@@ -1,10 +1,11 @@
-import xml.etree.ElementTree as ET
 # Updated Import for the restructured project
 from backend.services.execution.generators import get_generator
+from backend.services.parsers.document import as_document
 
-def parse_nassi_shneiderman_xml(file_path, language='python'):
+def parse_nassi_shneiderman_xml(document, language='python'):
+    """document: a DiagramDocument (or anything load_document accepts, e.g. a file path)."""
     try:
-        nodes = _parse_xml_geometry(file_path)
+        nodes = _parse_xml_geometry(as_document(document))
     except Exception as e:
         raise Exception(f"Failed to parse XML geometry: {e}")
     if not nodes: raise Exception("No blocks found in the diagram.")
@@ -22,10 +23,9 @@ def parse_nassi_shneiderman_xml(file_path, language='python'):
     code_lines.extend(gen.program_end())
     return "\n".join(code_lines)
 
-def _parse_xml_geometry(file_path):
-    tree = ET.parse(file_path); root = tree.getroot()
+def _parse_xml_geometry(document):
     nodes = []
-    for cell in root.findall(".//mxCell"):
+    for cell in document.cells:
         if cell.get('vertex') != '1': continue
         cell_id = cell.get('id')
         value = cell.get('value', '').strip()
@@ -0,0 +1,59 @@
+"""
+C++ compile time with and without the precompiled prelude header.
+
+Compiles a generated program straight through g++ (bypassing the artifact cache)
+for every optimization profile.
+
+Usage (from the project root):
+    python -m benchmarks.cpp_pch_bench [--repeat 5]
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from backend.services.execution import cpp_toolchain
+from backend.services.execution.generators import get_generator
+
+def _program():
+    gen = get_generator('cpp')
+    body = [gen.statement("n = 0"), "cin >> n;", gen.statement("total = 0"),
+            gen.while_start("n > 0"), "    total += n;", "    n -= 1;", gen.block_end(),
+            gen.print("total")]
+    return "\n".join(gen.program_start() + ["    " + line for line in body] + gen.program_end())
+
+def _compile_times(source_file, flags, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = subprocess.run(["g++", *flags, source_file, "-o", source_file + ".out"], capture_output=True, text=True)
+        samples.append(time.perf_counter() - start)
+        assert res.returncode == 0, res.stderr
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        source_file = os.path.join(work_dir, "main.cpp")
+        with open(source_file, "w") as f: f.write(_program())
+
+        print(f"compile time over {args.repeat} runs (median, ms)")
+        print(f"{'profile':<14}{'flag':<6}{'no pch':>10}{'pch':>10}{'speedup':>10}")
+        for profile in cpp_toolchain.OPT_LEVELS:
+            plain = _compile_times(source_file, cpp_toolchain.compile_flags(profile, use_pch=False), args.repeat)
+            cpp_toolchain.compile_flags(profile, use_pch=True)  # build the PCH outside the timed region
+            pch = _compile_times(source_file, cpp_toolchain.compile_flags(profile, use_pch=True), args.repeat)
+            plain_ms, pch_ms = statistics.median(plain) * 1000, statistics.median(pch) * 1000
+            print(f"{profile:<14}{cpp_toolchain.OPT_LEVELS[profile]:<6}{plain_ms:>10.1f}{pch_ms:>10.1f}{plain_ms / pch_ms:>9.1f}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
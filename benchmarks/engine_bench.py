@@ -0,0 +1,193 @@
+"""
+Execution engine benchmark across languages: cold/warm latency, run_test_cases
+throughput, compile time and peak memory, written as JSON for comparing releases.
+
+Every language runs the same fixed programs:
+  cpu      sums 1..n in a loop (n read from stdin)
+  io       reads n numbers, one per line, and prints each one doubled
+  infinite never terminates; measures how fast a timeout is detected
+
+The execution memo is disabled so every case really runs, and compiled artifacts
+go to a private temporary cache so cold runs never touch (or wipe) the host's
+shared one. A language whose toolchain is missing is reported with an "error"
+entry instead of numbers.
+
+Usage (from the project root):
+    python -m benchmarks.engine_bench [--languages python,cpp,java] [--repeat 5] [--output bench.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import shutil
+import platform
+import tempfile
+import statistics
+import subprocess
+
+from backend.services.execution import engine, artifact_cache, memo, python_runner
+
+PROGRAMS = {
+    'python': {
+        'cpu': "n = int(input())\ntotal = 0\nfor i in range(n):\n    total += i\nprint(total)",
+        'io': "n = int(input())\nfor _ in range(n):\n    print(int(input()) * 2)",
+        'infinite': "while True:\n    pass",
+    },
+    'cpp': {
+        'cpu': ("#include <iostream>\nusing namespace std;\n\nint main() {\n    long long n, total = 0;\n    cin >> n;\n"
+                "    for (long long i = 0; i < n; i++) total += i;\n    cout << total << endl;\n    return 0;\n}"),
+        'io': ("#include <iostream>\nusing namespace std;\n\nint main() {\n    long long n, x;\n    cin >> n;\n"
+               "    for (long long i = 0; i < n; i++) { cin >> x; cout << x * 2 << '\\n'; }\n    return 0;\n}"),
+        'infinite': "#include <iostream>\n\nint main() {\n    volatile bool running = true;\n    while (running) {}\n    return 0;\n}",
+    },
+    'java': {
+        'cpu': ("import java.util.Scanner;\n\npublic class Main {\n    public static void main(String[] args) {\n"
+                "        long n = new Scanner(System.in).nextLong(), total = 0;\n"
+                "        for (long i = 0; i < n; i++) total += i;\n        System.out.println(total);\n    }\n}"),
+        'io': ("import java.util.Scanner;\n\npublic class Main {\n    public static void main(String[] args) {\n"
+               "        Scanner in = new Scanner(System.in);\n        long n = in.nextLong();\n"
+               "        StringBuilder out = new StringBuilder();\n"
+               "        for (long i = 0; i < n; i++) out.append(in.nextLong() * 2).append('\\n');\n"
+               "        System.out.print(out);\n    }\n}"),
+        'infinite': ("public class Main {\n    public static void main(String[] args) {\n"
+                     "        while (true) {}\n    }\n}"),
+    },
+}
+CPU_N = 200000
+IO_LINES = 2000
+CASE_COUNTS = (1, 10, 50)
+
+def _inputs(kind, seed=0):
+    """(stdin, expected stdout) for one case of a program."""
+    if kind == 'cpu':
+        n = CPU_N + seed
+        return str(n), str(n * (n - 1) // 2)
+    if kind == 'io':
+        values = [seed + i for i in range(IO_LINES)]
+        return "\n".join([str(IO_LINES)] + [str(v) for v in values]), "\n".join(str(v * 2) for v in values)
+    return "", ""
+
+def _execute(language, code, input_str):
+    return {'python': engine.execute_python, 'cpp': engine.execute_cpp, 'java': engine.execute_java}[language](code, input_str)
+
+def _stats(samples):
+    ms = [s * 1000 for s in samples]
+    return {"median_ms": round(statistics.median(ms), 3), "min_ms": round(min(ms), 3), "max_ms": round(max(ms), 3)}
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+def _reset_caches():
+    """Drops compiled artifacts and warm Python runners so the next run starts cold."""
+    artifact_cache.evict(max_bytes=0)  # the benchmark's own cache (see main)
+    python_runner.reset_runner_pool()
+
+def _compile_time(language, code, repeat):
+    if language not in engine.COMPILERS: return None
+    saved = artifact_cache.MAX_CACHE_BYTES
+    artifact_cache.MAX_CACHE_BYTES = 0  # force a real compile every time
+    try:
+        samples = []
+        for _ in range(repeat):
+            elapsed, artifact = _timed(lambda: engine.COMPILERS[language](code))
+            engine.release_artifact(artifact)
+            if not artifact['success']: raise RuntimeError(artifact['error'])
+            samples.append(elapsed)
+        return _stats(samples)
+    finally:
+        artifact_cache.MAX_CACHE_BYTES = saved
+
+def _latency(language, kind, repeat):
+    code = PROGRAMS[language][kind]
+    input_str, expected = _inputs(kind)
+    _reset_caches()
+    cold_time, cold = _timed(lambda: _execute(language, code, input_str))
+    if kind == 'infinite':
+        if not cold.get('timeout'): raise RuntimeError(f"{language} infinite loop was not stopped: {cold}")
+    elif cold['output'] != expected:
+        raise RuntimeError(f"{language} {kind} produced wrong output: {cold['error'] or cold['output'][:200]}")
+    warm, peaks = [], [cold.get('peak_memory_kb')]
+    for _ in range(1 if kind == 'infinite' else repeat):
+        elapsed, res = _timed(lambda: _execute(language, code, input_str))
+        warm.append(elapsed); peaks.append(res.get('peak_memory_kb'))
+    peaks = [p for p in peaks if p is not None]
+    return {
+        "cold_ms": round(cold_time * 1000, 3),
+        "warm": _stats(warm),
+        "peak_memory_kb": max(peaks) if peaks else None
+    }
+
+def _throughput(language, kind, repeat):
+    code = PROGRAMS[language][kind]
+    results = {}
+    for count in CASE_COUNTS:
+        cases = []
+        for seed in range(count):
+            input_str, expected = _inputs(kind, seed)
+            cases.append({"input": input_str, "output": expected})
+        engine.run_test_cases(code, cases[:1], language=language)  # warm up
+        samples = []
+        for _ in range(repeat):
+            elapsed, report = _timed(lambda: engine.run_test_cases(code, cases, language=language))
+            if report['passed'] != count: raise RuntimeError(f"{language} {kind}: {report['passed']}/{count} passed")
+            samples.append(elapsed)
+        results[str(count)] = {**_stats(samples), "cases_per_second": round(count / statistics.median(samples), 2),
+                               "peak_memory_kb": report['resources']['peak_memory_kb']}
+    return results
+
+def bench_language(language, repeat):
+    report = {"compile": _compile_time(language, PROGRAMS[language]['cpu'], repeat)}
+    report["latency"] = {kind: _latency(language, kind, repeat) for kind in PROGRAMS[language]}
+    report["throughput"] = {kind: _throughput(language, kind, repeat) for kind in ('cpu', 'io')}
+    return report
+
+def _git_revision():
+    try: return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception: return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--languages", default="python,cpp,java")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+    memo.ENABLED = False
+    artifact_cache.CACHE_ROOT = tempfile.mkdtemp(prefix="engine_bench_artifacts-")
+
+    results = {}
+    try:
+        for language in args.languages.split(","):
+            print(f"benchmarking {language}...", file=sys.stderr)
+            try: results[language] = bench_language(language, args.repeat)
+            except Exception as e: results[language] = {"error": str(e)}
+    finally:
+        shutil.rmtree(artifact_cache.CACHE_ROOT, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "settings": {
+                "test_case_concurrency": engine.TEST_CASE_CONCURRENCY,
+                "global_execution_limit": engine.GLOBAL_EXECUTION_LIMIT,
+                "python_harness": engine.PYTHON_HARNESS_ENABLED,
+                "artifact_cache_bytes": artifact_cache.MAX_CACHE_BYTES,
+            }
+        },
+        "results": results
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f: f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Per-test-case latency of run_test_cases for Python: cold interpreter, warm runner
+pool (one fork per case) and batched harness (one process per slice of cases).
+
+Usage (from the project root):
+    python -m benchmarks.python_runner_bench [--cases 20] [--repeat 5]
+"""
+import os
+import time
+import argparse
+import statistics
+
+from backend.services.execution import engine, python_runner, memo
+from backend.services.execution.engine import run_test_cases
+
+PROGRAM = "n = int(input())\ntotal = 0\nfor i in range(n):\n    total += i\nprint(total)"
+
+def _test_cases(count):
+    return [{"input": str(i * 10), "output": str(sum(range(i * 10)))} for i in range(count)]
+
+def _measure(cases, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        report = run_test_cases(PROGRAM, cases, language='python')
+        samples.append((time.perf_counter() - start) / len(cases))
+        assert report['passed'] == len(cases), report
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cases", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    cases = _test_cases(args.cases)
+    memo.ENABLED = False  # every repeat must really run
+
+    os.environ["PYTHON_RUNNER_POOL_SIZE"] = "0"
+    cold = _measure(cases, args.repeat)
+
+    os.environ["PYTHON_RUNNER_POOL_SIZE"] = "2"
+    python_runner.get_runner_pool().run("pass", "")  # start the runner outside the timed region
+    engine.PYTHON_HARNESS_ENABLED = False
+    warm = _measure(cases, args.repeat)
+
+    engine.PYTHON_HARNESS_ENABLED = True
+    harness = _measure(cases, args.repeat)
+
+    print(f"{args.cases} test cases x {args.repeat} repeats (per-case latency, ms)")
+    print(f"{'mode':<14}{'median':>10}{'min':>10}{'max':>10}")
+    for name, samples in (("subprocess", cold), ("warm pool", warm), ("harness", harness)):
+        ms = [s * 1000 for s in samples]
+        print(f"{name:<14}{statistics.median(ms):>10.2f}{min(ms):>10.2f}{max(ms):>10.2f}")
+    print(f"speedup vs subprocess: warm pool {statistics.median(cold) / statistics.median(warm):.1f}x, "
+          f"harness {statistics.median(cold) / statistics.median(harness):.1f}x")
+
+if __name__ == "__main__":
+    main()
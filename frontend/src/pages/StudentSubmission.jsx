@@ -3,6 +3,20 @@ import { api } from '../services/ApiService';
 // UPDATE: Import Play, Terminal, Loader2 icons
 import { Play, Terminal, Loader2 } from 'lucide-react'; 
 
+// One line of progress text per grading event (null hides the event)
+const describeProgress = (event, data) => {
+  switch (event) {
+    case 'started': return 'Grading started';
+    case 'code_generated': return 'Code generated from the diagram';
+    case 'complexity': return `Cyclomatic complexity: ${data.complexity}`;
+    case 'static_analysis': return data.status === 'ok' ? 'Style check finished' : 'Style check unavailable';
+    case 'tests': return data.total ? `Tests passed: ${data.passed}/${data.total}` : 'Tests could not be run';
+    case 'plagiarism': return `Similarity to other submissions: ${data.plagiarism_score ?? 0}%`;
+    case 'grading': return data.grading_result ? `AI grade: ${data.grading_result.score}` : 'AI grading unavailable';
+    default: return null;
+  }
+};
+
 export const StudentSubmission = ({
   currentAssignment,
   setView,
@@ -30,6 +44,8 @@ export const StudentSubmission = ({
   const [diagramType, setDiagramType] = useState('flowchart'); 
   const [submissionMode, setSubmissionMode] = useState('xml'); 
   const [isSubmitting, setIsSubmitting] = useState(false);
+  // Progress events of the grading job, shown while it runs
+  const [progress, setProgress] = useState([]);
 
   // NEW STATE for Execution
   const [isRunning, setIsRunning] = useState(false);
@@ -46,6 +62,7 @@ export const StudentSubmission = ({
     }
 
     setIsSubmitting(true);
+    setProgress([]);
 
     try {
       const formData = new FormData();
@@ -73,11 +90,25 @@ export const StudentSubmission = ({
 
       if (!res.ok) {
         console.error('Submission failed', res);
-        alert('Submission failed. Please try again.');
+        alert(res.data?.error || 'Submission failed. Please try again.');
+        return;
+      }
+
+      // The server queues the submission (202) and grades it in the background;
+      // an identical re-upload comes back already done with the earlier result
+      const job = res.data.status === 'done'
+        ? res
+        : await api.streamGradingJob(res.data.job_id, (event, data) => {
+            const line = describeProgress(event, data);
+            if (line) setProgress((previous) => [...previous, line]);
+          });
+      if (!job.ok || job.data.status !== 'done') {
+        console.error('Grading failed', job);
+        alert(job.data?.error || 'Grading failed. Please try again.');
         return;
       }
 
-      const data = res.data || {};
+      const data = job.data.result || {};
       
       setGradingResult({
         grading_result: data.grading_result ?? null,
@@ -88,6 +119,7 @@ export const StudentSubmission = ({
         student_name: data.student_name ?? '',
         submitted_at: data.submitted_at ?? new Date().toISOString(),
         complexity: data.complexity ?? 0, 
+        reused: data.reused ?? false,
       });
 
       setView('grading');
@@ -268,6 +300,11 @@ export const StudentSubmission = ({
             {isSubmitting ? 'Analyzing & Grading...' : 'Submit Assignment'}
           </button>
         </div>
+        {isSubmitting && progress.length > 0 && (
+          <ul className="mt-3 space-y-1 text-sm text-slate-600">
+            {progress.map((line, i) => <li key={i}>{line}</li>)}
+          </ul>
+        )}
       </form>
     </div>
   );
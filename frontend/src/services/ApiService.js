@@ -111,6 +111,72 @@ class ApiService {
     async uploadSubmission(assignmentId, formData) {
         return this.request(`/submit/${assignmentId}`, 'POST', formData, true);
     }
+
+    async getGradingJob(jobId) {
+        return this.request(`/grading-jobs/${jobId}`);
+    }
+
+    /**
+     * Follows a grading job's progress stream (server-sent events) until it is done or failed.
+     * onEvent(event, data) is called for every progress event (code_generated, complexity, tests, ...).
+     * The server closes each stream after about a minute; it is reopened from the last event id.
+     * Resolves like waitForGradingJob; falls back to polling if the stream cannot be read.
+     */
+    async streamGradingJob(jobId, onEvent = () => {}, { timeoutMs = 5 * 60 * 1000 } = {}) {
+        const deadline = Date.now() + timeoutMs;
+        let lastEventId = '';
+        try {
+            while (Date.now() < deadline) {
+                const headers = this._getHeaders(null);
+                if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+                const response = await fetch(`${API_BASE}/grading-jobs/${jobId}/events`, { headers });
+                if (!response.ok || !response.body) throw new Error(`Event stream unavailable (${response.status})`);
+
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                for (;;) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    let end;
+                    while ((end = buffer.indexOf('\n\n')) !== -1) {
+                        const message = buffer.slice(0, end);
+                        buffer = buffer.slice(end + 2);
+                        let event = 'message', data = '';
+                        for (const line of message.split('\n')) {
+                            if (line.startsWith('id: ')) lastEventId = line.slice(4);
+                            else if (line.startsWith('event: ')) event = line.slice(7);
+                            else if (line.startsWith('data: ')) data += line.slice(6);
+                        }
+                        if (!data) continue;
+                        const payload = JSON.parse(data);
+                        if (event === 'done') return { ok: true, status: 200, data: { status: 'done', result: payload.result } };
+                        if (event === 'failed') return { ok: true, status: 200, data: { status: 'failed', error: payload.error } };
+                        onEvent(event, payload);
+                    }
+                }
+            }
+        } catch (e) {
+            console.warn('Grading event stream failed, polling instead', e);
+            return this.waitForGradingJob(jobId, { timeoutMs: Math.max(deadline - Date.now(), 0) });
+        }
+        return { ok: false, status: 408, data: { error: 'Grading is taking longer than expected. Check your submissions later.' } };
+    }
+
+    /**
+     * Polls a grading job until it is done or failed.
+     * Resolves with the final status response; gives up after timeoutMs.
+     */
+    async waitForGradingJob(jobId, { intervalMs = 1500, timeoutMs = 5 * 60 * 1000 } = {}) {
+        const deadline = Date.now() + timeoutMs;
+        while (Date.now() < deadline) {
+            const res = await this.getGradingJob(jobId);
+            if (!res.ok || res.data.status === 'done' || res.data.status === 'failed') return res;
+            await new Promise((resolve) => setTimeout(resolve, intervalMs));
+        }
+        return { ok: false, status: 408, data: { error: 'Grading is taking longer than expected. Check your submissions later.' } };
+    }
 }
 
 // Export as a Singleton
@@ -78,6 +78,10 @@ export DB_PASSWORD="password"
 export PYTHONPATH="$APP_DIR"
 export FLASK_APP=backend.main:app
 
+# Shared by the gunicorn and grading worker processes so /metrics adds up all of them
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-$APP_DIR/.metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # 2. Ensure frontend assets are available (helps fresh runs after a clean install)
 ensure_frontend_assets
 
@@ -94,11 +98,18 @@ log "Starting StructogramAI Server..."
 fuser -k 5000/tcp > /dev/null 2>&1
 
 # Run Gunicorn in background
-"$PYTHON_ENV/bin/gunicorn" --workers 1 --bind 0.0.0.0:5000 backend.main:app > "$APP_DIR/app.log" 2>&1 &
+# Threaded workers: an open grading event stream occupies a sleeping thread, not a whole worker.
+# At most GRADING_EVENTS_MAX_STREAMS (default 8) of the 16 threads serve streams; further clients poll.
+"$PYTHON_ENV/bin/gunicorn" --workers 1 --worker-class gthread --threads 16 --bind 0.0.0.0:5000 backend.main:app > "$APP_DIR/app.log" 2>&1 &
 SERVER_PID=$!
 
 log "Server PID: $SERVER_PID. Logs writing to app.log"
 
+# Grading workers drain the submission queue (GRADING_WORKERS processes, default 2)
+"$PYTHON_ENV/bin/python" -m backend.services.grading.worker > "$APP_DIR/worker.log" 2>&1 &
+WORKER_PID=$!
+log "Grading worker PID: $WORKER_PID. Logs writing to worker.log"
+
 # 5. Wait for Server & Open Browser
 log "Waiting for server to launch..."
 
@@ -106,7 +117,7 @@ log "Waiting for server to launch..."
 cleanup() {
     echo ""
     log "Shutting down..."
-    kill $SERVER_PID
+    kill $SERVER_PID $WORKER_PID
     exit
 }
 trap cleanup SIGINT
@@ -120,7 +131,7 @@ while ! nc -z localhost 5000; do
   if [ $count -ge $MAX_RETRIES ]; then
       warn "Server failed to start. Check app.log for details."
       cat "$APP_DIR/app.log"
-      kill $SERVER_PID
+      kill $SERVER_PID $WORKER_PID
       exit 1
   fi
 done
@@ -60,4 +60,113 @@ def test_plagiarism_hybrid_logic():
     # Hybrid score should be weighted (40% structure)
     score_struct, _ = detect_plagiarism("x = 5", new_sig, [sub1])
     # 0.6*0 + 0.4*100 = 40
-    assert score_struct >= 40
\ No newline at end of file
+    assert score_struct >= 40
+def test_minhash_bands_find_similar_code_only():
+    from backend.services.analysis import minhash
+    code = "total = 0\nfor i in range(n):\n    if i % 2 == 0:\n        total = total + i\nprint(total)"
+    renamed_print = code.replace("print(total)", "print(total, i)")
+    unrelated = "while True:\n    line = input()\n    if not line:\n        break\n    words.append(line.upper())"
+
+    sig = minhash.signature(code)
+    assert len(sig) == minhash.NUM_PERM and minhash.signature(code) == sig
+    assert minhash.estimate_similarity(sig, minhash.signature(renamed_print)) > 0.6
+    assert minhash.estimate_similarity(sig, minhash.signature(unrelated)) < 0.2
+    buckets = set(minhash.band_buckets(sig))
+    assert buckets & set(minhash.band_buckets(minhash.signature(renamed_print)))
+    assert not buckets & set(minhash.band_buckets(minhash.signature(unrelated)))
+    assert minhash.signature("") is None
+
+def _flowchart(kinds, links):
+    styles = {'decision': 'rhombus;', 'process': 'rounded=1;'}
+    nodes = {str(i): {'value': kind if kind in ('start', 'end') else f"step {i}", 'style': styles.get(kind, 'ellipse;')} for i, kind in enumerate(kinds)}
+    edges = {}
+    for a, b in links: edges.setdefault(str(a), []).append({'target': str(b), 'value': ''})
+    return nodes, edges
+
+def test_wl_histogram_tolerates_small_changes():
+    from backend.services.analysis.plagiarism import wl_histogram, wl_similarity, WL_BINS
+    loop = _flowchart(['start', 'process', 'decision', 'process', 'end'], [(0, 1), (1, 2), (2, 3), (3, 2), (2, 4)])
+    hist = wl_histogram(*loop)
+    assert len(hist) == WL_BINS and wl_similarity(hist, hist) == 100
+    # Label text is ignored, only node kinds count
+    renamed = {n: {**d, 'value': d['value'].upper() if d['value'] not in ('start', 'end') else d['value']} for n, d in loop[0].items()}
+    assert wl_histogram(renamed, loop[1]) == hist
+    # One extra statement in the loop body still scores high; a straight-line program does not
+    longer = _flowchart(['start', 'process', 'decision', 'process', 'process', 'end'], [(0, 1), (1, 2), (2, 3), (3, 4), (4, 2), (2, 5)])
+    straight = _flowchart(['start', 'process', 'process', 'process', 'end'], [(0, 1), (1, 2), (2, 3), (3, 4)])
+    assert wl_similarity(hist, wl_histogram(*longer)) >= 50 > wl_similarity(hist, wl_histogram(*straight))
+    assert wl_histogram({}, {}) is None
+
+def test_plagiarism_batch_matches_pairwise_scores():
+    import random
+    from backend.services.analysis.plagiarism import detect_plagiarism_batch, calculate_jaccard_similarity, wl_histogram, wl_similarity, wl_similarity_batch
+    rng = random.Random(7)
+    def graph():
+        size = rng.randint(3, 12)
+        kinds = ['start'] + [rng.choice(['process', 'process', 'decision']) for _ in range(size - 2)] + ['end']
+        return wl_histogram(*_flowchart(kinds, [(i, i + 1) for i in range(size - 1)] + [(rng.randrange(size), rng.randrange(size)) for _ in range(2)]))
+    new_sig = graph()
+    previous = [{'id': i, 'generated_code': f"x = {i % 3}\nprint(x)", 'graph_signature': graph()} for i in range(200)]
+    previous.append({'id': 999, 'generated_code': "y = 1", 'graph_signature': list(new_sig)})
+
+    expected = [wl_similarity(new_sig, p['graph_signature']) for p in previous]
+    assert wl_similarity_batch(new_sig, [p['graph_signature'] for p in previous]).tolist() == expected
+
+    # Same best score as the pairwise hybrid, whether a submission arrives as a text candidate or a structural row
+    code = "x = 1\nprint(x)"
+    best = max(int(calculate_jaccard_similarity(code, p['generated_code']) * 0.6 + s * 0.4) for p, s in zip(previous, expected))
+    assert detect_plagiarism_batch(code, new_sig, previous)[0] == best
+    structural = {'ids': [p['id'] for p in previous[1:]], 'text_scores': [0] * (len(previous) - 1),
+                  'graph_signatures': [p['graph_signature'] for p in previous[1:]]}
+    score, match = detect_plagiarism_batch("z = 2", new_sig, previous[:1], structural)
+    assert match == 999 and score == 40
+
+def test_winnowing_is_order_aware_and_ignores_renaming():
+    import re
+    from backend.services.analysis import winnowing
+    code = "total = 0\nfor i in range(n):\n    if i % 2 == 0:\n        total = total + i\nprint(total)"
+    renamed = re.sub(r"\bi\b", "k", code.replace("total", "acc"))
+    # Same tokens as code, but in another order
+    shuffled = "\n".join(reversed(code.splitlines()))
+
+    prints = {h for h, _, _ in winnowing.fingerprints(code)}
+    assert prints and prints == {h for h, _, _ in winnowing.fingerprints(renamed)}
+    assert len(prints & {h for h, _, _ in winnowing.fingerprints(shuffled)}) < len(prints) / 2
+    assert winnowing.fingerprints("x = 1") == []
+    assert winnowing.merge_ranges([(1, 2, 5, 6), (2, 3, 6, 7), (9, 9, 1, 1)]) == [
+        {"lines": [1, 3], "other_lines": [5, 7]}, {"lines": [9, 9], "other_lines": [1, 1]}]
+
+def test_sparse_all_pairs_matches_jaccard():
+    import random
+    from backend.services.analysis import similarity_matrix
+    from backend.services.analysis.plagiarism import calculate_jaccard_similarity, normalize_code, weighted_jaccard_similarity
+    rng = random.Random(3)
+    words = ["for", "if", "print", "total", "i", "x", "0", "1", "range", "while", "input", "name"]
+    codes = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 8))) for _ in range(300)] + [""]
+    matrix, vocabulary = similarity_matrix.token_matrix([normalize_code(c) for c in codes])
+    rows, cols, scores = similarity_matrix.similar_pairs(matrix, 40)
+    expected = {(i, j): calculate_jaccard_similarity(codes[i], codes[j]) for i in range(len(codes)) for j in range(i + 1, len(codes))}
+    assert dict(zip(zip(rows.tolist(), cols.tolist()), scores.tolist())) == {k: v for k, v in expected.items() if v >= 40}
+
+    # Weighted, with a weight of 0 dropping a token altogether
+    weights = {t: 0.0 if t == "print" else 1.0 + len(t) for t in vocabulary}
+    rows, cols, scores = similarity_matrix.similar_pairs(matrix, 40, [weights[t] for t in vocabulary])
+    expected = {(i, j): weighted_jaccard_similarity(normalize_code(codes[i]), normalize_code(codes[j]), weights, frozenset({"print"}))
+                for i in range(len(codes)) for j in range(i + 1, len(codes))}
+    assert dict(zip(zip(rows.tolist(), cols.tolist()), scores.tolist())) == {k: v for k, v in expected.items() if v >= 40}
+    assert similarity_matrix.clusters(4, [0, 2], [1, 1]) == [[0, 1, 2]]
+
+def test_idf_weighting_discounts_boilerplate():
+    from backend.services.analysis.plagiarism import idf_weight, weighted_jaccard_similarity, calculate_jaccard_similarity, normalize_code
+    boilerplate = "#include <iostream>\nusing namespace std;\nint main() {\n"
+    a = boilerplate + "int total = 0;\ncout << total;\n}"
+    b = boilerplate + "string name;\ncin >> name;\n}"
+    tokens_a, tokens_b = normalize_code(a), normalize_code(b)
+    # 40 submissions all share the boilerplate; the rest is rare
+    df = {t: 40 for t in normalize_code(boilerplate)}
+    weights = {t: idf_weight(df.get(t, 1), 40) for t in tokens_a | tokens_b}
+    assert calculate_jaccard_similarity(a, b) > 40
+    assert weighted_jaccard_similarity(tokens_a, tokens_b, weights) < 25
+    assert weighted_jaccard_similarity(tokens_a, tokens_a, weights) == 100
+    # Template tokens are ignored, so two copies of the template alone do not match
+    assert weighted_jaccard_similarity(tokens_a, tokens_a, weights, exclude=frozenset(tokens_a)) == 0
@@ -0,0 +1,226 @@
+import shutil
+import pytest
+from backend.services.execution.engine import execute_python, execute_cpp, run_test_cases
+
+@pytest.fixture(autouse=True)
+def no_execution_memo(monkeypatch):
+    # Every test must really execute, whatever earlier runs left in the database
+    from backend.services.execution import memo
+    monkeypatch.setattr(memo, 'ENABLED', False)
+
+# --- PYTHON (warm runner pool) ---
+def test_python_reads_stdin():
+    res = execute_python("x = int(input())\nprint(x * 2)", "21")
+    assert res['success'] and res['output'] == "42"
+
+def test_python_runtime_error_reports_traceback():
+    res = execute_python("print('before')\nraise ValueError('bad')", "")
+    assert not res['success']
+    assert res['output'] == "before"
+    assert "ValueError: bad" in res['error']
+
+def test_python_exit_code_and_timeout():
+    assert execute_python("raise SystemExit(0)", "")['success']
+    assert not execute_python("raise SystemExit(3)", "")['success']
+    res = execute_python("while True: pass", "")
+    assert res['timeout'] and not res['success']
+
+def test_python_fallback_without_pool(monkeypatch):
+    monkeypatch.setenv("PYTHON_RUNNER_POOL_SIZE", "0")
+    res = execute_python("print(input()[::-1])", "abc")
+    assert res['output'] == "cba"
+
+def test_runner_pool_replaces_dead_runner_for_waiters():
+    import threading
+    from backend.services.execution.python_runner import PythonRunnerPool, RunnerUnavailable
+    pool = PythonRunnerPool(1)
+    try:
+        # A submission that kills its runner must not leave the pool short
+        with pytest.raises(RunnerUnavailable):
+            pool.run("import os, signal\nos.kill(os.getppid(), signal.SIGKILL)", "")
+        busy = pool._acquire()
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(pool.run("print(input())", "ok")))
+        waiter.start()
+        busy.kill(); pool._release(busy)
+        waiter.join(10)
+        assert results and results[0]['output'] == "ok"
+    finally:
+        pool.close()
+
+def test_run_test_cases_python():
+    cases = [{'input': '1', 'output': '2'}, {'input': '5', 'output': '7'}]
+    report = run_test_cases("print(int(input()) + 1)", cases, language='python')
+    assert report['total'] == 2 and report['passed'] == 1
+    assert report['results'][1]['actual'] == "6"
+
+# --- COMPILED LANGUAGES ---
+def test_cpp_compiles_once_for_all_cases(monkeypatch):
+    from backend.services.execution import engine
+    calls = []
+    real_compile = engine.COMPILERS['cpp']
+    monkeypatch.setitem(engine.COMPILERS, 'cpp', lambda code, **options: calls.append(options) or real_compile(code, **options))
+    code = "#include <iostream>\nint main() { int x; std::cin >> x; std::cout << x * x << std::endl; }"
+    cases = [{'input': str(i), 'output': str(i * i)} for i in range(4)]
+    report = run_test_cases(code, cases, language='cpp', opt_level='fast-run')
+    assert report['passed'] == 4
+    assert calls == [{'opt_level': 'fast-run'}]
+
+def test_cpp_compile_error_short_circuits():
+    cases = [{'input': '1', 'output': '1'}, {'input': '2', 'output': '2'}]
+    report = run_test_cases("int main( {", cases, language='cpp')
+    assert report['passed'] == 0
+    assert report['error'].startswith("Compilation Error")
+    assert all(r['error'] == report['error'] for r in report['results'])
+
+def test_artifact_cache_hits_and_evicts(monkeypatch, tmp_path):
+    from backend.services.execution import artifact_cache
+    monkeypatch.setattr(artifact_cache, "CACHE_ROOT", str(tmp_path / "cache"))
+    code = "#include <iostream>\nint main() { std::cout << 7 << std::endl; }"
+    before = artifact_cache.get_stats()
+
+    assert execute_cpp(code, "")['output'] == "7"
+    assert execute_cpp(code, "")['output'] == "7"
+    stats = artifact_cache.get_stats()
+    assert stats['misses'] - before['misses'] == 1
+    assert stats['hits'] - before['hits'] == 1
+    assert stats['entries'] == 1
+    assert (tmp_path / "cache").stat().st_mode & 0o777 == 0o700
+
+    # An entry in use survives eviction until it is released
+    from backend.services.execution import cpp_toolchain
+    entry = artifact_cache.get_or_build('cpp', cpp_toolchain.compile_flags(), code, lambda out_dir: pytest.fail("cached entry was rebuilt"))
+    assert artifact_cache.evict(max_bytes=0) == 0
+    artifact_cache.unpin(entry['pin'])
+    assert artifact_cache.evict(max_bytes=0) == 1
+    assert artifact_cache.get_stats()['entries'] == 0
+
+def test_artifact_cache_refuses_shared_root(monkeypatch, tmp_path):
+    from backend.services.execution import artifact_cache
+    tmp_path.chmod(0o777)
+    monkeypatch.setattr(artifact_cache, "CACHE_ROOT", str(tmp_path))
+    assert not artifact_cache.cache_enabled()
+
+def test_precompiled_header_refuses_shared_root(monkeypatch, tmp_path):
+    from backend.services.execution import cpp_toolchain
+    tmp_path.chmod(0o777)
+    monkeypatch.setattr(cpp_toolchain, "PCH_ROOT", str(tmp_path))
+    monkeypatch.setattr(cpp_toolchain, "_pch_headers", {})
+    assert cpp_toolchain.compile_flags('fast-run', use_pch=True) == ['-O2']
+
+def test_run_test_cases_parallel_keeps_order():
+    code = "import time\nn = int(input())\ntime.sleep(0.3 - n * 0.05)\nprint(n)"
+    cases = [{'input': str(i), 'output': str(i)} for i in range(6)]
+    report = run_test_cases(code, cases, language='python', concurrency=6)
+    assert report['passed'] == 6
+    assert [r['actual'] for r in report['results']] == [str(i) for i in range(6)]
+
+def test_cpp_precompiled_prelude_and_opt_levels():
+    from backend.services.execution import cpp_toolchain
+    flags = cpp_toolchain.compile_flags('fast-run', use_pch=True)
+    assert flags[0] == '-O2'
+    assert flags[1:] == ['-include', cpp_toolchain.precompiled_header('-O2')]
+    code = "#include <iostream>\nusing namespace std;\n\nint main() {\n    cout << 6 * 7 << endl;\n    return 0;\n}"
+    for level in cpp_toolchain.OPT_LEVELS:
+        assert execute_cpp(code, "", opt_level=level)['output'] == "42"
+
+@pytest.mark.skipif(shutil.which("javac") is None, reason="needs a JDK")
+def test_jvm_daemon_runs_and_isolates_submissions(monkeypatch):
+    from backend.services.execution import jvm_daemon
+    monkeypatch.setattr(jvm_daemon, 'ENABLED', True)
+    monkeypatch.setattr(jvm_daemon, '_last_failure', 0.0)
+    double = ("import java.util.Scanner;\npublic class Main {\n    public static void main(String[] args) {\n"
+              "        System.out.println(new Scanner(System.in).nextInt() * 2);\n    }\n}")
+    # Reaching the daemon's program cache through reflection must fail
+    snoop = ("public class Main {\n    public static void main(String[] args) throws Exception {\n"
+             "        Class<?> daemon = StackWalker.getInstance(StackWalker.Option.RETAIN_CLASS_REFERENCE)\n"
+             "            .walk(frames -> frames.map(StackWalker.StackFrame::getDeclaringClass)\n"
+             "                .filter(c -> c.getName().startsWith(\"structogram.\")).findFirst()).get();\n"
+             "        java.lang.reflect.Field programs = daemon.getDeclaredField(\"PROGRAMS\");\n"
+             "        programs.setAccessible(true);\n"
+             "        System.out.println(\"leaked \" + programs.get(null));\n    }\n}")
+    try:
+        assert jvm_daemon.compile_java(double)['success']
+        assert jvm_daemon.run_java(double, "21")['output'] == "42"
+        assert not jvm_daemon.compile_java("public class Main {")['success']
+        res = jvm_daemon.run_java(snoop, "")
+        assert not res['success'] and "leaked" not in res['output']
+        assert jvm_daemon.run_java(double, "4")['output'] == "8"
+    finally:
+        if jvm_daemon._daemon: jvm_daemon._daemon.close()
+        monkeypatch.setattr(jvm_daemon, '_daemon', None)
+
+def test_python_harness_falls_back_on_exit():
+    code = "import sys\nn = int(input())\nif n == 2: sys.exit(1)\nprint(n)"
+    cases = [{'input': str(i), 'output': str(i)} for i in range(1, 4)]
+    report = run_test_cases(code, cases, language='python', concurrency=1)
+    assert [r['passed'] for r in report['results']] == [True, False, True]
+
+def test_python_harness_timeout_is_per_case():
+    code = "n = int(input())\nwhile n == 2:\n    pass\nprint(n)"
+    cases = [{'input': str(i), 'output': str(i)} for i in range(1, 4)]
+    report = run_test_cases(code, cases, language='python', concurrency=1)
+    assert report['passed'] == 2
+    assert "Timed Out" in report['results'][1]['error']
+
+def test_output_cap_and_resource_accounting():
+    for res in (execute_python("while True:\n    print('x' * 100)", ""),
+                execute_cpp("#include <iostream>\nint main() { while (true) std::cout << \"xxxxxxxx\"; }", "")):
+        assert res['error'] == "Output Limit Exceeded" and not res['timeout']
+    report = run_test_cases("print(sum(range(int(input()))))", [{'input': '1000', 'output': '499500'}])
+    case = report['results'][0]
+    assert case['passed'] and case['cpu_time'] >= 0 and case['peak_memory_kb'] > 0
+    assert report['resources']['wall_time'] >= case['wall_time']
+
+def test_run_command_limits_apply_without_preexec():
+    import sys
+    from backend.services.execution.engine import run_command
+    probe = "import resource\nprint(resource.getrlimit(resource.RLIMIT_NOFILE)[0], resource.getrlimit(resource.RLIMIT_CPU))"
+    res = run_command([sys.executable, "-c", probe], limits={"memory_bytes": None, "open_files": 32}, timeout=2)
+    assert res['output'] == "32 (3, 4)" and res['peak_memory_kb'] > 0
+    assert run_command(["no-such-program"], limits={})['error'].startswith("System Error")
+
+def test_memoized_cases_skip_execution(monkeypatch):
+    from backend.services.execution import memo
+    stored = {}
+    monkeypatch.setattr(memo, 'lookup', lambda keys: {k: {**stored[k], "cached": True} for k in keys if k in stored})
+    monkeypatch.setattr(memo, 'store', lambda language, entries: stored.update(entries))
+    code = "print(int(input()) + 1)"
+    cases = [{'input': '1', 'output': '2'}, {'input': '2', 'output': '3'}]
+    first = run_test_cases(code, cases)
+    assert first['passed'] == 2 and not any(r['cached'] for r in first['results'])
+    assert len(stored) == 2
+
+    monkeypatch.setattr(memo, 'store', lambda language, entries: pytest.fail("memo hit was re-run"))
+    second = run_test_cases(code, cases)
+    assert second['passed'] == 2 and all(r['cached'] for r in second['results'])
+
+    # Builds at different optimization levels never share results
+    from backend.services.execution.engine import memo_flags
+    assert memo.memo_key('cpp', code, '1', memo_flags('cpp', 'fast-run')) != memo.memo_key('cpp', code, '1', memo_flags('cpp', 'fast-compile'))
+
+def test_scratch_workspaces_are_reused_and_swept():
+    import os
+    from backend.services.execution import workspace
+    with workspace.scratch() as path:
+        open(os.path.join(path, "leftover.txt"), "w").close()
+    with workspace.scratch() as again:
+        assert again == path and os.listdir(again) == []
+
+    pid = os.fork()
+    if pid == 0: os._exit(0)
+    os.waitpid(pid, 0)
+    orphan = os.path.join(workspace.WORKSPACE_ROOT, f"{pid}-1")
+    os.makedirs(orphan)
+    assert workspace.sweep() >= 1
+    assert not os.path.exists(orphan) and os.path.isdir(path)
+
+def test_scratch_workspaces_refuse_shared_root(monkeypatch, tmp_path):
+    import os
+    from backend.services.execution import workspace
+    tmp_path.chmod(0o777)
+    monkeypatch.setattr(workspace, "WORKSPACE_ROOT", str(tmp_path))
+    with workspace.scratch() as path:
+        assert os.path.dirname(path) != str(tmp_path)
+        assert os.stat(path).st_mode & 0o777 == 0o700
+    assert os.listdir(tmp_path) == []
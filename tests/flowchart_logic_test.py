@@ -102,4 +102,25 @@ def test_orphan_node_handling(gen):
     with pytest.raises(Exception) as excinfo:
         _parse_block('1', None, nodes, edges, gen)
     
-    assert "no outgoing connections" in str(excinfo.value)
\ No newline at end of file
+    assert "no outgoing connections" in str(excinfo.value)
+
+
+def test_document_parsed_once_and_shared():
+    from backend.services.parsers.document import load_document
+    from backend.services.parsers.flowchart import parse_drawio_xml, _build_graph
+    xml = """<mxfile><diagram><mxGraphModel><root>
+        <mxCell id="0"/><mxCell id="1" parent="0"/>
+        <mxCell id="s" value="Start" style="ellipse" vertex="1" parent="1"/>
+        <mxCell id="a" value="x = 1" style="rounded=1" vertex="1" parent="1"/>
+        <mxCell id="e" value="End" style="ellipse" vertex="1" parent="1"/>
+        <mxCell id="e1" edge="1" source="s" target="a" parent="1"/>
+        <mxCell id="e2" edge="1" source="a" target="e" parent="1"/>
+    </root></mxGraphModel></diagram></mxfile>"""
+    document = load_document(xml)
+    assert document.diagram_type() == 'flowchart'
+
+    code, nodes, edges, start_id = parse_drawio_xml(document, return_graph=True)
+    assert "x = 1" in code
+    assert start_id == 's'
+    # The graph is built once per document and reused
+    assert _build_graph(document) is document.cache['flowchart_graph']
@@ -0,0 +1,32 @@
+import time
+import pytest
+from backend.services.grading.stages import run_stage_graph
+
+def _sleep_then(value, seconds):
+    def run(_):
+        time.sleep(seconds)
+        return value
+    return run
+
+def test_independent_stages_run_concurrently():
+    stages = {name: {"run": _sleep_then(name, 0.3)} for name in ("tests", "grading", "plagiarism")}
+    start = time.monotonic()
+    outcomes = run_stage_graph(stages)
+    assert time.monotonic() - start < 0.6
+    assert {name: o['value'] for name, o in outcomes.items()} == {n: n for n in stages}
+
+def test_failed_and_slow_stages_keep_other_results():
+    def boom(_): raise RuntimeError("AI down")
+    outcomes = run_stage_graph({
+        "grading": {"run": boom, "default": None},
+        "tests": {"run": _sleep_then("late", 5), "timeout": 0.2, "default": "none"},
+        "static_analysis": {"run": _sleep_then("report", 0.05)},
+        "summary": {"run": lambda values: values["static_analysis"] + "!", "after": ["static_analysis"]},
+    })
+    assert outcomes["grading"]["status"] == "failed" and "AI down" in outcomes["grading"]["error"]
+    assert outcomes["tests"]["status"] == "timeout" and outcomes["tests"]["value"] == "none"
+    assert outcomes["summary"]["value"] == "report!"
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError):
+        run_stage_graph({"a": {"run": lambda _: 1, "after": ["missing"]}})
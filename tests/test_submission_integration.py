@@ -1,13 +1,18 @@
+import os
 import pytest
 import io
+import time
 import json
+import requests
 from unittest.mock import patch, MagicMock
-from backend.main import app
+from backend.main import app, limiter
 from backend.core.database import get_db_connection, release_db_connection
+from backend.services.grading import worker
 
 @pytest.fixture
 def client():
     app.config['TESTING'] = True
+    limiter.enabled = False  # several tests register and submit within one minute
     with app.test_client() as client:
         yield client
 
@@ -23,8 +28,8 @@ def setup_assignment(client):
     release_db_connection(conn)
 
     # 2. Create Teacher & Seminar
-    client.post('/auth/register', json={"username": "teacher", "email": "t@t.com", "password": "pwd", "role": "teacher"})
-    login_res = client.post('/auth/login', json={"identifier": "teacher", "password": "pwd"})
+    client.post('/auth/register', json={"username": "teacher", "email": "t@t.com", "password": "secret123", "role": "teacher"})
+    login_res = client.post('/auth/login', json={"identifier": "teacher", "password": "secret123"})
     headers = {"Authorization": f"Bearer {login_res.json['token']}"}
     
     sem_res = client.post('/seminar', json={"title": "CS101", "invite_code": "CS101"}, headers=headers)
@@ -50,8 +55,8 @@ def test_submission_flow_with_mocked_ai(client, setup_assignment):
     assignment_id, teacher_headers = setup_assignment
     
     # 1. Register Student & Join Seminar
-    client.post('/auth/register', json={"username": "student", "email": "s@s.com", "password": "pwd", "role": "student"})
-    login_res = client.post('/auth/login', json={"identifier": "student", "password": "pwd"})
+    client.post('/auth/register', json={"username": "student", "email": "s@s.com", "password": "secret123", "role": "student"})
+    login_res = client.post('/auth/login', json={"identifier": "student", "password": "secret123"})
     student_headers = {"Authorization": f"Bearer {login_res.json['token']}"}
     client.post('/seminar/join', json={"invite_code": "CS101"}, headers=student_headers)
 
@@ -95,25 +100,33 @@ def test_submission_flow_with_mocked_ai(client, setup_assignment):
             "diagram_file": fake_image
         }
 
-        # 4. Perform POST Request
+        # 4. Perform POST Request: the submission is queued and answered right away
+        res = client.post(f'/submit/{assignment_id}', data=submission_data, 
+                         content_type='multipart/form-data', headers=student_headers)
+        assert res.status_code == 202
+        job_id = res.json['job_id']
+        assert client.get(f'/grading-jobs/{job_id}', headers=student_headers).json['status'] == 'queued'
+
+        # 5. Let a grading worker pick up the job
         # Note: We also need to mock 'parse_image_diagram' since we aren't uploading a real flowchart
         # and we don't want the backend to actually try processing bytes with OpenCV
-        with patch('backend.main.parse_image_diagram') as mock_parser:
+        with patch('backend.services.grading.pipeline.parse_image_diagram') as mock_parser:
             mock_parser.return_value = "print('Generated Code from Image')"
-            
-            res = client.post(f'/submit/{assignment_id}', data=submission_data, 
-                             content_type='multipart/form-data', headers=student_headers)
+            assert worker.run_once()
+            assert not worker.run_once()  # queue drained
 
-    # 5. Assertions
-    assert res.status_code == 200
-    data = res.json
+    # 6. Assertions
+    status = client.get(f'/grading-jobs/{job_id}', headers=student_headers)
+    assert status.status_code == 200
+    assert status.json['status'] == 'done'
+    data = status.json['result']
     
     # Verify Mocked Data made it through
     assert data['grading_result']['score'] == 85
     assert data['generated_code'] == "print('Generated Code from Image')"
     assert "Execution Test Results" not in data['grading_result']['feedback'] # No tests configured
 
-    # 6. Verify Database Persistence
+    # 7. Verify Database Persistence
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("SELECT grading_result, generated_code FROM submissions WHERE assignment_id=%s", (assignment_id,))
@@ -123,4 +136,328 @@ def test_submission_flow_with_mocked_ai(client, setup_assignment):
 
     assert row is not None
     assert row[1] == "print('Generated Code from Image')"
-    assert row[0]['score'] == 85
\ No newline at end of file
+    assert row[0]['score'] == 85
+def test_identical_resubmission_reuses_result(client, setup_assignment):
+    assignment_id, _ = setup_assignment
+    client.post('/auth/register', json={"username": "student", "email": "s@s.com", "password": "secret123", "role": "student"})
+    login_res = client.post('/auth/login', json={"identifier": "student", "password": "secret123"})
+    student_headers = {"Authorization": f"Bearer {login_res.json['token']}"}
+    client.post('/seminar/join', json={"invite_code": "CS101"}, headers=student_headers)
+
+    def submit():
+        data = {"submission_mode": "image", "diagram_type": "flowchart", "description": "Sum",
+                "diagram_file": (io.BytesIO(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"), 'diagram.png')}
+        return client.post(f'/submit/{assignment_id}', data=data, content_type='multipart/form-data', headers=student_headers)
+
+    first = submit()
+    assert first.status_code == 202
+    # Double click while the first one is still queued: same job
+    assert submit().json['job_id'] == first.json['job_id']
+
+    with patch('backend.services.grading.pipeline.parse_image_diagram', return_value="print('x')"), \
+         patch('backend.services.grading.pipeline.grade_with_ai', return_value={"score": 70, "feedback": "ok"}):
+        assert worker.run_once()
+
+    again = submit()
+    assert again.status_code == 200
+    assert again.json['reused'] and again.json['result']['grading_result']['score'] == 70
+    assert not worker.run_once()  # nothing was queued for the reused upload
+
+    # The copy has a file of its own
+    conn = get_db_connection(); cur = conn.cursor()
+    cur.execute("SELECT file_path FROM submissions WHERE id IN (%s, %s)", (first.json['submission_id'], again.json['submission_id']))
+    paths = [row[0] for row in cur.fetchall()]
+    assert len(set(paths)) == 2 and all(os.path.exists(p) for p in paths)
+    # and does not count as another document for the plagiarism token frequencies
+    cur.execute("SELECT df FROM plagiarism_token_df WHERE assignment_id = %s AND token = 'print'", (assignment_id,))
+    assert cur.fetchone()[0] == 1
+
+    # A result whose grading stage did not finish is never handed out again
+    cur.execute("""UPDATE grading_jobs SET result = jsonb_set(result, '{stages,grading,status}', '"timeout"')
+                   WHERE submission_id IN (%s, %s)""", (first.json['submission_id'], again.json['submission_id']))
+    conn.commit(); cur.close(); release_db_connection(conn)
+    assert submit().status_code == 202
+
+def test_assignment_update_invalidates_cache(client, setup_assignment):
+    from psycopg2.extras import RealDictCursor
+    from backend.services.grading import assignment_cache
+    assignment_id, headers = setup_assignment
+    conn = get_db_connection(); cur = conn.cursor(cursor_factory=RealDictCursor)
+    def wait_for(condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline: time.sleep(0.02)
+        return condition()
+    try:
+        assert assignment_cache.get_assignment(cur, assignment_id)['title'] == "Test Assignment"
+        # Once the listener is connected a hit does not touch the database at all
+        assert wait_for(lambda: assignment_cache._listening)
+        assert assignment_cache.get_assignment(cur, assignment_id)['title'] == "Test Assignment"
+        assert assignment_cache.get_assignment(None, assignment_id)['title'] == "Test Assignment"
+        # Another process updates the row: the trigger's notification makes this process reload it
+        cur.execute("UPDATE assignments SET title = 'Renamed elsewhere', version = version + 1 WHERE id = %s", (assignment_id,)); conn.commit()
+        assert wait_for(lambda: assignment_cache.get_assignment(cur, assignment_id)['title'] == "Renamed elsewhere")
+
+        res = client.put(f'/assignment/{assignment_id}', json={"title": "Renamed", "grading_prompt": "Check loops"}, headers=headers)
+        assert res.status_code == 200 and res.json['version'] == 3
+        cached = assignment_cache.get_assignment(cur, assignment_id)
+        assert cached['title'] == "Renamed" and cached['grading_prompt'] == "Check loops"
+        assert assignment_cache.template_text(cached) == "print('hello')"
+
+        client.delete(f'/assignment/{assignment_id}', headers=headers)
+        assert assignment_cache.get_assignment(cur, assignment_id) is None
+    finally: conn.rollback(); cur.close(); release_db_connection(conn)
+
+def test_metrics_endpoint_reports_stages(client, setup_assignment):
+    assignment_id, headers = setup_assignment
+    data = {"submission_mode": "image", "diagram_type": "flowchart", "description": "Sum",
+            "diagram_file": (io.BytesIO(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"), 'diagram.png')}
+    client.post(f'/submit/{assignment_id}', data=data, content_type='multipart/form-data', headers=headers)
+    with patch('backend.services.grading.pipeline.parse_image_diagram', return_value="print('x')"), \
+         patch('backend.services.grading.pipeline.grade_with_ai', return_value={"score": 70, "feedback": "ok"}):
+        assert worker.run_once()
+
+    res = client.get('/metrics')
+    assert res.status_code == 200 and res.content_type.startswith('text/plain')
+    body = res.get_data(as_text=True)
+    assert 'grading_stage_duration_seconds_count{stage="parse",status="ok"}' in body
+    assert 'grading_stage_duration_seconds_count{stage="grading",status="ok"}' in body
+    assert 'http_request_duration_seconds_count{endpoint="submit_for_grading",method="POST",status="202"}' in body
+    assert 'db_pool_checkout_seconds_count' in body
+
+def test_bulk_regrade_reuses_generated_code(client, setup_assignment):
+    assignment_id, teacher_headers = setup_assignment
+    client.post('/auth/register', json={"username": "student", "email": "s@s.com", "password": "secret123", "role": "student"})
+    login_res = client.post('/auth/login', json={"identifier": "student", "password": "secret123"})
+    student_headers = {"Authorization": f"Bearer {login_res.json['token']}"}
+    client.post('/seminar/join', json={"invite_code": "CS101"}, headers=student_headers)
+    data = {"submission_mode": "image", "diagram_type": "flowchart", "description": "Sum",
+            "diagram_file": (io.BytesIO(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"), 'diagram.png')}
+    submission_id = client.post(f'/submit/{assignment_id}', data=data, content_type='multipart/form-data', headers=student_headers).json['submission_id']
+    with patch('backend.services.grading.pipeline.parse_image_diagram', return_value="print('x')"), \
+         patch('backend.services.grading.pipeline.grade_with_ai', return_value={"score": 40, "feedback": "old prompt"}):
+        assert worker.run_once()
+
+    assert client.post(f'/assignment/{assignment_id}/regrade', json={}, headers=student_headers).status_code == 403
+    res = client.post(f'/assignment/{assignment_id}/regrade', json={"latest_only": True, "max_score": 50}, headers=teacher_headers)
+    assert res.status_code == 202 and res.json['total'] == 1
+    run_url = res.json['status_url']
+    assert client.get(run_url, headers=teacher_headers).json['status'] == 'running'
+
+    with patch('backend.services.grading.pipeline.parse_image_diagram') as vision, \
+         patch('backend.services.grading.pipeline.grade_with_ai', return_value={"score": 90, "feedback": "new prompt"}) as grader:
+        assert worker.run_once()
+        vision.assert_not_called()
+        assert grader.call_args[0][0] == "print('x')"
+
+    progress = client.get(run_url, headers=teacher_headers).json
+    assert progress['status'] == 'done' and progress['done'] == 1 and progress['failed'] == 0
+    history = client.get(f'/assignment/{assignment_id}/my-submissions', headers=student_headers).json
+    assert [(s['id'], s['grading_result']['score']) for s in history] == [(submission_id, 90)]
+
+def test_grading_events_stream(client, setup_assignment):
+    assignment_id, headers = setup_assignment
+    data = {"submission_mode": "image", "diagram_type": "flowchart", "description": "Sum",
+            "diagram_file": (io.BytesIO(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"), 'diagram.png')}
+    events_url = client.post(f'/submit/{assignment_id}', data=data, content_type='multipart/form-data', headers=headers).json['events_url']
+    with patch('backend.services.grading.pipeline.parse_image_diagram', return_value="print('x')"), \
+         patch('backend.services.grading.pipeline.grade_with_ai', return_value={"score": 70, "feedback": "ok"}):
+        assert worker.run_once()
+
+    body = client.get(events_url, headers=headers, buffered=True).get_data(as_text=True)
+    names = [line[len("event: "):] for line in body.splitlines() if line.startswith("event: ")]
+    assert names[:3] == ["started", "code_generated", "complexity"]
+    assert "grading" in names and names[-1] == "done"
+
+    # Reconnecting after the last event id replays only what came later
+    ids = [int(line[len("id: "):]) for line in body.splitlines() if line.startswith("id: ")]
+    replay = client.get(events_url, headers={**headers, "Last-Event-ID": str(ids[-2])}, buffered=True).get_data(as_text=True)
+    assert [line for line in replay.splitlines() if line.startswith("event: ")] == ["event: done"]
+
+    # With every stream slot taken the client is sent to poll, and closed streams free their slot
+    from backend.services.grading import events
+    held = [events.open_stream(0) for _ in range(events.MAX_STREAMS)]
+    busy = client.get(events_url, headers=headers)
+    assert busy.status_code == 503 and busy.json['status_url'].startswith('/grading-jobs/')
+    for stream in held: stream.close()
+    assert client.get(events_url, headers=headers, buffered=True).status_code == 200
+
+def test_failed_ai_grading_is_retried_not_stored(client, setup_assignment, monkeypatch):
+    from backend.services.grading import jobs
+    monkeypatch.setattr(jobs, "RETRY_DELAY_SECONDS", 0)
+    assignment_id, headers = setup_assignment
+    data = {"submission_mode": "image", "diagram_type": "flowchart", "description": "Sum",
+            "diagram_file": (io.BytesIO(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"), 'diagram.png')}
+    job_id = client.post(f'/submit/{assignment_id}', data=data, content_type='multipart/form-data', headers=headers).json['job_id']
+    # The real grader runs; only its HTTP call fails, as in an API outage
+    outage = requests.exceptions.HTTPError("429 Client Error: quota exceeded")
+    with patch('backend.services.grading.pipeline.parse_image_diagram', return_value="print('x')"), \
+         patch('backend.services.grading.ai_grader.post_with_retries', side_effect=outage):
+        for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+            assert worker.run_once()
+            job = client.get(f'/grading-jobs/{job_id}', headers=headers).json
+            assert job['status'] == ('failed' if attempt == jobs.MAX_ATTEMPTS else 'queued')
+    assert "quota exceeded" in job['error']
+
+    # No zero score was stored for the submission
+    history = client.get(f'/assignment/{assignment_id}/my-submissions', headers=headers).json
+    assert [s['grading_result'] for s in history] == [None]
+
+def test_resubmission_after_ai_outage_is_graded_again(client, setup_assignment, monkeypatch):
+    from backend.services.grading import jobs
+    monkeypatch.setattr(jobs, "RETRY_DELAY_SECONDS", 0)
+    assignment_id, headers = setup_assignment
+    def submit():
+        data = {"submission_mode": "image", "diagram_type": "flowchart", "description": "Sum",
+                "diagram_file": (io.BytesIO(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"), 'diagram.png')}
+        return client.post(f'/submit/{assignment_id}', data=data, content_type='multipart/form-data', headers=headers)
+    def grade(**grader):
+        with patch('backend.services.grading.pipeline.parse_image_diagram', return_value="print('x')"), \
+             patch('backend.services.grading.ai_grader.post_with_retries', **grader):
+            while worker.run_once(): pass
+
+    first = submit()
+    grade(side_effect=requests.exceptions.ConnectionError("outage"))
+    assert client.get(f"/grading-jobs/{first.json['job_id']}", headers=headers).json['status'] == 'failed'
+
+    # Same file once the API is back: graded again, not handed the failure
+    again = submit()
+    assert again.status_code == 202 and again.json['job_id'] != first.json['job_id']
+    reply = MagicMock()
+    reply.json.return_value = {"candidates": [{"content": {"parts": [{"text": json.dumps({"overall_score": 80, "feedback_summary": "fine"})}]}}]}
+    grade(return_value=reply)
+    assert client.get(f"/grading-jobs/{again.json['job_id']}", headers=headers).json['result']['grading_result']['score'] == 80
+
+    # Score-0 failures stored by earlier versions are not reused either
+    conn = get_db_connection(); cur = conn.cursor()
+    cur.execute("""UPDATE grading_jobs SET result = jsonb_set(result, '{grading_result}', '{"score": 0, "feedback": "AI Grading Failed: 503"}')
+                   WHERE id = %s""", (again.json['job_id'],))
+    conn.commit(); cur.close(); release_db_connection(conn)
+    assert submit().status_code == 202
+
+def test_plagiarism_candidates_come_from_lsh_index(client, setup_assignment):
+    assignment_id, teacher_headers = setup_assignment
+    client.put(f'/assignment/{assignment_id}', json={"plagiarism_check_enabled": True}, headers=teacher_headers)
+    client.post('/auth/register', json={"username": "student", "email": "s@s.com", "password": "secret123", "role": "student"})
+    login_res = client.post('/auth/login', json={"identifier": "student", "password": "secret123"})
+    student_headers = {"Authorization": f"Bearer {login_res.json['token']}"}
+    client.post('/seminar/join', json={"invite_code": "CS101"}, headers=student_headers)
+
+    code = "total = 0\nfor i in range(10):\n    total = total + i\nprint(total)"
+    def submit_and_grade(headers, generated, png_suffix):
+        data = {"submission_mode": "image", "diagram_type": "flowchart", "description": "Sum",
+                "diagram_file": (io.BytesIO(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR" + png_suffix), 'diagram.png')}
+        res = client.post(f'/submit/{assignment_id}', data=data, content_type='multipart/form-data', headers=headers)
+        with patch('backend.services.grading.pipeline.parse_image_diagram', return_value=generated), \
+             patch('backend.services.grading.pipeline.grade_with_ai', return_value={"score": 70, "feedback": "ok"}):
+            assert worker.run_once()
+        return client.get(f"/grading-jobs/{res.json['job_id']}", headers=headers).json['result']
+
+    assert submit_and_grade(teacher_headers, code, b"a")['plagiarism_score'] == 0
+    copied = submit_and_grade(student_headers, code, b"b")
+    assert copied['plagiarism_score'] == 100
+    assert copied['plagiarism_matches']['matches'] == [{"lines": [1, 4], "other_lines": [1, 4]}]
+    assert submit_and_grade(student_headers, "name = input()\nwhile name != 'stop':\n    name = input()", b"c")['plagiarism_score'] == 0
+
+    conn = get_db_connection(); cur = conn.cursor()
+    cur.execute("SELECT COUNT(DISTINCT submission_id) FROM plagiarism_lsh_bands WHERE assignment_id = %s", (assignment_id,))
+    assert cur.fetchone()[0] == 3
+    cur.execute("SELECT COUNT(DISTINCT submission_id) FROM plagiarism_fingerprints WHERE assignment_id = %s", (assignment_id,))
+    assert cur.fetchone()[0] == 3
+    # Document frequencies count students by their latest submission, kept up to date as submissions are graded
+    cur.execute("SELECT token, df FROM plagiarism_token_df WHERE assignment_id = %s AND token IN ('total', 'name')", (assignment_id,))
+    assert dict(cur.fetchall()) == {"total": 1, "name": 1}
+    cur.close(); release_db_connection(conn)
+
+def test_resubmissions_do_not_make_copied_fingerprints_common(client, setup_assignment):
+    from psycopg2.extras import RealDictCursor
+    from backend.services.analysis import winnowing
+    from backend.services.grading import plagiarism_index
+    assignment_id, _ = setup_assignment
+    code = "total = 0\nfor i in range(10):\n    total = total + i\nprint(total)"
+    conn = get_db_connection(); cur = conn.cursor(cursor_factory=RealDictCursor)
+    users = {}
+    for username in ("ann", "bob"):
+        client.post('/auth/register', json={"username": username, "email": f"{username}@s.com", "password": "secret123", "role": "student"})
+        cur.execute("SELECT id FROM users WHERE username = %s", (username,))
+        users[username] = cur.fetchone()['id']
+    # One student uploading the same program many times is still one student sharing its fingerprints
+    for _ in range(plagiarism_index.COMMON_MIN + 2):
+        cur.execute("""INSERT INTO submissions (assignment_id, student_id, file_path, original_filename, generated_code)
+                       VALUES (%s, %s, 'diagram.png', 'diagram.png', %s) RETURNING id""", (assignment_id, users["ann"], code))
+        plagiarism_index.index_fingerprints(cur, cur.fetchone()['id'], assignment_id, winnowing.fingerprints(code))
+    candidates = plagiarism_index.fingerprint_candidates(cur, assignment_id, users["bob"], winnowing.fingerprints(code))
+    assert len(candidates) == plagiarism_index.COMMON_MIN + 2 and all(c['text_score'] == 100 for c in candidates)
+    conn.rollback(); cur.close(); release_db_connection(conn)
+
+def test_structural_rows_ignore_shared_boilerplate(client, setup_assignment):
+    from psycopg2.extras import RealDictCursor
+    from backend.services.analysis import minhash
+    from backend.services.analysis.plagiarism import WL_BINS, normalize_code
+    from backend.services.grading import plagiarism_index
+    assignment_id, _ = setup_assignment
+    template = "#include <iostream>\nusing namespace std;\n\nint main() {\n    cout << 0 << endl;\n    return 0;\n}"
+    square = "#include <iostream>\nusing namespace std;\n\nint main() {\n    int n;\n    cin >> n;\n    cout << n * n << endl;\n    return 0;\n}"
+    total = "#include <iostream>\nusing namespace std;\n\nint main() {\n    int total = 0;\n    for (int i = 0; i < 10; i++) total += i;\n    cout << total << endl;\n    return 0;\n}"
+    conn = get_db_connection(); cur = conn.cursor(cursor_factory=RealDictCursor)
+    client.post('/auth/register', json={"username": "ann", "email": "ann@s.com", "password": "secret123", "role": "student"})
+    cur.execute("""INSERT INTO submissions (assignment_id, student_id, file_path, original_filename, generated_code, graph_signature, graph_size)
+                   SELECT %s, id, 'diagram.drawio', 'diagram.drawio', %s, %s, %s FROM users WHERE username = 'ann' RETURNING id, student_id""",
+                (assignment_id, square, [1] * WL_BINS, WL_BINS))
+    row = cur.fetchone()
+    plagiarism_index.index_tokens(cur, row['id'], assignment_id, normalize_code(square))
+    # The generated boilerplate alone makes the two programs look alike to MinHash
+    assert minhash.estimate_similarity_batch(minhash.signature(total), [minhash.signature(square)])[0] > 0.4
+
+    rows = plagiarism_index.structural_rows(cur, assignment_id, row['student_id'] + 1000, [1] * WL_BINS, normalize_code(total), exclude=frozenset(normalize_code(template)))
+    assert rows['ids'].tolist() == [row['id']] and rows['text_scores'].tolist() == [0]
+    copied = plagiarism_index.structural_rows(cur, assignment_id, row['student_id'] + 1000, [1] * WL_BINS, normalize_code(square), exclude=frozenset(normalize_code(template)))
+    assert copied['text_scores'].tolist() == [100]
+    conn.rollback(); cur.close(); release_db_connection(conn)
+
+def test_structural_rows_load_only_close_sizes(client, setup_assignment, monkeypatch):
+    from psycopg2.extras import RealDictCursor
+    from backend.services.analysis.plagiarism import WL_BINS
+    from backend.services.grading import plagiarism_index
+    monkeypatch.setattr(plagiarism_index, "STRUCTURAL_LIMIT", 10)
+    assignment_id, _ = setup_assignment
+    conn = get_db_connection(); cur = conn.cursor(cursor_factory=RealDictCursor)
+    client.post('/auth/register', json={"username": "ann", "email": "ann@s.com", "password": "secret123", "role": "student"})
+    # 200 flowcharts whose histograms hold k labels per bin
+    cur.execute("""INSERT INTO submissions (assignment_id, student_id, file_path, original_filename, graph_signature, graph_size)
+                   SELECT %s, u.id, 'diagram.drawio', 'diagram.drawio', array_fill(k, ARRAY[%s]), k * %s
+                   FROM users u, generate_series(1, 200) AS k WHERE u.username = 'ann' RETURNING id""", (assignment_id, WL_BINS, WL_BINS))
+    by_k = {k: r['id'] for k, r in enumerate(cur.fetchall(), start=1)}
+
+    rows = plagiarism_index.structural_rows(cur, assignment_id, -1, [10] * WL_BINS, [])
+    assert len(rows['ids']) == 10
+    # The closest sizes come first; histograms more than twice as large or half as small are never loaded
+    assert {by_k[k] for k in range(6, 15)} <= set(rows['ids'].tolist())
+    assert all(5 <= row[0] <= 20 for row in rows['graph_signatures'])
+    conn.rollback(); cur.close(); release_db_connection(conn)
+
+def test_plagiarism_report_clusters_copied_submissions(client, setup_assignment):
+    assignment_id, teacher_headers = setup_assignment
+    shared = "total = 0\nfor i in range(10):\n    total = total + i\nprint(total)"
+    codes = {"ann": shared, "bob": shared + "\nprint('done')", "cid": shared + "\ntotal = total * 2",
+             "dan": "name = input()\nwhile name != 'stop':\n    name = input()"}
+    # Only the latest submission of each student counts
+    rows = [*codes.items(), ("dan", "x = 1")]
+    conn = get_db_connection(); cur = conn.cursor()
+    for username, code in rows:
+        client.post('/auth/register', json={"username": username, "email": f"{username}@s.com", "password": "secret123", "role": "student"})
+        cur.execute("""INSERT INTO submissions (assignment_id, student_id, file_path, original_filename, generated_code)
+                       SELECT %s, id, 'diagram.png', 'diagram.png', %s FROM users WHERE username = %s""", (assignment_id, code, username))
+    conn.commit(); cur.close(); release_db_connection(conn)
+
+    res = client.post(f'/assignment/{assignment_id}/plagiarism-report', json={"threshold": 70}, headers=teacher_headers)
+    assert res.status_code == 202
+    assert worker.run_report_once() and not worker.run_report_once()
+
+    report = client.get(res.json['status_url'], headers=teacher_headers).json
+    assert report['status'] == 'done' and report['submission_count'] == 4
+    assert len(report['clusters']) == 1
+    cluster = report['clusters'][0]
+    assert sorted(cluster['usernames']) == ["ann", "bob", "cid"]
+    # Frequencies count the four students once each, so the program three of them share weighs less
+    # and bob and cid, who changed it differently, are linked only through ann
+    assert cluster['max_similarity'] == max(p[2] for p in cluster['pairs']) and len(cluster['pairs']) == report['pair_count'] == 2